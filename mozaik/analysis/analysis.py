@@ -20,7 +20,7 @@ from mozaik.analysis.data_structures import PerNeuronValue
 from mozaik.analysis.data_structures import PerNeuronPairValue
 from mozaik.analysis.data_structures import PerNeuronPairAnalogSignalList
                                         
-from mozaik.analysis.helper_functions import psth
+from mozaik.analysis.helper_functions import psth, psth_from_spike_counts
 from mozaik.core import ParametrizedObject
 from parameters import ParameterSet
 from mozaik.storage import queries
@@ -799,7 +799,10 @@ class PSTH(Analysis):
             for sheet in self.datastore.sheets():
                 dsv = queries.param_filter_query(self.datastore,sheet_name=sheet)
                 for st,seg in zip([MozaikParametrized.idd(s) for s in dsv.get_stimuli()],dsv.get_segments()):
-                    psths = psth(seg.get_spiketrain(seg.get_stored_spike_train_ids()), self.parameters.bin_length)
+                    if seg.stores_only_spike_counts():
+                        psths = psth_from_spike_counts(seg.get_spike_counts(seg.get_stored_spike_count_ids()), self.parameters.bin_length)
+                    else:
+                        psths = psth(seg.get_spiketrain(seg.get_stored_spike_train_ids()), self.parameters.bin_length)
                     self.datastore.full_datastore.add_analysis_result(
                         AnalogSignalList(psths,
                                          seg.get_stored_spike_train_ids(),
@@ -831,7 +834,10 @@ class SpikeCount(Analysis):
             for sheet in self.datastore.sheets():
                 dsv = queries.param_filter_query(self.datastore,sheet_name=sheet)
                 for st,seg in zip([MozaikParametrized.idd(s) for s in dsv.get_stimuli()],dsv.get_segments()):
-                    psths = psth(seg.get_spiketrain(seg.get_stored_spike_train_ids()), self.parameters.bin_length,normalize=False)
+                    if seg.stores_only_spike_counts():
+                        psths = psth_from_spike_counts(seg.get_spike_counts(seg.get_stored_spike_count_ids()), self.parameters.bin_length,normalize=False)
+                    else:
+                        psths = psth(seg.get_spiketrain(seg.get_stored_spike_train_ids()), self.parameters.bin_length,normalize=False)
                     self.datastore.full_datastore.add_analysis_result(
                         AnalogSignalList(psths,
                                          seg.get_stored_spike_train_ids(),
@@ -51,6 +51,43 @@ def psth(spike_list, bin_length,normalize=True):
     return  h
 
 
+def psth_from_spike_counts(counts, bin_length,normalize=True):
+    """
+    The function returns the psth with bin length bin_length computed from binned spike counts 
+    (as stored by recording configurations with the *spike_counts* reduction, see :class:`mozaik.sheets.Sheet`).
+    
+    Parameters
+    ----------
+    counts : list(AnalogSignal)
+               The list of binned spike counts. 
+
+    bin_length : float (ms) 
+               Bin length. It has to be a multiple of the bin length of the spike counts.
+               
+    normalized : bool
+               If true the psth will return the instantenous firing rate, if False it will return spike count per bin. 
+
+    Returns
+    -------
+    psth : list(AnalogSignal)
+           The PSTH of each of the spike counts. 
+    """
+    if len(counts) == 0:
+        return []
+    factor = int(round(bin_length / counts[0].sampling_period.rescale(qt.ms).magnitude))
+    assert abs(factor * counts[0].sampling_period.rescale(qt.ms).magnitude - bin_length) < 1e-6, "The bin length of the psth (%g) has to be a multiple of the bin length of the spike counts" % bin_length
+    
+    normalizer = 1.0
+    if normalize:
+       normalizer = (bin_length/1000)
+    
+    h = []
+    for c in counts:
+        n = len(c) // factor
+        h.append(AnalogSignal(numpy.sum(c.magnitude[:n*factor].reshape(n,factor),axis=1) / normalizer,t_start=c.t_start.rescale(qt.ms),sampling_period=bin_length*qt.ms,units=munits.spike_per_sec))
+    return h
+
+
 def psth_across_trials(spike_trials, bin_length):
     """
     It returns PSTH averaged across the spiketrains
@@ -9,12 +9,71 @@ import time
 from mozaik.core import BaseComponent
 from mozaik.sheets.vision import SheetWithMagnificationFactor
 from parameters import ParameterSet, ParameterDist
-from mozaik.tools.misc import sample_from_bin_distribution, normal_function
-from collections import Counter
+from mozaik.tools.misc import sample_from_bin_distributions, normal_function
 from pyNN import random, space
 
 logger = mozaik.getMozaikLogger()
 
+
+class ConnectionList(object):
+    """
+    Accumulates the connections generated by a connector chunk by chunk, each chunk stored as contiguous typed
+    columns (int32 indexes and float32 weights and delays) rather than as a list of python tuples.
+    
+    Use :func:`.array` to obtain the (connection, 4) array with the (source index, target index, weight, delay) 
+    columns that is accepted by the pyNN FromListConnector.
+    """
+    
+    index_dtype = numpy.int32
+    value_dtype = numpy.float32
+    
+    def __init__(self):
+        self._chunks = []
+        self._length = 0
+        self._max_index = 0
+        
+    def append(self, sources, targets, weights, delays):
+        """
+        Adds a chunk of connections. The arguments are broadcast against each other, so for example a single target index 
+        can be given for a chunk of connections converging on one neuron.
+        """
+        sources, targets, weights, delays = numpy.broadcast_arrays(sources, targets, weights, delays)
+        if sources.size == 0:
+            return
+        self._chunks.append((numpy.ravel(sources).astype(self.index_dtype),
+                             numpy.ravel(targets).astype(self.index_dtype),
+                             numpy.ravel(weights).astype(self.value_dtype),
+                             numpy.ravel(delays).astype(self.value_dtype)))
+        self._max_index = max(self._max_index, numpy.max(sources), numpy.max(targets))
+        self._length += sources.size
+        
+    def __len__(self):
+        return self._length
+    
+    def array(self):
+        """
+        Returns the (connection, 4) array of all the connections, releasing the chunks.
+        
+        The array is allocated once, with the float32 value_dtype as long as it represents all the neuron indexes exactly 
+        (below 2**24), and float64 otherwise. The chunks are released as they are copied into it, so the peak memory is 
+        about twice the 16 bytes per connection of the chunks. Note that the pyNN FromListConnector then makes its own 
+        copy of the array, of the same dtype.
+        """
+        dtype = self.value_dtype if self._max_index < 2**(numpy.finfo(self.value_dtype).nmant+1) else numpy.float64
+        a = numpy.empty((self._length, 4), dtype=dtype)
+        i = 0
+        self._chunks.reverse()
+        while self._chunks:
+            chunk = self._chunks.pop()
+            n = len(chunk[0])
+            for c in xrange(4):
+                a[i:i+n, c] = chunk[c]
+            i += n
+        self._length = 0
+        self._max_index = 0
+        return a
+
+
 class Connector(BaseComponent):
     """
     An abstract interface class for Connectors in mozaik. Each mozaik connector should derive from this class and implement 
@@ -135,25 +194,18 @@ class SpecificArborization(Connector):
         self.delay_matrix = delay_matrix
 
     def _connect(self):
-        X = numpy.zeros(self.connection_matrix.shape)
-        Y = numpy.zeros(self.connection_matrix.shape)
-        
-        for x in xrange(0,X.shape[0]):
-            for y in xrange(0,X.shape[1]):
-                X[x][y] = x
-                Y[x][y] = y
-        
-        for i in xrange(0,self.target.pop.size):
-            self.connection_matrix[:,i] = self.connection_matrix[:,i] / numpy.sum(self.connection_matrix[:,i])*self.parameters.weight_factor
+        n = self.target.pop.size
+        self.connection_matrix[:,:n] = self.connection_matrix[:,:n] / numpy.sum(self.connection_matrix[:,:n],axis=0)*self.parameters.weight_factor
 
         # This is due to native synapses models (which we currently use as the short term synaptic plasticity model) 
         # do not apply the 1000 factor scaler as the pyNN synaptic models
         self.connection_matrix = self.connection_matrix * self.weight_scaler
-        self.connection_list = zip(numpy.array(X).flatten(),numpy.array(Y).flatten(),self.connection_matrix.flatten(),self.delay_matrix.flatten())
         # get rid of very weak synapses
         z = numpy.max(self.connection_matrix.flatten())
-        self.connection_list = [(int(a),int(b),c,d) for (a,b,c,d) in self.connection_list if c>(z/100.0)]
-        method = self.sim.FromListConnector(self.connection_list)
+        X,Y = numpy.nonzero(self.connection_matrix > (z/100.0))
+        self.connection_list = ConnectionList()
+        self.connection_list.append(X,Y,self.connection_matrix[X,Y],self.delay_matrix[X,Y])
+        method = self.sim.FromListConnector(self.connection_list.array())
         self.proj = self.sim.Projection(
                                 self.source.pop,
                                 self.target.pop,
@@ -198,12 +250,15 @@ class SpecificProbabilisticArborization(Connector):
         wf = self.parameters.weight_factor * self.weight_scaler
         weights = self.connection_matrix
         delays = self.delay_matrix
-        cl = []
-        for i in xrange(0,self.target.pop.size):
-            co = Counter(sample_from_bin_distribution(weights[:,i].flatten(), int(self.parameters.num_samples)))
-            cl.extend([(int(k),int(i),wf*co[k]/self.parameters.num_samples,delays[k][i]) for k in co.keys()])
+        cl = ConnectionList()
+        n = self.target.pop.size
+        samples = sample_from_bin_distributions(numpy.transpose(weights[:,:n]), int(self.parameters.num_samples))
+        # the number of times each source (column) was sampled for each target (row)
+        co = numpy.bincount((samples + numpy.arange(n)[:,numpy.newaxis]*weights.shape[0]).ravel(), minlength=n*weights.shape[0]).reshape(n,weights.shape[0])
+        targets,sources = numpy.nonzero(co)
+        cl.append(sources,targets,wf*co[targets,sources]/self.parameters.num_samples,numpy.asarray(delays)[sources,targets])
             
-        method = self.sim.FromListConnector(cl)
+        method = self.sim.FromListConnector(cl.array())
         
         self.proj = self.sim.Projection(
                                 self.source.pop,
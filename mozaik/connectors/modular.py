@@ -1,31 +1,17 @@
 # encoding: utf-8
 import mozaik
 import numpy
-import ast
-from mozaik.connectors import Connector
+import scipy.sparse
+from mozaik.connectors import Connector, ConnectionList
 from mozaik.connectors.modular_connector_functions import ModularConnectorFunction
-from collections import Counter
 from parameters import ParameterSet, ParameterDist
-from mozaik.tools.misc import sample_from_bin_distribution, normal_function
+from mozaik.tools.misc import sample_from_bin_distributions, normal_function
+from mozaik.tools.expressions import Expression
 from mozaik import load_component
 
 
 logger = mozaik.getMozaikLogger()
 
-class ExpVisitor(ast.NodeVisitor):
-    """
-    AST tree visitor used for determining list of variables in the delay or weight expresions
-    """
-    
-    def __init__(self,**params):
-        ast.NodeVisitor.__init__(self,**params)
-        self.names = []
-    
-    def visit_Name(self, node):
-        node.id
-        if not (node.id in self.names):
-           self.names.append(node.id) 
-
 class ModularConnector(Connector):
     """
     An abstract connector than allows for mixing of various factors that can affect the connectivity.
@@ -40,7 +26,18 @@ class ModularConnector(Connector):
     
     The ModularConnector then sets such computed values of weights and delays directly in the connections.
     
+    The weight and delay expressions are parsed once, when the connector is created, into an :class:`mozaik.tools.expressions.Expression`, 
+    so they can only contain arithmetic operations, comparisons and calls of a set of numpy functions (e.g. 'f1*exp(-f2)').
     
+    The connections are evaluated in blocks of target neurons (see :func:`.ModularConnectorFunction.evaluate_block`), 
+    each holding at most `block_size` connections. The weight and delay expressions are therefore evaluated over (target, source) matrices,
+    and so they should be composed of element-wise operations. The functions that do not implement evaluate_block are still evaluated 
+    one target neuron at a time, the weight functions followed by the delay functions of each target neuron, so that random functions 
+    (e.g. PyNNDistributionConnectorFunction) draw their random numbers in the same order as without the blocks.
+    
+    If some of the weight functions are sparse (see :func:`.ModularConnectorFunction.evaluate_sparse_block`, e.g. distance dependent 
+    functions with a `cutoff_distance`), only the pairs of neurons stored in all of them are connected, and the functions and expressions 
+    are evaluated only for these pairs.
     """
 
     required_parameters = ParameterSet({
@@ -57,6 +54,9 @@ class ModularConnector(Connector):
         'delay_expression' : str, # a python expression that can use variables f1..fn where n is the number of functions in delays_functions, and fi corresponds to the name given to a ModularConnectorFunction in delays_function ParameterSet. It determines how are the delays functions combined to obtain the delays
     })
     
+    # the maximum number of connections evaluated at once
+    block_size = 2**20
+    
     def __init__(self, network, name,source, target, parameters):
       Connector.__init__(self, network, name, source,target,parameters)
       
@@ -64,14 +64,11 @@ class ModularConnector(Connector):
       self.weight_functions = {}
       self.delay_functions = {}
       self.simulator_time_step = self.sim.get_time_step()
-      # lets determine the list of variables in weight expressions
-      v = ExpVisitor()
-      v.visit(ast.parse(self.parameters.weight_expression))
-      self.weight_function_names = v.names
-      # lets determine the list of variables in delay expressions
-      v = ExpVisitor()
-      v.visit(ast.parse(self.parameters.delay_expression))
-      self.delay_function_names = v.names
+      # lets compile the expressions and determine the list of variables in them
+      self.weight_expression = Expression(self.parameters.weight_expression)
+      self.weight_function_names = self.weight_expression.names
+      self.delay_expression = Expression(self.parameters.delay_expression)
+      self.delay_function_names = self.delay_expression.names
       
       for k in self.weight_function_names:
           self.weight_functions[k] = load_component(self.parameters.weight_functions[k].component)(self.source,self.target,self.parameters.weight_functions[k].params)
@@ -88,7 +85,7 @@ class ModularConnector(Connector):
        
         for k in self.weight_function_names:
             evaled[k] = self.weight_functions[k].evaluate(i)
-        return numpy.zeros((self.source.pop.size,)) + eval(self.parameters.weight_expression,globals(),evaled)
+        return numpy.zeros((self.source.pop.size,)) + self.weight_expression(**evaled)
         
     def _obtain_delays(self,i):
         """
@@ -98,18 +95,119 @@ class ModularConnector(Connector):
         for k in self.delay_function_names:
             evaled[k] = self.delay_functions[k].evaluate(i)
         
-        delays = numpy.zeros((self.source.pop.size,)) + eval(self.parameters.delay_expression,globals(),evaled)
+        delays = numpy.zeros((self.source.pop.size,)) + self.delay_expression(**evaled)
         #round to simulation step            
         delays = numpy.rint(delays / self.simulator_time_step) * self.simulator_time_step
         return delays
+
+    def _evaluate_interleaved(self,indices):
+        """
+        Evaluates the weight and delay functions that do not implement their own evaluate_block (e.g. PyNNDistributionConnectorFunction) 
+        over the target neurons `indices`. They are evaluated target neuron by target neuron, for each target neuron the weight functions 
+        followed by the delay functions as in :func:`._obtain_weights` and :func:`._obtain_delays`, so that random functions 
+        draw the same random numbers for the weights and for the delays as when the connections are evaluated one target neuron at a time. 
+        Returns the dictionaries of the (len(indices), source size) matrices of these weight and delay functions.
+        """
+        def interleaved(function):
+            return type(function).evaluate_block.im_func is ModularConnectorFunction.evaluate_block.im_func
+        weight_names = [k for k in self.weight_function_names if interleaved(self.weight_functions[k])]
+        delay_names = [k for k in self.delay_function_names if interleaved(self.delay_functions[k])]
+        weights = dict((k,[]) for k in weight_names)
+        delays = dict((k,[]) for k in delay_names)
+        if weight_names or delay_names:
+            for i in indices:
+                for k in weight_names:
+                    weights[k].append(self.weight_functions[k].evaluate(i))
+                for k in delay_names:
+                    delays[k].append(self.delay_functions[k].evaluate(i))
+        shape = (len(indices),self.source.pop.size)
+        return (dict((k,numpy.array(v).reshape(shape)) for k,v in weights.items()),
+                dict((k,numpy.array(v).reshape(shape)) for k,v in delays.items()))
+
+    def _obtain_block(self,indices):
+        """
+        The block version of :func:`._obtain_weights` and :func:`._obtain_delays`, returning the (len(indices), source size) matrices 
+        of the weights and of the delays of the target neurons `indices`.
+        """
+        weights_evaled, delays_evaled = self._evaluate_interleaved(indices)
+        for k in self.weight_function_names:
+            if k not in weights_evaled:
+                weights_evaled[k] = self.weight_functions[k].evaluate_block(indices)
+        weights = numpy.zeros((len(indices),self.source.pop.size)) + self.weight_expression(**weights_evaled)
+
+        for k in self.delay_function_names:
+            if k not in delays_evaled:
+                delays_evaled[k] = self.delay_functions[k].evaluate_block(indices)
+        delays = numpy.zeros((len(indices),self.source.pop.size)) + self.delay_expression(**delays_evaled)
+        #round to simulation step            
+        delays = numpy.rint(delays / self.simulator_time_step) * self.simulator_time_step
+        return weights, delays
+
+    def _obtain_sparse_block(self,indices):
+        """
+        The sparse version of :func:`._obtain_block`. If some of the weight functions are sparse,
+        returns the (rows, sources, weights, delays) arrays of the connections from the source neurons `sources` to the target neurons 
+        `indices[rows]`, for the pairs of neurons stored in all the sparse weight functions. Returns None if none of the weight functions is sparse.
+        """
+        sparse = {}
+        for k in self.weight_function_names:
+            m = self.weight_functions[k].evaluate_sparse_block(indices)
+            if m is not None:
+                sparse[k] = scipy.sparse.csr_matrix(m)
+        if not sparse:
+            return None
+
+        support = None
+        for m in sparse.values():
+            # the explicitly stored zeros belong to the support as well
+            pattern = scipy.sparse.csr_matrix((numpy.ones(m.nnz), m.indices, m.indptr), shape=m.shape)
+            support = pattern if support is None else support.multiply(pattern).tocsr()
+        support = support.tocoo()
+        rows, sources = support.row, support.col
+
+        weights_evaled, delays_evaled = self._evaluate_interleaved(indices)
+        evaled = {}
+        for k in self.weight_function_names:
+            if k in sparse:
+                evaled[k] = numpy.asarray(sparse[k][rows,sources]).ravel() if len(rows) else numpy.zeros(0)
+            elif k in weights_evaled:
+                evaled[k] = weights_evaled[k][rows,sources]
+            else:
+                evaled[k] = self.weight_functions[k].evaluate_pairs(indices,rows,sources)
+        weights = numpy.zeros(len(rows)) + self.weight_expression(**evaled)
+
+        evaled = {}
+        for k in self.delay_function_names:
+            if k in delays_evaled:
+                evaled[k] = delays_evaled[k][rows,sources]
+            else:
+                evaled[k] = self.delay_functions[k].evaluate_pairs(indices,rows,sources)
+        delays = numpy.zeros(len(rows)) + self.delay_expression(**evaled)
+        #round to simulation step
+        delays = numpy.rint(delays / self.simulator_time_step) * self.simulator_time_step
+        return rows, sources, weights, delays
+
+    def _target_blocks(self):
+        """
+        Splits the local target neurons into blocks, each with at most `block_size` connections.
+        """
+        local = numpy.nonzero(self.target.pop._mask_local)[0]
+        n = max(1, self.block_size // max(1, self.source.pop.size))
+        return [local[i:i+n] for i in xrange(0, len(local), n)]
         
     def _connect(self):
-        connection_list = []
-        z = numpy.zeros((self.target.pop.size,))
-        for i in numpy.nonzero(self.target.pop._mask_local)[0]: 
-            connection_list.extend(zip(numpy.arange(0,self.source.pop.size,1),z+i,self.weight_scaler*self._obtain_weights(i).flatten(),self._obtain_delays(i).flatten()))
+        connection_list = ConnectionList()
+        for indices in self._target_blocks():
+            sparse = self._obtain_sparse_block(indices)
+            if sparse is not None:
+                rows, sources, weights, delays = sparse
+                connection_list.append(sources,indices[rows],self.weight_scaler*weights,delays)
+                continue
+            weights, delays = self._obtain_block(indices)
+            weights = self.weight_scaler*weights
+            connection_list.append(numpy.arange(0,self.source.pop.size,1)[numpy.newaxis,:],indices[:,numpy.newaxis],weights,delays)
         
-        self.method = self.sim.FromListConnector(connection_list)
+        self.method = self.sim.FromListConnector(connection_list.array())
         self.proj = self.sim.Projection(
                                 self.source.pop,
                                 self.target.pop,
@@ -136,14 +234,36 @@ class ModularSamplingProbabilisticConnector(ModularConnector):
     })
 
     def _connect(self):
-        cl = []
-        for i in numpy.nonzero(self.target.pop._mask_local)[0]:
-            weights = self._obtain_weights(i)
-            delays = self._obtain_delays(i)
-            co = Counter(sample_from_bin_distribution(weights, self.parameters.num_samples))
-            cl.extend([(k,i,self.weight_scaler*self.parameters.base_weight*co[k],delays[k]) for k in co.keys()])
-        method = self.sim.FromListConnector(cl)
+        cl = ConnectionList()
+        n = self.source.pop.size
+        for indices in self._target_blocks():
+            sparse = self._obtain_sparse_block(indices)
+            if sparse is not None:
+                rows, sources, weights, delays = sparse
+                # the samples of each target neuron are drawn only from the bins of its pairs, which are padded with empty bins 
+                # to the largest number of pairs of a target neuron (the rows are sorted)
+                counts = numpy.bincount(rows, minlength=len(indices))
+                columns = numpy.arange(len(rows)) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+                bins = numpy.zeros((len(indices), counts.max()))
+                bins[rows,columns] = weights
+                pairs = numpy.zeros((len(indices), counts.max()), dtype=int)
+                pairs[rows,columns] = numpy.arange(len(rows))
+                # target neurons without any pairs of non-zero weight receive no connections
+                nonempty = numpy.nonzero(numpy.bincount(rows, weights, minlength=len(indices)) > 0)[0]
+                samples_block = sample_from_bin_distributions(bins[nonempty], self.parameters.num_samples)
+                # the number of times each pair was sampled
+                co = numpy.bincount(pairs[nonempty[:,numpy.newaxis],samples_block].ravel(), minlength=len(rows))
+                p = numpy.nonzero(co)[0]
+                cl.append(sources[p],indices[rows[p]],self.weight_scaler*self.parameters.base_weight*co[p],delays[p])
+                continue
+            weights_block, delays_block = self._obtain_block(indices)
+            samples_block = sample_from_bin_distributions(weights_block, self.parameters.num_samples)
+            # the number of times each source (column) was sampled for each target (row) of the block
+            co = numpy.bincount((samples_block + numpy.arange(len(indices))[:,numpy.newaxis]*n).ravel(), minlength=len(indices)*n).reshape(len(indices),n)
+            rows,sources = numpy.nonzero(co)
+            cl.append(sources,indices[rows],self.weight_scaler*self.parameters.base_weight*co[rows,sources],delays_block[rows,sources])
         if len(cl) > 0:
+            method = self.sim.FromListConnector(cl.array())
             self.proj = self.sim.Projection(
                                 self.source.pop,
                                 self.target.pop,
@@ -170,17 +290,26 @@ class ModularSingleWeightProbabilisticConnector(ModularConnector):
     })
 
     def _connect(self):
-        cl = []
+        cl = ConnectionList()
         print "DSADAS"
-        for i in numpy.nonzero(self.target.pop._mask_local)[0]:
-            weights = self._obtain_weights(i)
-            delays = self._obtain_delays(i)
-            conections_probabilities = weights/numpy.sum(weights)*self.parameters.connection_probability*len(weights)
-            connection_indices = numpy.flatnonzero(conections_probabilities > numpy.random.rand(len(conections_probabilities)))
-            cl.extend([(k,i,self.weight_scaler*self.parameters.base_weight,delays[k]) for k in connection_indices])
-
-        method = self.sim.FromListConnector(cl)
+        for indices in self._target_blocks():
+            sparse = self._obtain_sparse_block(indices)
+            if sparse is not None:
+                rows, sources, weights, delays = sparse
+                n = self.source.pop.size
+                conections_probabilities = weights/numpy.bincount(rows, weights, minlength=len(indices))[rows]*self.parameters.connection_probability*n
+                p = numpy.nonzero(conections_probabilities > numpy.random.rand(len(rows)))[0]
+                cl.append(sources[p],indices[rows[p]],self.weight_scaler*self.parameters.base_weight,delays[p])
+                continue
+            weights_block, delays_block = self._obtain_block(indices)
+            n = weights_block.shape[1]
+            conections_probabilities = weights_block/numpy.sum(weights_block,axis=1)[:,numpy.newaxis]*self.parameters.connection_probability*n
+            # drawn in one call, this is the same random stream as drawing the random numbers target by target
+            rows,sources = numpy.nonzero(conections_probabilities > numpy.random.rand(len(indices),n))
+            cl.append(sources,indices[rows],self.weight_scaler*self.parameters.base_weight,delays_block[rows,sources])
+
         if len(cl) > 0:
+            method = self.sim.FromListConnector(cl.array())
             self.proj = self.sim.Projection(
                                     self.source.pop,
                                     self.target.pop,
@@ -4,6 +4,8 @@ from mozaik.core import ParametrizedObject
 from parameters import ParameterSet
 from mozaik.tools.distribution_parametrization import PyNNDistribution
 from mozaik.tools.misc import *
+from scipy.spatial import cKDTree
+import scipy.sparse
 
 class ModularConnectorFunction(ParametrizedObject):
     """
@@ -11,6 +13,13 @@ class ModularConnectorFunction(ParametrizedObject):
     
     Each instance has to implement the evaluate(u) function that returns the pre-synaptic weights
     of neuron i.
+    
+    Instances can also implement the evaluate_block(indices) function that returns the pre-synaptic weights
+    of a number of neurons at once, which is used by :class:`.ModularConnector` to evaluate the connections 
+    in blocks of target neurons. By default it evaluates the neurons one by one with evaluate.
+    
+    Functions that are zero for all but a few pairs of neurons can in addition implement evaluate_sparse_block(indices),
+    and :class:`.ModularConnector` then evaluates the other functions only for the non-zero pairs with evaluate_pairs.
     """
     
     def __init__(self, source,target, parameters):
@@ -21,6 +30,26 @@ class ModularConnectorFunction(ParametrizedObject):
     def evaluate(self,index):
         raise NotImplemented
 
+    def evaluate_block(self,indices):
+        """
+        Returns the pre-synaptic weights of the neurons `indices` as a (len(indices), number of source neurons) matrix.
+        """
+        return numpy.array([self.evaluate(i) for i in indices]).reshape(len(indices),len(self.source.pop))
+
+    def evaluate_sparse_block(self,indices):
+        """
+        Returns the pre-synaptic weights of the neurons `indices` as a (len(indices), number of source neurons) scipy.sparse matrix 
+        if the function is zero outside of its stored entries, or None (the default) if the function has no such sparse structure.
+        """
+        return None
+
+    def evaluate_pairs(self,indices,rows,sources):
+        """
+        Returns the weights of the connections from the source neurons `sources` to the target neurons `indices[rows]`. 
+        By default they are taken from :func:`.evaluate_block`.
+        """
+        return self.evaluate_block(indices)[rows,sources]
+
 class ConstantModularConnectorFunction(ModularConnectorFunction):
       """
       Triavial modular connection function assigning each connections the same weight
@@ -28,6 +57,12 @@ class ConstantModularConnectorFunction(ModularConnectorFunction):
       def evaluate(self,index):
           return numpy.zeros(len(self.source.pop)) + 1
 
+      def evaluate_block(self,indices):
+          return numpy.ones((len(indices),len(self.source.pop)))
+
+      def evaluate_pairs(self,indices,rows,sources):
+          return numpy.ones(len(rows))
+
 class PyNNDistributionConnectorFunction(ModularConnectorFunction):
       """
       ConnectorFunction which draws the values from the PyNNDistribution
@@ -49,7 +84,28 @@ class DistanceDependentModularConnectorFunction(ModularConnectorFunction):
     The distane is translated into the native coordinates of the target sheet (e.g. micrometers for CorticlaSheet)!
     
     For the special case where source = target, this coresponds to the intuitive lateral distance of the neurons.
+    
+    If `cutoff_distance` is positive, the function is evaluated only for the pairs of neurons within `cutoff_distance`, 
+    and is zero for all the other pairs. The neighbours of the target neurons are found with a KD-tree built once over 
+    the positions of the source neurons, so that the cost of the evaluation is proportional to the number of neighbours 
+    rather than to the size of the source population. The function is then sparse (see :func:`.evaluate_sparse_block`), 
+    and :class:`.ModularConnector` creates only the connections between the neurons within `cutoff_distance`. 
+    The neighbours are searched within `cutoff_distance` converted to the visual field coordinates as `cutoff_distance / dvf_2_dcs(1.0)`, 
+    which assumes that dvf_2_dcs of the target sheet is linear (as is the magnification factor of the visual sheets).
+    
+    Other parameters
+    ----------------
+    cutoff_distance : float, optional
+                    The distance (in the native coordinates of the target sheet) beyond which the function is zero. 0 (the default) for no cutoff.
     """
+    optional_parameters = ParameterSet({
+        'cutoff_distance': float,  # the distance (in the native coordinates of the target sheet) beyond which the function is zero, 0 (default) for no cutoff
+    })
+    
+    def __init__(self, source,target, parameters):
+        ModularConnectorFunction.__init__(self, source,target, parameters)
+        self._tree = None
+    
     def distance_dependent_function(self,distance):
         """
         The is the function, dependent only on distance that each DistanceDependentModularConnectorFunction has to implement.
@@ -58,10 +114,54 @@ class DistanceDependentModularConnectorFunction(ModularConnectorFunction):
         raise NotImplemented
     
     def evaluate(self,index):
+        if self.parameters.get('cutoff_distance', 0) > 0:
+            return self.evaluate_block([index])[0]
         return self.distance_dependent_function(self.target.dvf_2_dcs(numpy.sqrt(
                                 numpy.power(self.source.pop.positions[0,:]-self.target.pop.positions[0,index],2) + numpy.power(self.source.pop.positions[1,:]-self.target.pop.positions[1,index],2)
                     )))
-        
+
+    def evaluate_block(self,indices):
+        indices = numpy.asarray(indices)
+        if self.parameters.get('cutoff_distance', 0) > 0:
+            return self._evaluate_neighbours(indices).toarray()
+        return self.distance_dependent_function(self.target.dvf_2_dcs(numpy.sqrt(
+                                numpy.power(self.source.pop.positions[0,:][numpy.newaxis,:]-self.target.pop.positions[0,indices][:,numpy.newaxis],2) + numpy.power(self.source.pop.positions[1,:][numpy.newaxis,:]-self.target.pop.positions[1,indices][:,numpy.newaxis],2)
+                    )))
+
+    def evaluate_sparse_block(self,indices):
+        if self.parameters.get('cutoff_distance', 0) > 0:
+            return self._evaluate_neighbours(numpy.asarray(indices))
+        return None
+
+    def evaluate_pairs(self,indices,rows,sources):
+        indices = numpy.asarray(indices)
+        distance = self.target.dvf_2_dcs(self._distance(indices[rows],sources))
+        values = self.distance_dependent_function(distance)
+        if self.parameters.get('cutoff_distance', 0) > 0:
+            values = numpy.where(distance <= self.parameters.cutoff_distance, values, 0)
+        return values
+
+    def _distance(self,targets,sources):
+        """
+        The distances (in the visual field coordinates) between the target neurons `targets` and the source neurons `sources`.
+        """
+        return numpy.sqrt(numpy.power(self.source.pop.positions[0,sources]-self.target.pop.positions[0,targets],2) + numpy.power(self.source.pop.positions[1,sources]-self.target.pop.positions[1,targets],2))
+
+    def _evaluate_neighbours(self,indices):
+        """
+        Evaluates the function for the source neurons within `cutoff_distance` of the target neurons `indices`, 
+        returning the (len(indices), source size) scipy.sparse.csr_matrix whose stored entries are the pairs within `cutoff_distance`.
+        """
+        if self._tree == None:
+            self._tree = cKDTree(numpy.transpose(self.source.pop.positions[:2,:]))
+        # the cutoff in the visual field coordinates, in which the positions are given (this assumes that dvf_2_dcs is linear)
+        radius = self.parameters.cutoff_distance / self.target.dvf_2_dcs(1.0)
+        neighbours = self._tree.query_ball_point(numpy.transpose(self.target.pop.positions[:2,indices]), radius, return_sorted=True)
+        counts = numpy.array(map(len, neighbours), dtype=int)
+        cols = numpy.concatenate(neighbours).astype(int) if len(indices) else numpy.zeros(0, dtype=int)
+        values = self.distance_dependent_function(self.target.dvf_2_dcs(self._distance(indices[numpy.repeat(numpy.arange(len(indices)), counts)],cols)))
+        return scipy.sparse.csr_matrix((numpy.zeros(len(cols)) + values, cols, numpy.concatenate(([0], numpy.cumsum(counts)))),
+                                       shape=(len(indices),self.source.pop.size))
         
 
 class GaussianDecayModularConnectorFunction(DistanceDependentModularConnectorFunction):
@@ -47,6 +47,17 @@ class MapDependentModularConnectorFunction(ModularConnectorFunction):
             else:
                 distance = numpy.abs(self.val_source-val_target)
             return numpy.exp(-0.5*(distance/self.parameters.sigma)**2)/(self.parameters.sigma*numpy.sqrt(2*numpy.pi))
+
+    def evaluate_block(self,indices):
+            indices = numpy.asarray(indices)
+            val_target=self.mmap(numpy.transpose(numpy.array([self.target.pop.positions[0][indices],self.target.pop.positions[1][indices]])))
+            for index,v in zip(indices,val_target):
+                self.target.add_neuron_annotation(index, 'LGNAfferentOrientation', v*numpy.pi, protected=False) 
+            if self.parameters.periodic:
+                distance = circular_dist(self.val_source[numpy.newaxis,:],val_target[:,numpy.newaxis],1.0)
+            else:
+                distance = numpy.abs(self.val_source[numpy.newaxis,:]-val_target[:,numpy.newaxis])
+            return numpy.exp(-0.5*(distance/self.parameters.sigma)**2)/(self.parameters.sigma*numpy.sqrt(2*numpy.pi))
     
 
 class V1PushPullArborization(ModularConnectorFunction):
@@ -101,16 +112,29 @@ class V1PushPullArborization(ModularConnectorFunction):
     def evaluate(self,index):
         target_or = self.target.get_neuron_annotation(index, 'LGNAfferentOrientation')
         target_phase = self.target.get_neuron_annotation(index, 'LGNAfferentPhase')
-        assert numpy.all(self.source_or >= 0) and numpy.all(self.source_or <= pi)
+        return self._push_pull(self.source_or,self.source_phase,target_or,target_phase)
+
+    def evaluate_block(self,indices):
+        target_or = numpy.array([self.target.get_neuron_annotation(i, 'LGNAfferentOrientation') for i in indices])
+        target_phase = numpy.array([self.target.get_neuron_annotation(i, 'LGNAfferentPhase') for i in indices])
+        return self._push_pull(self.source_or[numpy.newaxis,:],self.source_phase[numpy.newaxis,:],target_or[:,numpy.newaxis],target_phase[:,numpy.newaxis])
+
+    def evaluate_pairs(self,indices,rows,sources):
+        target_or = numpy.array([self.target.get_neuron_annotation(i, 'LGNAfferentOrientation') for i in indices])
+        target_phase = numpy.array([self.target.get_neuron_annotation(i, 'LGNAfferentPhase') for i in indices])
+        return self._push_pull(self.source_or[sources],self.source_phase[sources],target_or[rows],target_phase[rows])
+
+    def _push_pull(self,source_or,source_phase,target_or,target_phase):
+        assert numpy.all(source_or >= 0) and numpy.all(source_or <= pi)
         assert numpy.all(target_or >= 0) and numpy.all(target_or <= pi)
-        assert numpy.all(self.source_phase >= 0) and numpy.all(self.source_phase <= 2*pi)
+        assert numpy.all(source_phase >= 0) and numpy.all(source_phase <= 2*pi)
         assert numpy.all(target_phase >= 0) and numpy.all(target_phase <= 2*pi)
         
-        or_dist = circular_dist(self.source_or,target_or,pi) 
+        or_dist = circular_dist(source_or,target_or,pi) 
         if self.parameters.target_synapses == 'excitatory':
-            phase_dist = circular_dist(self.source_phase,target_phase,2*pi) 
+            phase_dist = circular_dist(source_phase,target_phase,2*pi) 
         else:
-            phase_dist = (pi - circular_dist(self.source_phase,target_phase,2*pi)) 
+            phase_dist = (pi - circular_dist(source_phase,target_phase,2*pi)) 
             
         assert numpy.all(or_dist >= 0) and numpy.all(or_dist <= pi/2)
         assert numpy.all(phase_dist >= 0) and numpy.all(phase_dist <= pi)
@@ -146,22 +170,26 @@ class GaborArborization(ModularConnectorFunction):
     })
 
     def evaluate(self,index):
-        target_or = self.target.get_neuron_annotation(index, 'LGNAfferentOrientation')
-        target_phase = self.target.get_neuron_annotation(index, 'LGNAfferentPhase')
-        target_ar = self.target.get_neuron_annotation(index, 'LGNAfferentAspectRatio')
-        target_freq = self.target.get_neuron_annotation(index, 'LGNAfferentFrequency')
-        target_size = self.target.get_neuron_annotation(index, 'LGNAfferentSize')
-        target_posx = self.target.get_neuron_annotation(index, 'LGNAfferentX')
-        target_posy = self.target.get_neuron_annotation(index, 'LGNAfferentY')
+        return self.evaluate_block([index])[0]
+
+    def evaluate_block(self,indices):
+        return self._gabor(indices,numpy.arange(len(indices))[:,numpy.newaxis],numpy.arange(self.source.pop.size)[numpy.newaxis,:])
+
+    def evaluate_pairs(self,indices,rows,sources):
+        return self._gabor(indices,rows,sources)
+
+    def _gabor(self,indices,rows,sources):
+        def annotation(key):
+            return numpy.array([self.target.get_neuron_annotation(i, key) for i in indices])[rows]
         
-        w = gabor(self.source.pop.positions[0],self.source.pop.positions[1],
-                                       target_posx,
-                                       target_posy,
-                                       target_or + pi/2,
-                                       target_freq,
-                                       target_phase,
-                                       target_size,
-                                       target_ar)
+        w = gabor(self.source.pop.positions[0][sources],self.source.pop.positions[1][sources],
+                                       annotation('LGNAfferentX'),
+                                       annotation('LGNAfferentY'),
+                                       annotation('LGNAfferentOrientation') + pi/2,
+                                       annotation('LGNAfferentFrequency'),
+                                       annotation('LGNAfferentPhase'),
+                                       annotation('LGNAfferentSize'),
+                                       annotation('LGNAfferentAspectRatio'))
                                        
         if self.parameters.ON:
            return numpy.maximum(0,w) 
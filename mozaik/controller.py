@@ -148,7 +148,14 @@ def run_workflow(simulation_name, model_class, create_experiments):
     model = model_class(sim,num_threads,parameters)
     data_store = run_experiments(model,create_experiments(model),parameters)
 
-    if mozaik.mpi_comm.rank == 0:
+    if parameters.get('sharded_datastore', False) and mozaik.mpi_comm and mozaik.mpi_comm.size > 1:
+        # each process stores its own shard, which are then merged by the root process
+        data_store.save()
+        mozaik.mpi_comm.barrier()
+        if mozaik.mpi_comm.rank == 0:
+            data_store.merge_shards([str(r) for r in xrange(1,mozaik.mpi_comm.size)])
+            data_store.save()
+    elif mozaik.mpi_comm.rank == 0:
 	    data_store.save()
 
     import resource
@@ -203,6 +210,8 @@ def run_experiments(model,experiment_list,parameters,load_from=None):
     data_store.set_neuron_annotations(model.neuron_annotations())
     data_store.set_model_parameters(str(parameters))
     data_store.set_sheet_parameters(str(model.sheet_parameters()))
+    # keep the chunks of recordings on the same file system as the data store, so that they can be simply moved into it
+    model.recording_directory = data_store.parameters.root_directory
     
     t0 = time.time()
     simulation_run_time=0
@@ -213,6 +222,8 @@ def run_experiments(model,experiment_list,parameters,load_from=None):
         logger.info('Running model')
         simulation_run_time += experiment.run(data_store,unpresented_stimuli)
         logger.info('Experiment %d/%d finished' % (i+1,len(experiment_list)))
+    if model.input_space != None:
+        model.input_layer.close()
     
     total_run_time = time.time() - t0
     mozaik_run_time = total_run_time - simulation_run_time
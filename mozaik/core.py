@@ -20,13 +20,22 @@ class ParametrizedObject(object):
     ----------
     parameters : dict
                Dictionary of the parameter names and their values that has to match the required_parameters variable. 
+               It can in addition contain any of the parameters in the optional_parameters variable.
+
+    Notes
+    -----
+    The optional parameters have the same structure as the required ones (they can also be nested in the 
+    sections of the required parameters). They are type-checked when supplied, and the code reading them 
+    supplies their default value (e.g. via `self.parameters.get(name, default)`), so that they can be added 
+    to a class without breaking the existing parameter files.
     """
     required_parameters = ParameterSet({})
+    optional_parameters = ParameterSet({})
     version = __version__
 
     def check_parameters(self, parameters):
         """
-        This is a function that checks whether all required (and no other) parameters have been specified and all their values have matching types.
+        This is a function that checks whether all required (and no other than the optional) parameters have been specified and all their values have matching types.
         This function gets automatically executed during initialization of each :class:.ParametrizedObject object. 
 
         Parameters
@@ -35,29 +44,40 @@ class ParametrizedObject(object):
                    Dictionary of the parameter names and their values that has to match the required_parameters variable. 
         """
         
-        def walk(tP, P, section=None):
-            if set(tP.keys()) != set(P.keys()):
-                raise KeyError("Invalid parameters for %s.%s Required: %s. Supplied: %s. Difference: %s" % (self.__class__.__name__, section or '', tP.keys(), P.keys(), set(tP.keys()) ^ set(P.keys())))
+        def check(k, v, value, oP):
+            if isinstance(v, ParameterSet):
+                if value != None:
+                    assert isinstance(value, ParameterSet), "Type mismatch for parameter %s: %s !=  ParameterSet, for %s " % (k, type(value), value)
+                    walk(v, value, oP, section=k)
+            elif isinstance(v, PyNNDistribution):
+                 # We will allow for parameters requiring PyNN Distirbution to also fall back to single value - this is compatible with PyNN
+                 if isinstance(value,int) or isinstance(value,float):
+                    assert isinstance(value, PyNNDistribution), "Type mismatch for parameter %s: %s != %s " % (k, PyNNDistribution, value)
+            else:
+                assert isinstance(value, v) or (v == ParameterSet and value == None) or (v == float and isinstance(value,int)) or (v == int and isinstance(value,float)), "Type mismatch for parameter %s: %s != %s " % (k, v, value)
+
+        def walk(tP, P, oP, section=None):
+            difference = (set(tP.keys()) - set(P.keys())) | (set(P.keys()) - set(tP.keys()) - set(oP.keys()))
+            if difference:
+                raise KeyError("Invalid parameters for %s.%s Required: %s. Optional: %s. Supplied: %s. Difference: %s" % (self.__class__.__name__, section or '', tP.keys(), oP.keys(), P.keys(), difference))
             for k, v in tP.items():
-                if isinstance(v, ParameterSet):
-                    if P[k] != None:
-                        assert isinstance(P[k], ParameterSet), "Type mismatch for parameter %s: %s !=  ParameterSet, for %s " % (k, type(P[k]), P[k])
-                        walk(v, P[k], section=k)
-                elif isinstance(v, PyNNDistribution):
-                     # We will allow for parameters requiring PyNN Distirbution to also fall back to single value - this is compatible with PyNN
-                     if isinstance(P[k],int) or isinstance(P[k],float):
-                        assert isinstance(P[k], PyNNDistribution), "Type mismatch for parameter %s: %s != %s " % (k, PyNNDistribution, P[k])
-                else:
-                    assert isinstance(P[k], v) or (v == ParameterSet and P[k] == None) or (v == float and isinstance(P[k],int)) or (v == int and isinstance(P[k],float)), "Type mismatch for parameter %s: %s != %s " % (k, v, P[k])
+                o = oP.get(k, None)
+                check(k, v, P[k], o if isinstance(o, ParameterSet) else ParameterSet({}))
+            for k, v in oP.items():
+                if k in P and k not in tP:
+                    check(k, v, P[k], ParameterSet({}))
         try:
-            # we first need to collect the required parameters from all the classes along the parent path
+            # we first need to collect the required and optional parameters from all the classes along the parent path
             new_param_dict = {}
+            optional_param_dict = {}
             for cls in self.__class__.__mro__:
             # some parents might not define required_parameters
             # if they do not require one or they are the object class
                 if hasattr(cls, 'required_parameters'):
                     new_param_dict.update(cls.required_parameters.as_dict())
-            walk(ParameterSet(new_param_dict), parameters)
+                if hasattr(cls, 'optional_parameters'):
+                    optional_param_dict.update(cls.optional_parameters.as_dict())
+            walk(ParameterSet(new_param_dict), parameters, ParameterSet(optional_param_dict))
         except AssertionError as err:
             raise Exception("%s\nInvalid parameters.\nNeed %s\nSupplied %s" % (
                                 err, ParameterSet(new_param_dict), parameters))
@@ -117,3 +137,23 @@ class SensoryInputComponent(BaseComponent):
         stimuli to allow for models to return to spontaneous activity state.
         """
         raise NotImplementedError
+
+    def get_state(self):
+        """
+        Returns the internal state of the sensory input component (e.g. the state of its
+        random number generators) that has to be captured in a snapshot of the model (see :func:`mozaik.models.Model.snapshot`).
+        Components without internal state return None.
+        """
+        return None
+
+    def set_state(self, state):
+        """
+        Restores the internal state of the component previously returned by :func:`.get_state`.
+        """
+        pass
+
+    def close(self):
+        """
+        Releases the resources held by the component (e.g. worker processes) once the model has finished running.
+        """
+        pass
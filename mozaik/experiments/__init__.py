@@ -24,6 +24,10 @@ class Experiment(object):
     is applied can stay empty. Also if the direct_stimulation is set to None, empty dictionaries will be automatically passed to the model, 
     indicating no direct stimulation is required.
     
+    The experiment can also set the `stimulus_storage` variable to a :class:`mozaik.storage.stimulus_storage.StimulusStoragePolicy`,
+    in which case the raw sensory stimuli it presents are stored in the datastore in the compact form specified by the policy 
+    (if storing of stimuli is enabled). If it is None, the raw sensory stimuli are stored as they are.
+    
     Parameters
     ----------
     model : Model
@@ -40,6 +44,7 @@ class Experiment(object):
         self.model = model
         self.stimuli = []
         self.direct_stimulation = None
+        self.stimulus_storage = None
     
     def return_stimuli(self):
         """
@@ -81,7 +86,7 @@ class Experiment(object):
             (segments,null_segments,input_stimulus,simulator_run_time) = self.model.present_stimulus_and_record(s,ds)
             srtsum += simulator_run_time
             data_store.add_recording(segments,s)
-            data_store.add_stimulus(input_stimulus,s)
+            data_store.add_stimulus(input_stimulus,s,self.stimulus_storage)
             
             if null_segments != []:
                data_store.add_null_recording(null_segments,s) 
@@ -11,6 +11,10 @@ from mozaik.stimuli import InternalStimulus
 import mozaik
 import time
 import numpy
+import cPickle
+import tempfile
+import os
+from neo.core.segment import Segment
 
 logger = mozaik.getMozaikLogger()
 
@@ -35,6 +39,8 @@ class Model(BaseComponent):
     reset : bool
          If True the pyNN.reset() is used to reset the network between stimulus presentations. 
          Otherwise a blank stimulus is shown for a period of time defined by the parameter null_stimulus_period.
+         If a warm-up snapshot has been taken (see :func:`.warm_up`) the neurons are reset into the state stored in it instead,
+         while the random number generators are not rewound, so that each trial receives different noise.
     
     null_stimulus_period : float
                          The length of blank stimulus presentation during the simulation.
@@ -53,6 +59,18 @@ class Model(BaseComponent):
     
     time_step : float (ms)
                 Length of the single step of the simulation. 
+
+    recording_window : float (ms), optional
+                     If non-zero, the stimulus is simulated in windows of this length, and after each window the data recorded 
+                     so far are retrieved from the simulator and appended to an on-disk file (see :func:`.Sheet.write_data_chunk`), 
+                     so that the peak memory consumption is bounded by the window length rather than the stimulus duration. 
+                     If zero (the default), all the data are retrieved at the end of the stimulus presentation.
+
+    sharded_datastore : bool, optional
+                      If True, in the MPI context the recordings are not gathered to the root process, but each MPI process
+                      keeps the recordings of its local neurons and stores them in its own data store (shard), which are merged 
+                      into a single logical data store at the end of the simulation (see :func:`mozaik.storage.datastore.PickledDataStore.merge_shards`).
+                      Defaults to False.
     """
 
     required_parameters = ParameterSet({
@@ -65,7 +83,12 @@ class Model(BaseComponent):
         'input_space_type': str,  # defining the type of input space, visual/auditory/... it is the class path to the class representing it
         'min_delay' : float,
         'max_delay' : float,
-        'time_step' : float
+        'time_step' : float,
+    })
+
+    optional_parameters = ParameterSet({
+        'recording_window' : float,
+        'sharded_datastore' : bool,
     })
 
     def __init__(self, sim, num_threads, parameters):
@@ -84,6 +107,10 @@ class Model(BaseComponent):
             self.input_space = None
             
         self.simulator_time = 0
+        self.warmup_snapshot = None
+        # the directory where the chunks of recordings are stored when recording_window is non-zero,
+        # it should be on the same file system as the datastore (see run_experiments)
+        self.recording_directory = None
 
     def present_stimulus_and_record(self, stimulus,artificial_stimulators):
         """
@@ -127,18 +154,23 @@ class Model(BaseComponent):
                 sensory_input = None                                                    
         else:
             sensory_input = None
-        sim_run_time += self.run(stimulus.duration)
         segments = []
+        if self.parameters.get('recording_window', 0) != 0:
+            recording_chunks = self.open_recording_chunks()
+            sim_run_time += self.run(stimulus.duration,recording_chunks)
+            segments = self.close_recording_chunks(recording_chunks)
+        else:
+            sim_run_time += self.run(stimulus.duration)
         
         for sheet in self.sheets.values():    
-            if sheet.to_record != None:
+            if sheet.to_record != None and self.parameters.get('recording_window', 0) == 0:
                 if self.parameters.reset:
                     s = sheet.get_data()
-                    if (not mozaik.mpi_comm) or (mozaik.mpi_comm.rank == mozaik.MPI_ROOT):
+                    if self.stores_recordings():
                         segments.append(s)
                 else:
                     s = sheet.get_data(stimulus.duration)
-                    if (not mozaik.mpi_comm) or (mozaik.mpi_comm.rank == mozaik.MPI_ROOT):
+                    if self.stores_recordings():
                         segments.append(s)
 
         self.first_time = False
@@ -150,7 +182,7 @@ class Model(BaseComponent):
         
         return (segments, null_segments,sensory_input,sim_run_time)
         
-    def run(self, tstop):
+    def run(self, tstop, recording_chunks=None):
         """
         Run's the simulation for tstop time.
         
@@ -159,6 +191,11 @@ class Model(BaseComponent):
         tstop : float (seconds)
               The duration for which to run the simulation.
         
+        recording_chunks : list, optional
+                         List of (sheet, file) pairs as returned by :func:`.open_recording_chunks`. If given, the simulation 
+                         is advanced in windows of length recording_window, and after each window the data recorded in 
+                         each of the sheets are drained from the simulator into the corresponding file.
+        
         Returns
         -------
         time : float (seconds)
@@ -166,11 +203,71 @@ class Model(BaseComponent):
         """
         t0 = time.time()
         logger.info("Simulating the network for %s ms" % tstop)
-        self.sim.run(tstop)
+        if recording_chunks == None:
+            self.sim.run(tstop)
+            self.simulator_time += tstop
+        else:
+            window = self.parameters.recording_window
+            offset = self.simulator_time
+            for i in xrange(0,int(numpy.ceil(tstop / window - 1e-9))):
+                w = min(window, tstop - i * window)
+                self.sim.run(w)
+                self.simulator_time += w
+                for sheet, f in recording_chunks:
+                    sheet.write_data_chunk(f,offset)
         logger.info("Finished simulating the network for %s ms" % tstop)
-        self.simulator_time += tstop
         return time.time()-t0
 
+    def open_recording_chunks(self):
+        """
+        Opens, for each recorded sheet, the file into which the windows of the recordings will be drained during 
+        the next stimulus presentation. The files are only created in the MPI processes that store recordings 
+        (see :func:`.stores_recordings`), in the other processes the file is None.
+        
+        Returns
+        -------
+        recording_chunks : list
+                         List of (sheet, file) pairs.
+        """
+        recording_chunks = []
+        for sheet in self.sheets.values():
+            if sheet.to_record != None:
+                f = None
+                if self.stores_recordings():
+                    fd, path = tempfile.mkstemp(prefix=sheet.name.replace('/','_') + '_', suffix='.chunks', dir=self.recording_directory)
+                    os.close(fd)
+                    f = open(path, 'wb')
+                recording_chunks.append((sheet,f))
+        return recording_chunks
+
+    def close_recording_chunks(self,recording_chunks):
+        """
+        Closes the files opened by :func:`.open_recording_chunks`.
+        
+        Returns
+        -------
+        segments : list
+                 List of empty segments (one per recorded sheet) annotated with the sheet name, whose `chunk_file` attribute points 
+                 to the file holding the recorded data. The data store takes over the file when the segment is added to it 
+                 (see :func:`mozaik.storage.neo_neurotools_wrapper.load_segment`). In MPI processes that do not store recordings the list is empty.
+        """
+        segments = []
+        for sheet, f in recording_chunks:
+            if f != None:
+                f.close()
+                s = Segment()
+                s.annotations["sheet_name"] = sheet.name
+                s.chunk_file = f.name
+                segments.append(s)
+        return segments
+
+    def stores_recordings(self):
+        """
+        Returns whether the recordings are stored in this MPI process, which is the case for the root process,
+        or for all processes if the parameter sharded_datastore is True.
+        """
+        return (not mozaik.mpi_comm) or (mozaik.mpi_comm.rank == mozaik.MPI_ROOT) or self.parameters.get('sharded_datastore', False)
+
     def reset(self):
         """
         Rests the network. Depending on the self.parameters.reset this is done either 
@@ -181,8 +278,12 @@ class Model(BaseComponent):
         t0 = time.time()
         segments = []
         if self.parameters.reset:
-            self.sim.reset()
-            self.simulator_time = 0
+            if self.warmup_snapshot != None:
+                # the random number generators keep advancing, so that each trial receives different noise
+                self.restore(self.warmup_snapshot, random_state=False)
+            else:
+                self.sim.reset()
+                self.simulator_time = 0
         else:
             if self.parameters.null_stimulus_period != 0:
                 for sheet in self.sheets.values():
@@ -199,11 +300,110 @@ class Model(BaseComponent):
                 for sheet in self.sheets.values():    
                     if sheet.to_record != None:
                        s = sheet.get_data(self.parameters.null_stimulus_period)
-                       if (not mozaik.mpi_comm) or (mozaik.mpi_comm.rank == mozaik.MPI_ROOT):
+                       if self.stores_recordings():
                            segments.append(s)
         return segments,time.time()-t0    
     
 
+    def warm_up(self, duration):
+        """
+        Simulates the network with blank stimulus for `duration` ms, and stores the state of the network at the end 
+        of this period as the warm-up snapshot. If the model is run with the `reset` parameter set to True, 
+        each subsequent reset will bring the network back into this state instead of the initial one, avoiding 
+        the need to re-simulate the settling of the spontaneous activity before each stimulus.
+        
+        Parameters
+        ----------
+        duration : float (ms)
+                 The length of the warm-up period.
+        
+        Returns
+        -------
+        snapshot : dict
+                 The snapshot of the network at the end of the warm-up (see :func:`.snapshot`).
+        """
+        for sheet in self.sheets.values():
+            sheet.prepare_artificial_stimulation(duration,self.simulator_time,[])
+        if self.input_space:
+            self.input_layer.provide_null_input(self.input_space,duration,self.simulator_time)
+        logger.info("Warming up the network for %s ms with blank stimulus" % duration)
+        self.run(duration)
+        self.warmup_snapshot = self.snapshot()
+        return self.warmup_snapshot
+
+    def snapshot(self, path=None):
+        """
+        Takes a snapshot of the current state of the network: the state variables of all neurons 
+        (membrane potentials, synaptic conductances), the states of the random number generators of the 
+        artificial stimulators and of the sensory input component, and the state of the global mozaik random number generator.
+        
+        Parameters
+        ----------
+        path : str, optional
+             If specified, the snapshot is also pickled into this file. In the MPI context each process 
+             stores the state of its local neurons in a separate file with the MPI rank appended to `path`.
+        
+        Returns
+        -------
+        snapshot : dict
+                 The snapshot, which can be passed to :func:`.restore`.
+                 
+        Notes
+        -----
+        Spikes that are in flight (i.e. emitted but not yet delivered due to synaptic delays) at the time of the 
+        snapshot are not part of it.
+        """
+        snapshot = {
+                      'simulator_time' : self.simulator_time,
+                      'rng' : mozaik.rng.get_state() if mozaik.rng != None else None,
+                      'sheets' : dict((name,sheet.get_state()) for name,sheet in self.sheets.items()),
+                      'input_layer' : self.input_layer.get_state() if self.input_space else None,
+                   }
+        if path != None:
+            f = open(self._snapshot_path(path),'wb')
+            cPickle.dump(snapshot,f)
+            f.close()
+        return snapshot
+
+    def restore(self, snapshot, random_state=True):
+        """
+        Resets the simulator and brings the network into the state stored in the `snapshot`. 
+        The simulator time (and the `simulator_time` variable) is set to zero.
+        
+        Parameters
+        ----------
+        snapshot : dict or str
+                 Either the snapshot as returned by :func:`.snapshot`, or the path with which it was stored by :func:`.snapshot`.
+                 The snapshot can come from another instance of the same model (e.g. a parallel replica), 
+                 but has to be taken with the same number of MPI processes.
+
+        random_state : bool, optional
+                     If True, the states of the random number generators (of the artificial stimulators, of the sensory 
+                     input component and the global mozaik one) are restored as well. If False only the state of the 
+                     neurons is restored, and the random number generators continue from their current state 
+                     (this is how the warm-up snapshot is restored on each reset, see :func:`.reset`).
+        """
+        if isinstance(snapshot,str):
+            f = open(self._snapshot_path(snapshot),'rb')
+            snapshot = cPickle.load(f)
+            f.close()
+        
+        logger.debug("Restoring the network from snapshot taken at %s ms" % snapshot['simulator_time'])
+        self.sim.reset()
+        self.simulator_time = 0
+        for name, state in snapshot['sheets'].items():
+            self.sheets[name].set_state(state, random_state=random_state)
+        if random_state:
+            if self.input_space and snapshot['input_layer'] != None:
+                self.input_layer.set_state(snapshot['input_layer'])
+            if snapshot['rng'] != None:
+                mozaik.rng.set_state(snapshot['rng'])
+
+    def _snapshot_path(self, path):
+        if mozaik.mpi_comm and mozaik.mpi_comm.size > 1:
+            return path + '.' + str(mozaik.mpi_comm.rank)
+        return path
+
     def register_sheet(self, sheet):
         """
         This functions has to called to add a new sheet is added to the model.
@@ -66,6 +66,40 @@ def stRF_2d(x, y, t, p):
     return rf
 
 
+def stRF_2d_separable(x, y, t, p):
+    """
+    The same receptive field as :func:`.stRF_2d`, evaluated as the difference of two space-time separable terms:
+    the 1D temporal profiles G() are evaluated once on the time axis and the 2D spatial profiles F_2d() once on the 
+    spatial grid, and the kernel is formed from their outer products.
+    
+    x and y should be 2D arrays (a single time slice of the arrays produced by meshgrid3D) and t a 1D array.
+    Returns the same 3D array as stRF_2d() on the corresponding 3D arrays.
+    """
+    tmc = G(t, p.K1, p.K2, p.c1, p.c2, p.t1, p.t2, p.n1, p.n2)
+    tms = G(t-p.td, p.K1, p.K2, p.c1, p.c2, p.t1, p.t2, p.n1, p.n2)
+
+    fcm = F_2d(x, y, p.Ac, p.sigma_c)
+    fsm = F_2d(x, y, p.As, p.sigma_s)
+
+    x_res = x[1,0] - x[0,0]
+    fcm_area = fcm.sum()*x_res*x_res
+    center_area = 2*numpy.pi*p.sigma_c*p.sigma_c*p.Ac
+    assert abs(fcm_area - center_area)/max(fcm_area,center_area) < 0.5, "Synthesized center of RF doesn't fit the supplied sigma and amplitude (%f-%f=%f), check visual field size and model size!" % (fcm_area, center_area, abs(fcm_area - center_area))
+    fsm_area = fsm.sum()*x_res*x_res
+    surround_area = 2*numpy.pi*p.sigma_s*p.sigma_s*p.As
+    assert abs(fsm_area - surround_area)/max(fsm_area,surround_area) < 0.5, "Synthesized surround of RF doesn't fit the supplied sigma and amplitude (%f-%f=%f), check visual field size and model size!" % (fsm_area, surround_area, abs(fsm_area - surround_area))
+
+    rf = fcm[:, :, numpy.newaxis] * tmc[numpy.newaxis, numpy.newaxis, :] - fsm[:, :, numpy.newaxis] * tms[numpy.newaxis, numpy.newaxis, :]
+
+    if p.subtract_mean:
+        # normalize each time slice separately
+        rf -= rf.reshape(-1, rf.shape[2]).mean(axis=0)
+    return rf
+
+# lets SpatioTemporalReceptiveField.quantize use the separable evaluation
+stRF_2d.separable = stRF_2d_separable
+
+
 def G(t, K1, K2, c1, c2, t1, t2, n1, n2):
     p1 = K1 * ((c1*(t - t1))**n1 * exp(-c1*(t - t1))) / ((n1**n1) * exp(-n1))
     p2 = K2 * ((c2*(t - t2))**n2 * exp(-c2*(t - t2))) / ((n2**n2) * exp(-n2))
@@ -0,0 +1,281 @@
+"""
+Persistent cache of the input currents generated by the retinal receptive fields of :class:`.SpatioTemporalFilterRetinaLGN`.
+"""
+
+import os
+import time
+import fcntl
+import tempfile
+import cPickle
+import numpy
+from numpy.lib.format import open_memmap
+import mozaik
+
+logger = mozaik.getMozaikLogger()
+
+
+class RetinaCache(object):
+    """
+    A directory based cache mapping keys (string representations of stimulus ids) to the input currents of all retinal cells.
+
+    Each entry consists of a single (cell, time) float32 array stored as a .npy file, which is memory-mapped on retrieval
+    so that each MPI process reads only the rows of its local cells, and optionally of a second .npy file containing the
+    frames presented to the retina. The entries are listed in a pickled index, which is only modified under an exclusive
+    file lock and replaced atomically, so that several simulations can share the same cache directory. The index is re-read
+    only when it has been replaced on disk.
+
+    Each entry is tagged with the `fingerprint` of the retinal model that generated it. Entries with a different fingerprint
+    are treated as missing and are evicted when encountered. If `max_size` is given, the least recently used entries are 
+    evicted whenever storing a new entry makes the total size of the cache exceed it.
+
+    Parameters
+    ----------
+    path : str
+         The directory holding the cache. It is created if it does not exist.
+
+    fingerprint : str
+                A hash of everything in the retinal model that the cached input currents depend on.
+
+    max_size : int (bytes), optional
+             The maximum total size of the cached files. If None the size of the cache is not limited.
+
+    Notes
+    -----
+    When running under MPI all the methods have to be called collectively by all processes. The index is consulted only
+    by the root process and its decisions are broadcast to the others, so that all processes always agree on whether an entry
+    is present. When storing an entry the root process creates the array, each process writes the rows of its local cells
+    into it, and the root process commits the entry to the index once all rows have been written.
+    """
+
+    index_name = 'index.pickle'
+    lock_name = 'index.lock'
+
+    def __init__(self, path, fingerprint, max_size=None):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.max_size = max_size
+        if self._is_root() and not os.path.isdir(path):
+            try:
+                os.makedirs(path)
+            except OSError:
+                # the directory could have been created by a concurrent simulation
+                if not os.path.isdir(path):
+                    raise
+        self._barrier()
+        self.index = {}
+        self._index_stamp = None
+
+    def _collective(self):
+        return mozaik.mpi_comm is not None and mozaik.mpi_comm.size > 1
+
+    def _is_root(self):
+        return mozaik.mpi_comm is None or mozaik.mpi_comm.rank == mozaik.MPI_ROOT
+
+    def _barrier(self):
+        if self._collective():
+            mozaik.mpi_comm.barrier()
+
+    def _bcast(self, obj):
+        if self._collective():
+            return mozaik.mpi_comm.bcast(obj, root=mozaik.MPI_ROOT)
+        return obj
+
+    def _all(self, flag):
+        if self._collective():
+            return all(mozaik.mpi_comm.allgather(flag))
+        return flag
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _load_index(self):
+        """
+        Re-reads the index if it has been replaced since it was last read.
+        """
+        try:
+            st = os.stat(self._file(self.index_name))
+        except OSError:
+            self.index = {}
+            self._index_stamp = None
+            return
+        stamp = (st.st_ino, st.st_mtime, st.st_size)
+        if stamp != self._index_stamp:
+            f = open(self._file(self.index_name), 'rb')
+            self.index = cPickle.load(f)
+            f.close()
+            self._index_stamp = stamp
+
+    def _write_index(self):
+        """
+        Atomically replaces the index on disk with `self.index`. Has to be called while holding the lock.
+        """
+        fd, tmp = tempfile.mkstemp(dir=self.path, prefix='.index')
+        f = os.fdopen(fd, 'wb')
+        cPickle.dump(self.index, f, cPickle.HIGHEST_PROTOCOL)
+        f.close()
+        os.rename(tmp, self._file(self.index_name))
+        st = os.stat(self._file(self.index_name))
+        self._index_stamp = (st.st_ino, st.st_mtime, st.st_size)
+
+    def _lock(self):
+        f = open(self._file(self.lock_name), 'a')
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        return f
+
+    def _unlock(self, f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        f.close()
+
+    def _evict(self, key):
+        """
+        Removes the entry `key` from the index and deletes its files. Has to be called while holding the lock.
+        """
+        entry = self.index.pop(key)
+        for name in (entry['currents'], entry['frames']):
+            if name is not None and os.path.isfile(self._file(name)):
+                os.remove(self._file(name))
+
+    def _new_file(self, suffix):
+        fd, name = tempfile.mkstemp(dir=self.path, suffix=suffix)
+        os.close(fd)
+        return os.path.basename(name)
+
+    def lookup(self, key):
+        """
+        Returns the index entry (a dictionary) stored under `key`, or None if there is no such entry or if it was
+        generated by a retinal model with a different fingerprint (in which case it is evicted).
+        """
+        entry = None
+        if self._is_root():
+            self._load_index()
+            entry = self.index.get(key)
+            if entry is not None:
+                lock = self._lock()
+                try:
+                    self._load_index()
+                    entry = self.index.get(key)
+                    if entry is not None and entry.get('fingerprint') != self.fingerprint:
+                        logger.debug("Evicting cache entry %s generated by a different retinal model" % key)
+                        self._evict(key)
+                        entry = None
+                    if entry is not None:
+                        entry['last_used'] = time.time()
+                    self._write_index()
+                finally:
+                    self._unlock(lock)
+        return self._bcast(entry)
+
+    def read_currents(self, entry, rows):
+        """
+        Reads the rows `rows` of the input current array of the cache entry `entry`.
+
+        Parameters
+        ----------
+        entry : dict
+              The cache entry as returned by :func:`.lookup`.
+
+        rows : ndarray
+             The indexes of the cells whose input currents to read.
+
+        Returns
+        -------
+        A (len(rows), time) float32 array, or None if the entry could not be read by any of the MPI processes
+        (e.g. because it has been removed from the cache in the meantime).
+        """
+        try:
+            currents = numpy.load(self._file(entry['currents']), mmap_mode='r')
+            currents = numpy.array(currents[numpy.asarray(rows, dtype=int)])
+        except (IOError, OSError, ValueError):
+            currents = None
+        if not self._all(currents is not None):
+            return None
+        return currents
+
+    def read_frames(self, entry):
+        """
+        Returns the list of the frames stored in the cache entry `entry`, or None if they were not stored.
+        """
+        frames = None
+        if entry['frames'] is not None:
+            try:
+                frames = list(numpy.load(self._file(entry['frames'])))
+            except (IOError, OSError, ValueError):
+                frames = None
+        if not self._all(frames is not None):
+            return None
+        return frames
+
+    def store(self, key, n_cells, rows, currents, temporal_resolution, frames=None):
+        """
+        Stores the input currents of all cells due to a stimulus under `key`.
+
+        Parameters
+        ----------
+        key : str
+            The key under which to store the entry.
+
+        n_cells : int
+                The total number of cells (across all MPI processes).
+
+        rows : ndarray
+             The indexes of the cells (local to this MPI process) whose currents are passed in `currents`.
+
+        currents : ndarray
+                 The (len(rows), time) array of the input currents of the cells `rows`.
+
+        temporal_resolution : float (ms)
+                            The sampling period of the input currents.
+
+        frames : list(ndarray), optional
+               The frames presented to the retina. If None, they are not stored.
+        """
+        length = currents.shape[1] if len(rows) else 0
+        if self._collective():
+            length = max(mozaik.mpi_comm.allgather(length))
+
+        name = None
+        if self._is_root():
+            name = self._new_file('.npy')
+            open_memmap(self._file(name), mode='w+', dtype=numpy.float32, shape=(n_cells, length)).flush()
+        name = self._bcast(name)
+
+        if len(rows):
+            m = open_memmap(self._file(name), mode='r+')
+            m[numpy.asarray(rows, dtype=int)] = currents
+            m.flush()
+            del m
+        self._barrier()
+
+        if self._is_root():
+            frames_name = None
+            if frames is not None:
+                frames_name = self._new_file('.npy')
+                numpy.save(self._file(frames_name), numpy.array(frames))
+
+            size = sum(os.path.getsize(self._file(n)) for n in (name, frames_name) if n is not None)
+            lock = self._lock()
+            try:
+                self._load_index()
+                if key in self.index and self.index[key].get('fingerprint') == self.fingerprint:
+                    # an identical entry has been stored by a concurrent simulation in the meantime
+                    for n in (name, frames_name):
+                        if n is not None:
+                            os.remove(self._file(n))
+                else:
+                    if key in self.index:
+                        self._evict(key)
+                    self.index[key] = {'currents': name, 'frames': frames_name, 'temporal_resolution': temporal_resolution,
+                                       'fingerprint': self.fingerprint, 'size': size, 'last_used': time.time()}
+                    if self.max_size is not None:
+                        lru = sorted((k for k in self.index if k != key), key=lambda k: self.index[k].get('last_used', 0))
+                        total = sum(e.get('size', 0) for e in self.index.values())
+                        for k in lru:
+                            if total <= self.max_size:
+                                break
+                            total -= self.index[k].get('size', 0)
+                            self._evict(k)
+                    self._write_index()
+            finally:
+                self._unlock(lock)
+            logger.debug("Stored input currents of %d cells to cache..." % n_cells)
+        self._barrier()
@@ -4,15 +4,23 @@ Retina/LGN model based on that developed by Jens Kremkow (CNRS-INCM/ALUF)
 """
 
 import numpy
-import os.path
-import pickle
+import hashlib
+import os
+import tempfile
+import multiprocessing
+import atexit
+import collections
+from numpy.lib.stride_tricks import as_strided
+from scipy.signal import fftconvolve
 import mozaik
 import cai97
+from mozaik.models.vision.retina_cache import RetinaCache
 from mozaik.space import VisualSpace, VisualRegion
 from mozaik.core import SensoryInputComponent
 from mozaik.sheets.vision import RetinalUniformSheet
 from mozaik.tools.mozaik_parametrized import MozaikParametrized
 from parameters import ParameterSet
+from pyNN.parameters import Sequence
 
 logger = mozaik.getMozaikLogger()
 
@@ -29,6 +37,55 @@ def meshgrid3D(x, y, z):
            z[nax, nax, :] * mult_fact
 
 
+def _splitmix64(z):
+    """
+    The SplitMix64 mixing function applied elementwise to a uint64 array.
+    """
+    z = (z ^ (z >> numpy.uint64(30))) * numpy.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> numpy.uint64(27))) * numpy.uint64(0x94D049BB133111EB)
+    return z ^ (z >> numpy.uint64(31))
+
+
+def counter_based_normal(keys, counter, n):
+    """
+    Returns standard normally distributed samples, generated by a counter-based random number generator.
+    
+    Each row is a deterministic function of only the corresponding key, the counter and the sample index, so
+    the rows can be generated in any grouping (e.g. for the local cells of any MPI process) with identical results.
+    
+    Parameters
+    ----------
+    keys : ndarray
+         The 64 bit keys (seeds) of the streams, one per row (e.g. one per cell).
+    
+    counter : int
+            The counter selecting an independent block of samples from each stream (e.g. the stimulus presentation number).
+    
+    n : int
+      The number of samples per row.
+    
+    Returns
+    -------
+    A (len(keys), n) ndarray.
+    
+    Notes
+    -----
+    The uniform samples are the outputs of the SplitMix64 generator started from a state derived from the key and the counter,
+    and are transformed to normal samples with the Box-Muller transform.
+    """
+    keys = numpy.asarray(keys, dtype=numpy.uint64)
+    m = (n + 1) // 2
+    golden = numpy.uint64(0x9E3779B97F4A7C15)
+    with numpy.errstate(over='ignore'):
+        state = _splitmix64(_splitmix64(keys + golden) ^ numpy.uint64(counter))
+        z = _splitmix64(state[:, numpy.newaxis] + numpy.arange(1, 2 * m + 1, dtype=numpy.uint64)[numpy.newaxis, :] * golden)
+    # uniform samples in (0, 1]
+    u = ((z >> numpy.uint64(11)).astype(numpy.float64) + 1.0) * 2.0**-53
+    r = numpy.sqrt(-2.0 * numpy.log(u[:, :m]))
+    theta = 2 * numpy.pi * u[:, m:]
+    return numpy.hstack((r * numpy.cos(theta), r * numpy.sin(theta)))[:, :n]
+
+
 class SpatioTemporalReceptiveField(object):
     """
     Implements spatio-temporal receptive field.
@@ -47,24 +104,29 @@ class SpatioTemporalReceptiveField(object):
 
     duration : float (ms)
              length of the temporal axis of the RF
+    
+    sign : float
+         The kernel is multiplied by `sign` (-1.0 gives the RF of the opposite polarity, e.g. OFF instead of ON).
              
     Notes
     -----
     Coordinates x = 0 and y = 0 are at the centre of the spatial kernel.
     """
     
-    def __init__(self, func, func_params, width, height, duration, naka_rushton_output_function):
+    def __init__(self, func, func_params, width, height, duration, naka_rushton_output_function, sign=1.0):
         self.func = func
+        self.sign = sign
         self.func_params = func_params
         self.width = float(width)
         self.height = float(height)
         self.duration = float(duration)
         self.naka_rushton_output_function = naka_rushton_output_function
         self.kernel = None
+        self._tail_sums = None
         self.spatial_resolution = numpy.inf
         self.temporal_resolution = numpy.inf
 
-    def quantize(self, dx, dy, dt):
+    def quantize(self, dx, dy, dt, cache_path=None):
         """
         Quantizes the the receptive field. 
         
@@ -79,13 +141,29 @@ class SpatioTemporalReceptiveField(object):
         dy : float
            The number of time bins along the t axis.
         
+        cache_path : str, optional
+                   If given, the quantized kernel is stored in (and subsequently loaded from) this directory, 
+                   under a key derived from the function, its parameters, the size and the resolution of the RF 
+                   (see :func:`.kernel_key`).
+        
         Notes
         -----
         If `dx` does not
         divide exactly into the width, then the actual width will be slightly
         larger than the nominal width. `dx` and `dy` should be in degrees and `dt` in ms.
+        
+        If `func` has a `separable` attribute (as :func:`.cai97.stRF_2d` does), it is called instead with 2D
+        spatial coordinate arrays and a 1D array of times, which avoids evaluating the function over the full 3D grid.
         """
         assert dx == dy  # For now, at least
+        self._tail_sums = None
+        if cache_path != None:
+            filename = os.path.join(cache_path, 'kernel_' + self.kernel_key(dx, dy, dt) + '.npy')
+            if os.path.isfile(filename):
+                self.kernel = numpy.load(filename)
+                self.spatial_resolution = dx
+                self.temporal_resolution = dt
+                return
         nx = numpy.ceil(self.width/dx)
         ny = numpy.ceil(self.height/dy)
         nt = numpy.ceil(self.duration/dt)
@@ -98,13 +176,19 @@ class SpatioTemporalReceptiveField(object):
         #x = numpy.arange(0.0, width, dx)  + dx/2.0 - width/2.0
         #y = numpy.arange(0.0, height, dy) + dy/2.0 - height/2.0
 
-        x = numpy.linspace(0.0, width - dx, width/dx) + dx/2.0 - width/2.0
-        y = numpy.linspace(0.0, height - dy, height/dy) + dx/2.0 - height/2.0
+        x = numpy.linspace(0.0, width - dx, int(nx)) + dx/2.0 - width/2.0
+        y = numpy.linspace(0.0, height - dy, int(ny)) + dx/2.0 - height/2.0
 
         # t is the time at the beginning of each timestep
         t = numpy.arange(0.0, duration, dt)
-        X, Y, T = meshgrid3D(y, x, t)  # x,y are reversed because (x,y) <--> (j,i)
-        kernel = self.func(X, Y, T, self.func_params)
+        separable = getattr(self.func, 'separable', None)
+        if separable != None:
+            X, Y, T = meshgrid3D(y, x, t[:1])  # x,y are reversed because (x,y) <--> (j,i)
+            kernel = separable(X[:, :, 0], Y[:, :, 0], t, self.func_params)
+        else:
+            X, Y, T = meshgrid3D(y, x, t)  # x,y are reversed because (x,y) <--> (j,i)
+            kernel = self.func(X, Y, T, self.func_params)
+        kernel = self.sign * kernel
         #logger.debug("Created receptive field kernel: width=%gº, height=%gº, duration=%g ms, shape=%s" %
         #                 (width, height, duration, kernel.shape))
         #logger.debug("before normalization: min=%g, max=%g" %
@@ -116,6 +200,37 @@ class SpatioTemporalReceptiveField(object):
         self.kernel = kernel
         self.spatial_resolution = dx
         self.temporal_resolution = dt
+        if cache_path != None:
+            # written to a temporary file first, so that concurrent readers never see an incomplete kernel
+            fd, tmp = tempfile.mkstemp(dir=cache_path, suffix='.npy')
+            f = os.fdopen(fd, 'wb')
+            numpy.save(f, kernel)
+            f.close()
+            os.rename(tmp, filename)
+
+    def kernel_key(self, dx, dy, dt):
+        """
+        Returns a hash identifying the kernel quantized with the resolution `dx`, `dy`, `dt`.
+        """
+        params = sorted(self.func_params.flat()) if isinstance(self.func_params, ParameterSet) else self.func_params
+        h = hashlib.sha1()
+        h.update(repr((self.func.__module__, self.func.__name__, params, self.width, self.height, self.duration,
+                       self.sign, dx, dy, dt, mozaik.__version__)))
+        return h.hexdigest()
+
+    def background_response(self, background_luminance):
+        """
+        Returns the response to a blank screen of luminance `background_luminance` shown prior to stimulus onset, 
+        in the first `kernel_duration` time steps after the onset: R_i = Sum[j=i+1,L-1] K_j.B 
+        (see :func:`.CellWithReceptiveField.initialize`).
+        
+        The sums of the kernel over space and over the tail of the time axis are calculated (as a reverse cumulative sum) 
+        only once per quantization, and are shared by all cells and stimuli.
+        """
+        if self._tail_sums is None:
+            s = self.kernel.sum(axis=0).sum(axis=0)
+            self._tail_sums = numpy.append(numpy.cumsum(s[::-1])[::-1][1:], 0.0)
+        return background_luminance * self._tail_sums
 
     @property
     def kernel_duration(self):
@@ -202,7 +317,7 @@ class CellWithReceptiveField(object):
             
         """
         # we add some extra padding to avoid having to check for index out-of-bounds in view()
-        self.response_length = numpy.ceil(stimulus_duration / self.receptive_field.temporal_resolution) \
+        self.response_length = int(numpy.ceil(stimulus_duration / self.receptive_field.temporal_resolution)) \
                                     + self.receptive_field.kernel_duration
         # we should initialize based on multiplying the kernel by the background activity
         # R0 = K_0.I_0 + Sum[j=1,L-1] K_j.B
@@ -214,8 +329,7 @@ class CellWithReceptiveField(object):
         L = self.receptive_field.kernel_duration
         assert L <= self.response_length
         
-        for i in range(L):
-            self.response[i] += background_luminance * self.receptive_field.kernel[:, :, i+1:L].sum()
+        self.response[:L] += self.receptive_field.background_response(background_luminance)
         self.i = 0
         
     def view(self):
@@ -230,9 +344,12 @@ class CellWithReceptiveField(object):
              where i' = (k-j)//α  (// indicates integer division, discarding the
              remainder)
         To avoid loading the entire image sequence into memory, we build up the response array one frame at a time.
+        
+        If the scene was rendered for the current frame with :func:`.VisualSpace.render`, the window of the RF is 
+        sliced from it.
         """
         # window for each RF
-        view_array = self.visual_space.view( self.visual_region, pixel_size=self.receptive_field.spatial_resolution )
+        view_array = self.visual_space.rendered_view( self.visual_region, pixel_size=self.receptive_field.spatial_resolution )
         # convolution
         product = self.receptive_field.kernel * view_array[:, :, numpy.newaxis]
 
@@ -264,6 +381,258 @@ class CellWithReceptiveField(object):
         return {'times': time_points, 'amplitudes': response}
 
 
+class BatchedCellsWithReceptiveField(object):
+    """
+    The same model as :class:`.CellWithReceptiveField`, but evaluated for a whole population of cells sharing the 
+    same receptive field at once. Instead of each cell viewing its own region of the visual space, each frame is 
+    rendered once over a region covering the receptive fields of all cells (the scene), the receptive field windows 
+    of all cells are extracted from it as strided views, and the spatiotemporal kernel is applied to all of them
+    as a single matrix product.
+
+    initialize() should be called once, before stimulus presentation
+    view() should be called in a loop, once for each stimulus frame, with the rendered scene
+    response_currents() should be called at the end of stimulus presentation
+    
+    Parameters
+    ----------
+    x , y : ndarray
+          x and y coordinates of the centers of the RFs in visual space.
+    
+    receptive_field : SpatioTemporalReceptiveField
+          The receptive field object containing the RFs data.
+          
+    gain : float
+         The calculated input current values will be multiplied by the gain parameter.
+    
+    visual_space : VisualSpace
+                 The object representing the visual space.
+    
+    scene_region : VisualRegion
+                 The region of the visual space that will be rendered in each frame, it has to contain the RFs of all the cells
+                 with a margin of at least one pixel and be aligned to the pixel grid of the stimuli (see :func:`.scene_region`).
+    
+    block_size : int
+               The number of cells whose windows are extracted and multiplied with the kernel in one go, bounding the size 
+               of the temporary arrays.
+    
+    Notes
+    -----
+    The RF windows are aligned to the pixel grid of the scene. For stimuli that are not aligned to this grid the 
+    responses can differ from those of :class:`.CellWithReceptiveField` by the effect of shifting the RF by 
+    less than half a pixel.
+    """
+
+    def __init__(self, x, y, receptive_field, gain, visual_space, scene_region, block_size=4096):
+        assert isinstance(receptive_field, SpatioTemporalReceptiveField)
+        self.receptive_field = receptive_field
+        self.gain = gain
+        self.visual_space = visual_space
+        self.scene_region = scene_region
+        self.block_size = block_size
+        if visual_space.update_interval % self.receptive_field.temporal_resolution != 0:
+            errmsg = "The receptive field temporal resolution (%g ms) must be an integer multiple of the visual space update interval (%g ms)" % \
+                (self.receptive_field.temporal_resolution, visual_space.update_interval)
+            raise Exception(errmsg)
+        self.update_factor = int(visual_space.update_interval / self.receptive_field.temporal_resolution)
+        
+        # position of the top left corner of the window of each cell in the scene (in pixels)
+        dx = self.receptive_field.spatial_resolution
+        self.cols = numpy.round((numpy.asarray(x) - self.receptive_field.width/2.0 - scene_region.left) / dx).astype(int)
+        self.rows = numpy.round((scene_region.top - numpy.asarray(y) - self.receptive_field.height/2.0) / dx).astype(int)
+        ny, nx, nt = self.receptive_field.kernel.shape
+        self.kernel_matrix = self.receptive_field.kernel.reshape(ny * nx, nt)
+        self.i = 0
+
+    @staticmethod
+    def scene_region(x, y, receptive_field, grid_region):
+        """
+        Returns the VisualRegion that covers the RFs of cells at positions `x`, `y` with a one pixel margin.
+        The region is aligned to the pixel grid of `grid_region` (typically the visual field of the model, 
+        which the stimuli are aligned to), so that the RF windows cut from the scene are the same as the ones 
+        each cell would see (up to rounding ties).
+        """
+        dx = receptive_field.spatial_resolution
+        left = grid_region.left + numpy.floor((numpy.min(x) - receptive_field.width/2.0 - dx - grid_region.left) / dx) * dx
+        top = grid_region.top + numpy.ceil((numpy.max(y) + receptive_field.height/2.0 + dx - grid_region.top) / dx) * dx
+        width = numpy.ceil((numpy.max(x) + receptive_field.width/2.0 + dx - left) / dx) * dx
+        height = numpy.ceil((top - numpy.min(y) + receptive_field.height/2.0 + dx) / dx) * dx
+        return VisualRegion(location_x=left + width/2.0, location_y=top - height/2.0, size_x=width, size_y=height)
+
+    def initialize(self, background_luminance, stimulus_duration):
+        """
+        Create the array that will contain the current responses, and set the
+        initial values on the assumption that the system was looking at a blank
+        screen of constant luminance prior to stimulus onset (see :func:`.CellWithReceptiveField.initialize`).
+        
+        Parameters
+        ----------
+        
+        background_luminance : float
+                             The background luminance of the visual space.
+        
+        stimulus_duration : float (ms)
+                          The duration  of the visual stimulus.
+        """
+        L = self.receptive_field.kernel_duration
+        self.response_length = int(numpy.ceil(stimulus_duration / self.receptive_field.temporal_resolution)) + L
+        initial = numpy.zeros((self.response_length,))
+        initial[:L] += self.receptive_field.background_response(background_luminance)
+        self.response = numpy.tile(initial, (len(self.rows), 1))
+        self.i = 0
+
+    def view(self, scene):
+        """
+        Updates the responses of all cells with the current frame. 
+        
+        Parameters
+        ----------
+        scene : ndarray
+              The current frame rendered over the scene region with the RF spatial resolution.
+        """
+        ny, nx, L = self.receptive_field.kernel.shape
+        windows = as_strided(scene,
+                             shape=(scene.shape[0] - ny + 1, scene.shape[1] - nx + 1, ny, nx),
+                             strides=scene.strides + scene.strides)
+        for b in xrange(0, len(self.rows), self.block_size):
+            w = windows[self.rows[b:b+self.block_size], self.cols[b:b+self.block_size]]
+            time_course = numpy.dot(w.reshape(len(w), ny * nx), self.kernel_matrix)
+            for j in range(self.i, self.i+self.update_factor):
+                # make sure we do not go beyond response array
+                l = min(L, self.response_length - j)
+                self.response[b:b+self.block_size, j:j+l] += time_course[:, :l]
+        self.i += self.update_factor
+
+    def response_currents(self):
+        """
+        Returns the list of the input currents of all cells, each a dictionary containing 'times' and 'amplitudes' 
+        (see :func:`.CellWithReceptiveField.response_current`).
+        """
+        nr = self.receptive_field.naka_rushton_output_function
+        if nr != None:
+            self.response = nr.Rmax * (abs(self.response) / (abs(self.response) + nr.c50)) * numpy.sign(self.response)
+        response = self.gain * self.response[:, :-self.receptive_field.kernel_duration]
+        time_points = self.receptive_field.temporal_resolution * numpy.arange(0, response.shape[1])
+        return [{'times': time_points, 'amplitudes': r} for r in response]
+
+
+class FFTCellsWithReceptiveField(BatchedCellsWithReceptiveField):
+    """
+    The same model as :class:`.BatchedCellsWithReceptiveField`, exploiting the fact that all cells share the same kernel 
+    and that the kernel is a sum of a few space-time separable components (e.g. the centre and surround terms of :func:`.cai97.stRF_2d`).
+    
+    The separable components are found by singular value decomposition of the quantized kernel (seen as a (space, time) matrix), 
+    keeping those whose singular value is larger than `tolerance` times the largest one. Each frame is then correlated with the 
+    spatial profile of each component via 2D FFT over the whole scene and sampled at the RF positions of the cells, and at the end 
+    of the stimulus the resulting time series are filtered with the temporal profiles of the components via 1D FFT, 
+    with the response to the background luminance preceding the stimulus prepended.
+    
+    Parameters
+    ----------
+    tolerance : float
+              The relative singular value below which the components of the kernel are discarded.
+    
+    See :class:`.BatchedCellsWithReceptiveField` for the other parameters.
+    """
+
+    def __init__(self, x, y, receptive_field, gain, visual_space, scene_region, tolerance=1e-8):
+        BatchedCellsWithReceptiveField.__init__(self, x, y, receptive_field, gain, visual_space, scene_region)
+        ny, nx, nt = self.receptive_field.kernel.shape
+        u, sv, vt = numpy.linalg.svd(self.kernel_matrix, full_matrices=False)
+        rank = numpy.sum(sv > tolerance * sv[0])
+        if rank > 4:
+            logger.warning("The receptive field kernel has %d significant separable components, the fft engine will be slow" % rank)
+        # flipped so that the convolution computes correlation with the kernel
+        self.spatial_profiles = [(u[:, c] * sv[c]).reshape(ny, nx)[::-1, ::-1] for c in xrange(0, rank)]
+        self.temporal_profiles = [vt[c] for c in xrange(0, rank)]
+
+    def initialize(self, background_luminance, stimulus_duration):
+        """
+        Prepares the calculation of the responses to a new stimulus.
+        
+        Parameters
+        ----------
+        
+        background_luminance : float
+                             The background luminance of the visual space.
+        
+        stimulus_duration : float (ms)
+                          The duration  of the visual stimulus.
+        """
+        self.background_luminance = background_luminance
+        self.response_length = int(numpy.ceil(stimulus_duration / self.receptive_field.temporal_resolution))
+        self.frames = []
+
+    def view(self, scene):
+        """
+        Computes the response of the spatial profiles of the kernel components at the RF positions to the current frame.
+        
+        Parameters
+        ----------
+        scene : ndarray
+              The current frame rendered over the scene region with the RF spatial resolution.
+        """
+        self.frames.append(numpy.array([fftconvolve(scene, sp, mode='valid')[self.rows, self.cols] for sp in self.spatial_profiles]))
+
+    def response_currents(self):
+        """
+        Returns the list of the input currents of all cells, each a dictionary containing 'times' and 'amplitudes' 
+        (see :func:`.CellWithReceptiveField.response_current`).
+        """
+        L = self.receptive_field.kernel_duration
+        # (component, cell, time) input sampled at the kernel temporal resolution, each frame is held for update_factor time steps
+        frames = numpy.repeat(numpy.array(self.frames).transpose(1, 2, 0), self.update_factor, axis=2)[:, :, :self.response_length]
+        background = numpy.array([self.background_luminance * sp.sum() for sp in self.spatial_profiles])
+        signal = numpy.concatenate((numpy.tile(background[:, numpy.newaxis, numpy.newaxis], (1, len(self.rows), L - 1)), frames), axis=2)
+        n = int(2 ** numpy.ceil(numpy.log2(signal.shape[2] + L)))
+        response = numpy.fft.irfft(numpy.sum(numpy.fft.rfft(signal, n, axis=2) * numpy.fft.rfft(numpy.array(self.temporal_profiles), n, axis=1)[:, numpy.newaxis, :], axis=0), n, axis=1)
+        self.response = numpy.zeros((len(self.rows), self.response_length + L))
+        self.response[:, :frames.shape[2]] = response[:, L - 1:L - 1 + frames.shape[2]]
+        return BatchedCellsWithReceptiveField.response_currents(self)
+
+
+# the state shared with the worker processes of SpatioTemporalFilterRetinaLGN, inherited when the pool of workers is forked
+_worker_state = {}
+
+
+def _input_currents_worker(task):
+    """
+    Calculates the responses of a slice of the cells of one RF type to the frames stored in a memory-mapped file 
+    (see :func:`.SpatioTemporalFilterRetinaLGN._calculate_input_currents_parallel`).
+    
+    Parameters
+    ----------
+    task : tuple
+         The RF type, the indexes of the cells (within the local cells of that RF type) to calculate, and the 
+         presentation specific parameters: the path of the file holding the frames as raw float64 values, 
+         the shape of the frames array, the update interval and the background luminance of the visual space, 
+         and the duration of the stimulus.
+    
+    Returns
+    -------
+    The (cell, time) array of the amplitudes of the input currents of the cells.
+    """
+    rf_type, cells, frames_path, shape, update_interval, background_luminance, duration = task
+    st = _worker_state
+    rf = st['rf'][rf_type]
+    x = st['positions'][rf_type][0][cells]
+    y = st['positions'][rf_type][1][cells]
+    scene_region = st['scene_region']
+    # only the part of the scene covering the RFs of this slice of cells is processed
+    region = BatchedCellsWithReceptiveField.scene_region(x, y, rf, scene_region)
+    dx = rf.spatial_resolution
+    r0 = max(int(round((scene_region.top - region.top) / dx)), 0)
+    c0 = max(int(round((region.left - scene_region.left) / dx)), 0)
+    frames = numpy.memmap(frames_path, dtype=numpy.float64, mode='r', shape=shape)
+    frames = frames[:, r0:r0 + int(round(region.size_y / dx)), c0:c0 + int(round(region.size_x / dx))]
+    visual_space = VisualSpace(ParameterSet({'update_interval': update_interval,
+                                             'background_luminance': background_luminance}))
+    cells = st['engine'](x, y, rf, st['gain'], visual_space, region)
+    cells.initialize(background_luminance, duration)
+    for frame in frames:
+        cells.view(numpy.array(frame))
+    return numpy.array([c['amplitudes'] for c in cells.response_currents()])
+
+
 class SpatioTemporalFilterRetinaLGN(SensoryInputComponent):
     """
     Retina/LGN model with spatiotemporal receptive field.
@@ -283,9 +652,36 @@ class SpatioTemporalFilterRetinaLGN(SensoryInputComponent):
     cache_path : str
            Path to the directory where to store the create the cache.
     
+    cache_frames : bool, optional
+           If the frames presented to the retina are stored in the cache alongside the input currents. If not, 
+           they are re-rendered when a stimulus is retrieved from the cache. Defaults to True.
+    
+    cache_size : float (MB), optional
+           The maximum size of the cache. When exceeded the least recently used stimuli are evicted from the cache. 0 (the default) means no limit.
+    
+    memory_cache_size : int, optional
+           The number of the most recently presented stimuli whose (noise-free) input currents and retinal input are kept in memory, 
+           so that the repeated trials of a stimulus are calculated (or read from the cache) only once. 0 (the default) disables the memory cache.
+    
     mpi_reproducible_noise : bool
-           If true the background noise is generated in such a way that is reproducible accross runs using different number of mpi processes. 
-           Significant slowdown if True.
+           If true the background noise is generated in such a way that is reproducible accross runs using different number of mpi processes
+           (see :func:`.counter_based_normal`), and injected via StepCurrentSource. 
+    
+    noise : ParameterSet
+           The `mean` and `stdev` (nA) of the background noise, and optionally the interval `dt` (ms) at which its value is updated
+           (by default the simulation time step with mpi_reproducible_noise, otherwise the default of pyNN's NoisyCurrentSource).
+    
+    engine : str, optional
+           How the responses of the RFs are calculated. 'per_cell' evaluates each cell separately (see :class:`.CellWithReceptiveField`), 
+           'batched' evaluates all cells of a given RF type together from a single rendering of each frame (see :class:`.BatchedCellsWithReceptiveField`). 
+           'fft' filters the whole rendered movie with the separable components of the kernel via FFT (see :class:`.FFTCellsWithReceptiveField`),
+           which is the fastest for dense populations. Defaults to 'per_cell'.
+    
+    processes : int, optional
+           The number of processes among which the calculation of the responses of the RFs is divided. If larger than 1, 
+           the frames are rendered once into a memory-mapped file and the cells of both RF types are partitioned 
+           among a pool of forked worker processes, which is created once and reused for all stimuli. In this case 
+           the 'per_cell' engine is substituted by the equivalent 'batched' one. Defaults to 1. Intended for runs without MPI.
     
     Notes
     -----
@@ -293,14 +689,15 @@ class SpatioTemporalFilterRetinaLGN(SensoryInputComponent):
     the generated amplitudes for all the neurons in the retina (so this will be specific to the model)
     for each new presented stimulus. If it is asked to generate activities for a stimulus that already exists in the directory (it just 
     checks for the name and parameter values of the stimulus, *except* trail number) it will retrieve the values from the cahce.
+    The cache (see :class:`.RetinaCache`) stores the amplitudes as a single float32 (cell, time) array per stimulus, of which each 
+    MPI process memory-maps only the rows of its local cells, and can be shared between concurrently running simulations.
     Note that the input currents are stored without the noise and the aditional noise is still applied after retrieval 
     so the actual current injected into the retinal neurons will not be identical to the one that was injected when 
     the stimulus was saved in the cache.
     
-    **IMPORTANT**
-    This mechanism assumes that the retinal model stays otherwise identical between 
-    simulations. The moment anything is changed in the retinal model one **has** to delete 
-    the retina_cache directory (which effectively resets the cache).
+    The cached amplitudes are tagged with a fingerprint of the retinal model (see :func:`.cache_fingerprint`), and amplitudes 
+    generated by a different retinal model are ignored and evicted from the cache, so the cache does not have to be reset 
+    by hand when the retinal model is changed.
     """
 
     required_parameters = ParameterSet({
@@ -337,8 +734,21 @@ class SpatioTemporalFilterRetinaLGN(SensoryInputComponent):
         }),
     })
 
+    optional_parameters = ParameterSet({
+        'cache_frames': bool,  # True by default
+        'cache_size': float,  # MB, 0 (default) for no limit
+        'memory_cache_size': int,  # number of stimuli, 0 (default) for no memory cache
+        'engine': str,  # 'per_cell' (default), 'batched' or 'fft'
+        'processes': int,  # number of worker processes calculating the RF responses, 1 by default
+        'noise': ParameterSet({
+            'dt': float,  # ms, the simulation time step by default
+        }),
+    })
+
     def __init__(self, model, parameters):
         SensoryInputComponent.__init__(self, model, parameters)
+        if self.parameters.get('engine', 'per_cell') not in ('per_cell', 'batched', 'fft'):
+            raise ValueError("Unknown engine %s of SpatioTemporalFilterRetinaLGN" % self.parameters.engine)
         self.shape = (self.parameters.density,self.parameters.density)
         self.sheets = {}
         self._built = False
@@ -347,7 +757,13 @@ class SpatioTemporalFilterRetinaLGN(SensoryInputComponent):
         self.pops = {}
         self.scs = {}
         self.ncs = {}
-        self.ncs_rng = {}
+        self.noise_keys = {}
+        self._noise_counter = 0
+        self._null_schedules = {}
+        self._noise_times = {}
+        self._memory_cache = collections.OrderedDict()
+        # the pool of worker processes calculating the input currents, created on first use (see _calculate_input_currents_parallel)
+        self._pool = None
         for rf_type in self.rf_types:
             p = RetinalUniformSheet(model,
                                     ParameterSet({'sx': self.parameters.size[0],
@@ -364,7 +780,7 @@ class SpatioTemporalFilterRetinaLGN(SensoryInputComponent):
         for rf_type in self.rf_types:
             self.scs[rf_type] = []
             self.ncs[rf_type] = []
-            self.ncs_rng[rf_type] = []
+            self.noise_keys[rf_type] = []
             seeds=mozaik.get_seeds((self.sheets[rf_type].pop.size,))
             for i, lgn_cell in enumerate(self.sheets[rf_type].pop.all_cells):
                 scs = sim.StepCurrentSource(times=[0.0], amplitudes=[0.0])
@@ -375,11 +791,12 @@ class SpatioTemporalFilterRetinaLGN(SensoryInputComponent):
                     ncs = sim.StepCurrentSource(times=[0.0], amplitudes=[0.0])
         
 		if self.sheets[rf_type].pop._mask_local[i]:
-			self.ncs_rng[rf_type].append(numpy.random.RandomState(seed=seeds[i]))
+			self.noise_keys[rf_type].append(seeds[i])
         	        self.scs[rf_type].append(scs)
 	                self.ncs[rf_type].append(ncs)
                 lgn_cell.inject(scs)
                 lgn_cell.inject(ncs)
+            self.noise_keys[rf_type] = numpy.array(self.noise_keys[rf_type], dtype=numpy.uint64)
                 
         
         P_rf = self.parameters.receptive_field
@@ -390,16 +807,74 @@ class SpatioTemporalFilterRetinaLGN(SensoryInputComponent):
                                              P_rf.width, P_rf.height,
                                              P_rf.duration,
                                              P_rf.naka_rushton_output_function)
-        rf_OFF = SpatioTemporalReceptiveField(lambda x, y, t, p: -1.0 * rf_function(x, y, t, p),
+        rf_OFF = SpatioTemporalReceptiveField(rf_function,
                                               P_rf.func_params,
                                               P_rf.width, P_rf.height,
                                               P_rf.duration,
-                                              P_rf.naka_rushton_output_function)
+                                              P_rf.naka_rushton_output_function,
+                                              sign=-1.0)
+        self.rf = {'X_ON': rf_ON, 'X_OFF': rf_OFF}                
+        self.cache = None
+        if self.parameters.cached:
+            self.cache = RetinaCache(self.parameters.cache_path,
+                                     self.cache_fingerprint(),
+                                     int(self.parameters.get('cache_size', 0) * 2**20) if self.parameters.get('cache_size', 0) > 0 else None)
+
         dx = dy = P_rf.spatial_resolution
         dt = P_rf.temporal_resolution
-        for rf in rf_ON, rf_OFF:
-            rf.quantize(dx, dy, dt)
-        self.rf = {'X_ON': rf_ON, 'X_OFF': rf_OFF}                
+        cache_path = self.parameters.cache_path if self.parameters.cached else None
+        # with the cache on, the kernels are computed only by the root process and loaded by the others
+        if cache_path == None or mozaik.mpi_comm == None or mozaik.mpi_comm.rank == mozaik.MPI_ROOT:
+            for rf in rf_ON, rf_OFF:
+                rf.quantize(dx, dy, dt, cache_path)
+        if cache_path != None and mozaik.mpi_comm != None:
+            mozaik.mpi_comm.barrier()
+            if mozaik.mpi_comm.rank != mozaik.MPI_ROOT:
+                for rf in rf_ON, rf_OFF:
+                    rf.quantize(dx, dy, dt, cache_path)
+
+    def get_state(self):
+        """
+        Returns the state of the generator of the mpi reproducible noise (the counter of the noise presentations).
+        
+        Notes
+        -----
+        The schedules of the current sources are not part of the state, as they are fully reprogrammed
+        (relative to the current simulator time) before each stimulus or blank presentation.
+        """
+        return {'noise_counter': self._noise_counter}
+
+    def set_state(self, state):
+        """
+        Restores the state of the generator of the mpi reproducible noise returned by :func:`.get_state`.
+        """
+        self._noise_counter = state['noise_counter']
+
+    def cache_fingerprint(self):
+        """
+        Returns a hash of everything in the retinal model that the input currents depend on: the receptive field parameters, 
+        the density, size, gain and linear scaler of the retina, the positions of the neurons and the mozaik version.
+        """
+        h = hashlib.sha1()
+        h.update(mozaik.__version__)
+        h.update(repr(sorted(self.parameters.receptive_field.flat())))
+        h.update(repr((self.parameters.density, tuple(self.parameters.size), self.parameters.gain, self.parameters.linear_scaler)))
+        for rf_type in self.rf_types:
+            h.update(rf_type)
+            h.update(numpy.ascontiguousarray(self.sheets[rf_type].pop.positions, dtype=numpy.float64).tostring())
+        return h.hexdigest()
+
+    def _cache_rows(self):
+        """
+        Returns the indexes of the rows of the cached input current arrays corresponding to the local cells of each RF type.
+        The rows of all cells of the first RF type are followed by those of the second.
+        """
+        rows = {}
+        offset = 0
+        for rf_type in self.rf_types:
+            rows[rf_type] = numpy.nonzero(self.sheets[rf_type].pop._mask_local)[0] + offset
+            offset += self.sheets[rf_type].pop.size
+        return rows, offset
 
     def get_cache(self, stimulus_id):
         """
@@ -413,27 +888,27 @@ class SpatioTemporalFilterRetinaLGN(SensoryInputComponent):
         Returns
         -------
         Tuple (input_currents, retinal_input)  where input_currents are the currents due to the RFs of the individual RFs and retinal_input is the 
-        list of frames shown to the retina.
+        list of frames shown to the retina (None if the frames were not cached).
         """
-        
-        #If the chache is switched off or the we run multiprocess job switch of the cache.
-        if self.parameters.cached == False or mozaik.mpi_comm.size>1:
+        if self.cache == None:
             return None
 
-        if not os.path.isfile(self.parameters.cache_path + '/' + 'stimuli.st'):
-            self.cached_stimuli = {}
+        entry = self.cache.lookup(str(stimulus_id))
+        if entry == None:
+            return None
+
+        rows, n_cells = self._cache_rows()
+        currents = self.cache.read_currents(entry, numpy.concatenate([rows[rf_type] for rf_type in self.rf_types]))
+        if currents is None:
             return None
-        else:
-            f1 = open(self.parameters.cache_path + '/' + 'stimuli.st', 'r')
-            self.cached_stimuli = pickle.load(f1)
-            f1.close()
-            if str(stimulus_id) in self.cached_stimuli:
-                f = open(self.parameters.cache_path + '/' + str(self.cached_stimuli[str(stimulus_id)]) + '.st', 'rb')
-                z = pickle.load(f)
-                f.close()
-                return z
-            else:
-                return None
+
+        time_points = entry['temporal_resolution'] * numpy.arange(0, currents.shape[1])
+        input_currents = {}
+        i = 0
+        for rf_type in self.rf_types:
+            input_currents[rf_type] = [{'times': time_points, 'amplitudes': a} for a in currents[i:i + len(rows[rf_type])]]
+            i += len(rows[rf_type])
+        return (input_currents, self.cache.read_frames(entry))
 
     def write_cache(self, stimulus_id, input_currents, retinal_input):
         """
@@ -450,23 +925,23 @@ class SpatioTemporalFilterRetinaLGN(SensoryInputComponent):
                 retinal_input : list(ndarray)
                               List of 2D arrays containing the frames of luminances that were presented to the retina for the stimulus `stimulus_id`.
         
+        Notes
+        -----
+        Under MPI this has to be called by all processes, each passing the input currents of its local cells.
         """
-        if self.parameters.cached == False:
+        if self.cache == None:
             return None
 
-        if str(stimulus_id) not in self.cached_stimuli:
-            counter = 0 if (len(self.cached_stimuli.values()) == 0) else max(self.cached_stimuli.values()) + 1
-
-            self.cached_stimuli[str(stimulus_id)] = counter
-
-            logger.debug("Stored spikes to cache...")
+        if self.cache.lookup(str(stimulus_id)) != None:
+            return None
 
-            f1 = open(self.parameters.cache_path + '/' + 'stimuli.st', 'w')
-            f = open(self.parameters.cache_path + '/' + str(counter) + '.st', 'wb')
-            pickle.dump(self.cached_stimuli, f1)
-            pickle.dump((input_currents, retinal_input), f)
-            f.close()
-            f1.close()
+        rows, n_cells = self._cache_rows()
+        amplitudes = [c['amplitudes'] for rf_type in self.rf_types for c in input_currents[rf_type]]
+        self.cache.store(str(stimulus_id), n_cells,
+                         numpy.concatenate([rows[rf_type] for rf_type in self.rf_types]),
+                         numpy.array(amplitudes),
+                         self.parameters.receptive_field.temporal_resolution,
+                         retinal_input if self.parameters.get('cache_frames', True) else None)
 
     def process_input(self, visual_space, stimulus, duration=None, offset=0):
         """
@@ -498,7 +973,9 @@ class SpatioTemporalFilterRetinaLGN(SensoryInputComponent):
         st = MozaikParametrized.idd(stimulus)
         st.trial = None  # to avoid recalculating RFs response to multiple trials of the same stimulus
 
-        cached = self.get_cache(st)
+        # the noise is added by the current sources, so the input currents do not depend on the trial
+        memorized = self._memory_cache.pop(str(st), None)
+        cached = memorized if memorized != None else self.get_cache(st)
 
         if cached == None:
             logger.debug("Generating output spikes...")
@@ -507,29 +984,25 @@ class SpatioTemporalFilterRetinaLGN(SensoryInputComponent):
         else:
             logger.debug("Retrieved spikes from cache...")
             (input_currents, retinal_input) = cached
+            if retinal_input == None:
+                retinal_input = self._render_retinal_input(visual_space, duration)
+
+        memory_cache_size = self.parameters.get('memory_cache_size', 0)
+        if memory_cache_size > 0:
+            self._memory_cache[str(st)] = (input_currents, retinal_input)
+            while len(self._memory_cache) > memory_cache_size:
+                self._memory_cache.popitem(last=False)
 
-        ts = self.model.sim.get_time_step()
-        #import pylab
-        #pylab.figure()
         for rf_type in self.rf_types:
             assert isinstance(input_currents[rf_type], list)
-            for i, (lgn_cell, input_current, scs, ncs) in enumerate(
-                                                            zip(self.sheets[rf_type].pop,
-                                                                input_currents[rf_type],
-                                                                self.scs[rf_type],
-                                                                self.ncs[rf_type])):
-                assert isinstance(input_current, dict)
-                #if i==0:
-                #    pylab.plot(self.parameters.linear_scaler * input_current['amplitudes'])
-                t = input_current['times'] + offset
-                a = self.parameters.linear_scaler * input_current['amplitudes']
-                scs.set_parameters(times=t, amplitudes=a)
-                if self.parameters.mpi_reproducible_noise:
-                    t = numpy.arange(0, duration, ts) + offset
-                    amplitudes = (self.parameters.noise.mean
-                                   + self.parameters.noise.stdev
-                                       * self.ncs_rng[rf_type][i].randn(len(t)))
-                    ncs.set_parameters(times=t, amplitudes=amplitudes)
+            if len(input_currents[rf_type]) == 0:
+                continue
+            # all cells share the same time points
+            t = input_currents[rf_type][0]['times'] + offset
+            a = self.parameters.linear_scaler * numpy.array([input_current['amplitudes'] for input_current in input_currents[rf_type]])
+            self._set_step_currents(self.scs[rf_type], t, a)
+            if self.parameters.mpi_reproducible_noise:
+                self._set_noise(rf_type, duration, offset)
         # for debugging/testing, doesn't work with MPI !!!!!!!!!!!!
         #input_current_array = numpy.zeros((self.shape[1], self.shape[0], len(visual_space.time_points(duration))))
         #update_factor = int(visual_space.update_interval/self.parameters.receptive_field.temporal_resolution)
@@ -544,7 +1017,8 @@ class SpatioTemporalFilterRetinaLGN(SensoryInputComponent):
 
         # if record() has already been called, setup the recording now
         self._built = True
-        self.write_cache(st, input_currents, retinal_input)
+        if cached == None:
+            self.write_cache(st, input_currents, retinal_input)
         return retinal_input
 
     def provide_null_input(self, visual_space, duration=None, offset=0):
@@ -571,26 +1045,114 @@ class SpatioTemporalFilterRetinaLGN(SensoryInputComponent):
 
         """
         
-        input_current = {}
-        input_current['times'] = numpy.arange(0, duration, visual_space.update_interval) + offset
-        input_current['amplitudes'] = numpy.zeros((len(input_current['times']),))
-        
-        ts = self.model.sim.get_time_step()
+        # the blank schedules differ only by the offset
+        key = (duration, visual_space.update_interval)
+        if key not in self._null_schedules:
+            times = numpy.arange(0, duration, visual_space.update_interval)
+            self._null_schedules[key] = (times, numpy.zeros((len(times),)))
+        times, amplitudes = self._null_schedules[key]
         
         for rf_type in self.rf_types:
-                for i, (lgn_cell, scs, ncs) in enumerate(
-                                                  zip(self.sheets[rf_type].pop,
-                                                      self.scs[rf_type],
-                                                      self.ncs[rf_type])):
-                    scs.set_parameters(times=input_current['times'],
-                                       amplitudes=input_current['amplitudes'])
-                    if self.parameters.mpi_reproducible_noise:
-                        t = numpy.arange(0, duration, ts) + offset
-
-                        amplitudes = (self.parameters.noise.mean
-                                        + self.parameters.noise.stdev
-                                           * self.ncs_rng[rf_type][i].randn(len(t)))
-                        ncs.set_parameters(times=t, amplitudes=amplitudes)
+            self._set_step_currents(self.scs[rf_type], times + offset, amplitudes)
+            if self.parameters.mpi_reproducible_noise:
+                self._set_noise(rf_type, duration, offset)
+
+    def _set_noise(self, rf_type, duration, offset):
+        """
+        Draws the mpi reproducible noise of the local cells of type `rf_type` for a presentation of length `duration`
+        starting at `offset` and sets it to their noise current sources.
+        
+        The noise of each cell is a function of only the cell's seed and the number of noise presentations 
+        so far, and thus does not depend on the distribution of the cells among MPI processes.
+        """
+        if duration not in self._noise_times:
+            dt = self.parameters.noise.get('dt', None)
+            if dt == None:
+                dt = self.model.sim.get_time_step()
+            self._noise_times[duration] = numpy.arange(0, duration, dt)
+        t = self._noise_times[duration]
+        amplitudes = self.parameters.noise.mean + self.parameters.noise.stdev * counter_based_normal(self.noise_keys[rf_type],
+                                                                                                    self._noise_counter,
+                                                                                                    len(t))
+        self._noise_counter += 1
+        self._set_step_currents(self.ncs[rf_type], t + offset, amplitudes)
+
+    def _set_step_currents(self, sources, times, amplitudes):
+        """
+        Sets the schedules of a list of step current sources sharing the same time points at once.
+        
+        Parameters
+        ----------
+        sources : list(StepCurrentSource)
+                The current sources to set.
+        
+        times : ndarray (ms)
+              The times at which the amplitudes change, shared by all the sources.
+        
+        amplitudes : ndarray (nA)
+                   Either a 1D array of amplitudes shared by all the sources, or a 2D array with one row per source.
+        
+        Notes
+        -----
+        With NEST the schedules are translated to the native units in the same way as pyNN does it 
+        (see pyNN.nest.standardmodels.electrodes.NestCurrentSource), and all the devices are updated with a single 
+        call to nest.SetStatus. The parameters pyNN reads back from the devices are therefore the same as if the 
+        sources were set one by one, and the pyNN versions that keep a copy of the parameters of the sources 
+        (in their `parameter_space`) are synchronized with the devices. With other simulators the sources are set 
+        one by one through the pyNN API.
+        """
+        if amplitudes.ndim == 2:
+            assert len(amplitudes) == len(sources), "Got amplitudes for %d current sources, but there are %d" % (len(amplitudes), len(sources))
+        if len(sources) == 0:
+            return
+        sim = self.model.sim
+        if not (hasattr(sim, 'nest') and all(hasattr(scs, '_device') for scs in sources)):
+            if amplitudes.ndim == 1:
+                for scs in sources:
+                    scs.set_parameters(times=times, amplitudes=amplitudes)
+            else:
+                for scs, a in zip(sources, amplitudes):
+                    scs.set_parameters(times=times, amplitudes=a)
+            return
+
+        native_times = times - sim.get_min_delay()
+        dt = sim.get_time_step()
+
+        def native(a):
+            t = native_times
+            if len(a) and a[0] != 0:
+                t = native_times.copy()
+                t[0] = max(t[0], dt)  # NEST ignores changes at time zero
+            return {'amplitude_times': t, 'amplitude_values': 1000.0 * a}
+
+        devices = [scs._device[0] for scs in sources]
+        if amplitudes.ndim == 1:
+            sim.nest.SetStatus(devices, native(amplitudes))
+            rows = [amplitudes] * len(sources)
+        else:
+            sim.nest.SetStatus(devices, [native(a) for a in amplitudes])
+            rows = amplitudes
+        for scs, a in zip(sources, rows):
+            parameter_space = scs.__dict__.get('parameter_space', None)
+            if parameter_space != None:
+                parameter_space.update(times=Sequence(times), amplitudes=Sequence(a))
+
+    def _render_retinal_input(self, visual_space, duration):
+        """
+        Renders the frames presented to the retina, without calculating the responses of the RFs.
+        """
+        if duration is None:
+            duration = visual_space.get_maximum_duration()
+        visual_region = VisualRegion(location_x=0, location_y=0,
+                                     size_x=self.model.visual_field.size_x,
+                                     size_y=self.model.visual_field.size_y)
+        t = 0
+        retinal_input = []
+        while t < duration:
+            t = visual_space.update()
+            retinal_input.append(visual_space.view(visual_region,
+                                                   pixel_size=self.rf["X_ON"].spatial_resolution))
+        return retinal_input
 
     def _calculate_input_currents(self, visual_space, duration):
         """
@@ -600,6 +1162,8 @@ class SpatioTemporalFilterRetinaLGN(SensoryInputComponent):
         if duration is None:
             duration = visual_space.get_maximum_duration()
 
+        if self.parameters.get('engine', 'per_cell') in ('batched', 'fft') or self.parameters.get('processes', 1) > 1:
+            return self._calculate_input_currents_batched(visual_space, duration)
 
         # create population of CellWithReceptiveFields, setting the receptive
         # field centres based on the size/location of self
@@ -623,21 +1187,163 @@ class SpatioTemporalFilterRetinaLGN(SensoryInputComponent):
 
         t = 0
         retinal_input = []
+        visual_region = VisualRegion(location_x=0, location_y=0,
+                                     size_x=self.model.visual_field.size_x,
+                                     size_y=self.model.visual_field.size_y)
+        # the scene is rendered once per frame, with enough padding for the RFs of the cells at the border of the visual field
+        pixel_size = self.rf["X_ON"].spatial_resolution
+        padding = int(numpy.ceil(max(self.rf["X_ON"].width, self.rf["X_ON"].height) / 2.0 / pixel_size)) + 1
 
         while t < duration:
             t = visual_space.update()
+            im = visual_space.render(visual_region, pixel_size=pixel_size, padding=padding)
             for rf_type in self.rf_types:
                 for cell in input_cells[rf_type]:
                     cell.view()
-            visual_region = VisualRegion(location_x=0, location_y=0,
-                                         size_x=self.model.visual_field.size_x,
-                                         size_y=self.model.visual_field.size_y)
+            retinal_input.append(im.copy())
+
+        input_currents = {}
+        for rf_type in self.rf_types:
+            input_currents[rf_type] = [cell.response_current()
+                                       for cell in input_cells[rf_type]]
+        return (input_currents, retinal_input)
+
+    def _calculate_input_currents_batched(self, visual_space, duration):
+        """
+        Calculate the input currents for all cells using :class:`.BatchedCellsWithReceptiveField` or :class:`.FFTCellsWithReceptiveField`.
+        """
+        engine = FFTCellsWithReceptiveField if self.parameters.get('engine', 'per_cell') == 'fft' else BatchedCellsWithReceptiveField
+        positions = {}
+        for rf_type in self.rf_types:
+            local = numpy.nonzero(self.sheets[rf_type].pop._mask_local)[0]
+            positions[rf_type] = (self.sheets[rf_type].pop.positions[0][local], self.sheets[rf_type].pop.positions[1][local])
+        
+        # all RF types share the same scene
+        scene_region = BatchedCellsWithReceptiveField.scene_region(numpy.concatenate([positions[rf_type][0] for rf_type in self.rf_types]),
+                                                                   numpy.concatenate([positions[rf_type][1] for rf_type in self.rf_types]),
+                                                                   self.rf['X_ON'],
+                                                                   self.model.visual_field)
+        if self.parameters.get('processes', 1) > 1:
+            return self._calculate_input_currents_parallel(visual_space, duration, engine, positions, scene_region)
+
+        input_cells = {}
+        for rf_type in self.rf_types:
+            input_cells[rf_type] = engine(positions[rf_type][0],
+                                          positions[rf_type][1],
+                                          self.rf[rf_type],
+                                          self.parameters.gain, visual_space, scene_region)
+            input_cells[rf_type].initialize(visual_space.background_luminance, duration)
+
+        logger.debug("Processing frames")
+
+        t = 0
+        retinal_input = []
+        visual_region = VisualRegion(location_x=0, location_y=0,
+                                     size_x=self.model.visual_field.size_x,
+                                     size_y=self.model.visual_field.size_y)
+
+        while t < duration:
+            t = visual_space.update()
+            scene = visual_space.view(scene_region, pixel_size=self.rf["X_ON"].spatial_resolution)
+            for rf_type in self.rf_types:
+                input_cells[rf_type].view(scene)
             im = visual_space.view(visual_region,
                                    pixel_size=self.rf["X_ON"].spatial_resolution)
             retinal_input.append(im)
 
         input_currents = {}
         for rf_type in self.rf_types:
-            input_currents[rf_type] = [cell.response_current()
-                                       for cell in input_cells[rf_type]]
+            input_currents[rf_type] = input_cells[rf_type].response_currents()
+        return (input_currents, retinal_input)
+
+    def close(self):
+        """
+        Terminates the pool of worker processes calculating the input currents (see :func:`._calculate_input_currents_parallel`), 
+        if it was created. A new pool is created if further stimuli are presented.
+        """
+        if self._pool != None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def _frames_directory(self):
+        """
+        The directory of the file with the frames shared with the worker processes: the shared memory if available, 
+        otherwise the directory of the recordings of the model (None, i.e. the default temporary directory, if not set).
+        """
+        if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+            return '/dev/shm'
+        return getattr(self.model, 'recording_directory', None)
+
+    def _calculate_input_currents_parallel(self, visual_space, duration, engine, positions, scene_region):
+        """
+        Calculate the input currents for all cells with a pool of `parameters.processes` worker processes.
+        
+        The frames are rendered over the scene region and appended, as they are generated, to a temporary file which 
+        the workers memory-map. The local cells of each RF type are sorted by their vertical position and partitioned 
+        into `parameters.processes` slices, so that each worker processes only the band of the scene covering the RFs 
+        of its slice (see :func:`._input_currents_worker`).
+        
+        The pool is created on the first call, and the workers inherit the parts of the state that do not change 
+        between stimuli (the RFs, the positions of the cells and the scene region), while the rest is passed with the tasks.
+        The pool is terminated by :func:`.close`, at the latest when the interpreter exits. The frames file is placed 
+        in the shared memory when available (see :func:`._frames_directory`).
+        """
+        processes = self.parameters.get('processes', 1)
+        if self._pool == None:
+            _worker_state.update({'engine': engine,
+                                  'rf': self.rf,
+                                  'positions': positions,
+                                  'scene_region': scene_region,
+                                  'gain': self.parameters.gain})
+            try:
+                self._pool = multiprocessing.Pool(processes)
+            finally:
+                _worker_state.clear()
+            # in case the model is not closed (see close)
+            atexit.register(self.close)
+
+        t = 0
+        retinal_input = []
+        n = 0
+        shape = None
+        visual_region = VisualRegion(location_x=0, location_y=0,
+                                     size_x=self.model.visual_field.size_x,
+                                     size_y=self.model.visual_field.size_y)
+        fd, frames_path = tempfile.mkstemp(suffix='.frames', dir=self._frames_directory())
+        try:
+            f = os.fdopen(fd, 'wb')
+            try:
+                while t < duration:
+                    t = visual_space.update()
+                    scene = numpy.asarray(visual_space.view(scene_region, pixel_size=self.rf["X_ON"].spatial_resolution), dtype=numpy.float64)
+                    f.write(scene.tobytes())
+                    shape = scene.shape
+                    n += 1
+                    retinal_input.append(visual_space.view(visual_region,
+                                                           pixel_size=self.rf["X_ON"].spatial_resolution))
+            finally:
+                f.close()
+
+            tasks = []
+            for rf_type in self.rf_types:
+                order = numpy.argsort(positions[rf_type][1], kind='mergesort')
+                tasks.extend((rf_type, cells, frames_path, (n,) + shape, visual_space.update_interval,
+                              visual_space.background_luminance, duration)
+                             for cells in numpy.array_split(order, processes) if len(cells))
+            logger.debug("Processing frames with %d processes" % processes)
+            results = self._pool.map(_input_currents_worker, tasks, chunksize=1)
+        finally:
+            os.remove(frames_path)
+
+        input_currents = {}
+        for rf_type in self.rf_types:
+            amplitudes = [None] * len(positions[rf_type][0])
+            for task, a in zip(tasks, results):
+                if task[0] == rf_type:
+                    cells = task[1]
+                    for i, r in zip(cells, a):
+                        amplitudes[i] = r
+            time_points = self.rf[rf_type].temporal_resolution * numpy.arange(0, len(amplitudes[0]) if amplitudes else 0)
+            input_currents[rf_type] = [{'times': time_points, 'amplitudes': a} for a in amplitudes]
         return (input_currents, retinal_input)
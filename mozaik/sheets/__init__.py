@@ -13,7 +13,10 @@ from pyNN import space
 from pyNN.errors import NothingToWriteError
 from string import Template
 from neo.core.spiketrain import SpikeTrain
+from neo.core.analogsignalarray import AnalogSignalArray
+from mozaik.storage.neo_neurotools_wrapper import CompactSpikeTrains
 import quantities as pq
+import cPickle
 
 
 logger = mozaik.getMozaikLogger()
@@ -82,6 +85,24 @@ class Sheet(BaseComponent):
         the path to the :class:`mozaik.sheets.population_selector.PopulationSelector` class
     *params*
         a ParameterSet containing the parameters for the given :class:`mozaik.sheets.population_selector.PopulationSelector` class 
+    
+    Optionally a recording configuration can contain parameter *reduction*, in which case only the reduced quantity 
+    (rather than the full spike trains or analog signals) is stored for the selected neurons (unless they are
+    also selected by another recording configuration without reduction). The reduction is applied every time the data are retrieved
+    from the simulator (i.e. after each recording window if the model has recording_window set, see :func:`.write_data_chunk`). 
+    It is a ParameterSet with parameter *type* and further type specific parameters:
+    
+    *spike_counts* (bin_length : float (ms))
+        Only applicable to 'spikes'. Stores the number of spikes in consecutive bins of length bin_length, as an AnalogSignalArray named 'spike_counts'.
+    *mean_var*
+        Only applicable to analog variables. Stores the mean (as AnalogSignalArray with '_mean' appended to the name of the variable 
+        holding a single sample spanning the whole recording) and the variance (same but with '_var' appended to the name) of the signal.
+    *downsample* (factor : int)
+        Only applicable to analog variables. Stores the signal averaged over consecutive blocks of factor samples, 
+        as AnalogSignalArray with '_downsampled' appended to the name of the variable.
+    
+    The reduced data are thus never mistaken for the full recordings, and are accessed via the dedicated methods of 
+    :class:`mozaik.storage.neo_neurotools_wrapper.MozaikSegment` (e.g. get_mean, get_variance, get_downsampled).
     """
 
     required_parameters = ParameterSet({
@@ -121,14 +142,28 @@ class Sheet(BaseComponent):
         Set up the recording configuration.
         """
         self.to_record = {}
+        self.reductions = []
+        full = {}
         for k in  self.parameters.recorders.keys():
             recording_configuration = load_component(self.parameters.recorders[k].component)
             l = recording_configuration(self,self.parameters.recorders[k].params).generate_idd_list_of_neurons()
             if isinstance(self.parameters.recorders[k].variables,str):
                self.parameters.recorders[k].variables = [self.parameters.recorders[k].variables]
+            reduction = self.parameters.recorders[k].get('reduction',None)
                
             for var in self.parameters.recorders[k].variables:
                 self.to_record[var] = list(set(self.to_record.get(var,[])) | set(l))
+                if reduction == None:
+                    full[var] = full.get(var,set()) | set(l)
+                else:
+                    if (var == 'spikes') != (reduction.type == 'spike_counts') or reduction.type not in ('spike_counts','mean_var','downsample'):
+                        raise ValueError("Reduction %s cannot be applied to variable %s in recorder %s of sheet %s" % (reduction.type,var,k,self.name))
+                    self.reductions.append((var,reduction,numpy.array(sorted(l))))
+
+        # the neurons for which only reduced data are to be stored
+        self.reduced_only = {}
+        for var,reduction,ids in self.reductions:
+            self.reduced_only[var] = self.reduced_only.get(var,set()) | (set(ids) - full.get(var,set()))
 
 
         for k in self.to_record.keys():
@@ -244,48 +279,245 @@ class Sheet(BaseComponent):
                 else:
                     self.pop.record(variable,sampling_interval=self.parameters.recording_interval)
 
-    def get_data(self, stimulus_duration=None):
+    def get_data(self, stimulus_duration=None, offset=None):
         """
         Retrieve data recorded in this sheet from pyNN in response to the last presented stimulus.
         
         Parameters
         ----------
         stimulus_duration : float(ms)
-                          The length of the last stimulus presentation.
+                          The length of the last stimulus presentation. If given, the times in the returned
+                          segment are relative to the start of the recording.
+        
+        offset : float(ms), optional
+               If given, the times in the returned segment are relative to this time.
         
         Returns
         -------
         segment : Segment
-                The segment holding all the recorded data. See NEO documentation for detail on the format.
+                The segment holding all the recorded data, None in MPI processes that do not store recordings (see :func:`mozaik.models.Model.stores_recordings`). 
+                If the model uses sharded data store, the segment holds only the data of the neurons local to this MPI process.
+                See NEO documentation for detail on the format. The spikes are stored in the compact form (see :class:`mozaik.storage.neo_neurotools_wrapper.CompactSpikeTrains`)
+                in the `compact_spiketrains` attribute of the segment, rather than as list of SpikeTrain objects.
         """
+        if offset == None:
+            offset = 0
+            if stimulus_duration != None:
+                offset = self.pop.recorder._recording_start_time.rescale(pq.ms).magnitude
+        
+        # the spikes have to be retrieved before the recorders are cleared
+        spikes = None
+        if 'spikes' in self.to_record:
+            spikes = self._get_spikes(offset)
 
         try:
-            block = self.pop.get_data(['spikes', 'v', 'gsyn_exc', 'gsyn_inh'],
+            block = self.pop.get_data(['v', 'gsyn_exc', 'gsyn_inh'],
+                                      gather=not self.model.parameters.get('sharded_datastore', False),
                                       clear=True)
         except NothingToWriteError, errmsg:
             logger.debug(errmsg)
         
-        if (mozaik.mpi_comm) and (mozaik.mpi_comm.rank != mozaik.MPI_ROOT):
+        if not self.model.stores_recordings():
            return None
         s = block.segments[-1]
         s.annotations["sheet_name"] = self.name
-
-        # lets sort spike train so that it is ordered by IDs and thus hopefully
-        # population indexes
-        def compare(a, b):
-            return cmp(a.annotations['source_id'], b.annotations['source_id'])
-
-        s.spiketrains = sorted(s.spiketrains, compare)
-        if stimulus_duration != None:        
-           for i in xrange(0, len(s.spiketrains)):
-               s.spiketrains[i] -= s.spiketrains[i].t_start
-               s.spiketrains[i].t_stop -= s.spiketrains[i].t_start
-               s.spiketrains[i].t_start = 0 * pq.ms
-           for i in xrange(0, len(s.analogsignalarrays)):
-               s.analogsignalarrays[i].t_start = 0 * pq.ms
-       
+        s.spiketrains = []
+        s.compact_spiketrains = spikes
+        for a in s.analogsignalarrays:
+            a.t_start = a.t_start - offset * pq.ms
+        if self.reductions:
+            self.reduce_data(s)
         return s
 
+    def _get_spikes(self, offset):
+        """
+        Retrieve the spikes recorded in this sheet since the last retrieval as :class:`mozaik.storage.neo_neurotools_wrapper.CompactSpikeTrains`.
+        With the NEST backend the spikes are read directly from the spike detector and gathered to the MPI root 
+        process in one go (unless the model uses sharded data store), avoiding the creation of a SpikeTrain object per neuron in pyNN.
+        
+        Parameters
+        ----------
+        offset : float(ms)
+               The time to which the spike times will be relative.
+        
+        Returns
+        -------
+        spikes : CompactSpikeTrains
+               The spikes, None in MPI processes that do not store recordings.
+        """
+        recorder = self.pop.recorder
+        if not hasattr(recorder, '_spike_detector'):
+            block = self.pop.get_data(['spikes'], gather=not self.model.parameters.get('sharded_datastore', False), clear=False)
+            if not self.model.stores_recordings():
+                return None
+            spikes = CompactSpikeTrains.from_spiketrains(block.segments[-1].spiketrains)
+            spikes.shift(offset)
+            return spikes
+
+        t_start = recorder._recording_start_time.rescale(pq.ms).magnitude
+        t_stop = self.sim.get_current_time()
+        events = self.sim.nest.GetStatus(recorder._spike_detector.device, 'events')[0]
+        ids = numpy.array(sorted([int(i) for i in recorder.filter_recorded('spikes', None)]), dtype=int)
+        senders = numpy.asarray(events['senders'], dtype=int)
+        times = numpy.asarray(events['times'], dtype=float)
+        
+        if mozaik.mpi_comm and mozaik.mpi_comm.size > 1 and not self.model.parameters.get('sharded_datastore', False):
+            parts = mozaik.mpi_comm.gather((ids, senders, times), root=mozaik.MPI_ROOT)
+            if mozaik.mpi_comm.rank != mozaik.MPI_ROOT:
+                return None
+            ids = numpy.unique(numpy.concatenate([p[0] for p in parts]))
+            senders = numpy.concatenate([p[1] for p in parts])
+            times = numpy.concatenate([p[2] for p in parts])
+            
+        mask = numpy.in1d(senders, ids)
+        return CompactSpikeTrains(ids,
+                                  times[mask] - offset,
+                                  numpy.searchsorted(ids, senders[mask]),
+                                  t_start - offset,
+                                  t_stop - offset,
+                                  {'source_population' : self.pop.label})
+
+    def reduce_data(self, s):
+        """
+        Replaces, in segment `s`, the full recordings of the neurons selected by recording configurations 
+        with *reduction* with the reduced quantities (see the notes in the class documentation).
+        
+        Parameters
+        ----------
+        s : Segment
+          The segment as retrieved from pyNN.
+        """
+        reduced = []
+        for var,reduction,ids in self.reductions:
+            if reduction.type == 'spike_counts':
+                spikes = s.compact_spiketrains.select(ids)
+                if len(spikes) == 0:
+                    continue
+                num_bins = int(numpy.ceil((spikes.t_stop - spikes.t_start) / reduction.bin_length - 1e-9))
+                bins = numpy.clip(numpy.floor((spikes.times - spikes.t_start) / reduction.bin_length).astype(int), 0, num_bins - 1)
+                counts = numpy.bincount(spikes.index * num_bins + bins, minlength=len(spikes) * num_bins).reshape(len(spikes), num_bins).T
+                reduced.append(AnalogSignalArray(counts.astype(numpy.float32),
+                                                 units=pq.dimensionless,
+                                                 t_start=spikes.t_start * pq.ms,
+                                                 sampling_period=reduction.bin_length*pq.ms,
+                                                 name='spike_counts',
+                                                 source_ids=spikes.ids,
+                                                 reduction='spike_counts'))
+            else:
+                for a in s.analogsignalarrays:
+                    if a.name != var:
+                        continue
+                    columns = numpy.flatnonzero(numpy.in1d(a.annotations['source_ids'],ids))
+                    if len(columns) == 0:
+                        continue
+                    signal = a.magnitude[:,columns]
+                    annotations = {'source_ids' : a.annotations['source_ids'][columns]}
+                    if reduction.type == 'mean_var':
+                        for r,value,units in (('mean',numpy.mean(signal,axis=0),a.units),('var',numpy.var(signal,axis=0),a.units**2)):
+                            reduced.append(AnalogSignalArray(value[numpy.newaxis,:],
+                                                             units=units,
+                                                             t_start=a.t_start,
+                                                             sampling_period=a.sampling_period*len(signal),
+                                                             name=var + '_' + r,
+                                                             samples=len(signal),
+                                                             reduction=r,
+                                                             **annotations))
+                    else:
+                        n = len(signal) // reduction.factor
+                        reduced.append(AnalogSignalArray(numpy.mean(signal[:n*reduction.factor].reshape(n,reduction.factor,len(columns)),axis=1),
+                                                         units=a.units,
+                                                         t_start=a.t_start,
+                                                         sampling_period=a.sampling_period*reduction.factor,
+                                                         name=var + '_downsampled',
+                                                         reduction='downsample',
+                                                         **annotations))
+
+        # remove the full recordings of neurons for which only reduced data are to be stored
+        if 'spikes' in self.reduced_only:
+            s.compact_spiketrains = s.compact_spiketrains.select(numpy.setdiff1d(s.compact_spiketrains.ids, list(self.reduced_only['spikes'])))
+        analogsignalarrays = []
+        for a in s.analogsignalarrays:
+            if a.name in self.reduced_only:
+                columns = numpy.flatnonzero(numpy.logical_not(numpy.in1d(a.annotations['source_ids'],list(self.reduced_only[a.name]))))
+                if len(columns) == 0:
+                    continue
+                if len(columns) != a.shape[1]:
+                    a = AnalogSignalArray(a.magnitude[:,columns],
+                                          units=a.units,
+                                          t_start=a.t_start,
+                                          sampling_period=a.sampling_period,
+                                          name=a.name,
+                                          source_ids=a.annotations['source_ids'][columns])
+            analogsignalarrays.append(a)
+        s.analogsignalarrays = analogsignalarrays + reduced
+
+    def write_data_chunk(self, f, offset):
+        """
+        Retrieve the data recorded in this sheet since the last retrieval, release them from the simulator, and append 
+        them as a pickled segment to the file `f`. This is used to drain the recordings in windows during long stimulus
+        presentations (see :func:`mozaik.models.Model.run`).
+        
+        Parameters
+        ----------
+        f : file
+          The file to which to append the data. Ignored (and should be None) in MPI processes that do not store recordings.
+          
+        offset : float(ms)
+               The time at which the current stimulus presentation started. The times in the stored segment are
+               relative to it.
+        """
+        s = self.get_data(offset=offset)
+        if s == None:
+            return
+        cPickle.dump(s, f, cPickle.HIGHEST_PROTOCOL)
+
+    def get_state(self):
+        """
+        Retrieve the current state of the neurons in this sheet (local to this MPI process) and
+        the state of the artificial stimulators, so that it can later be brought back via :func:`.set_state`.
+
+        Returns
+        -------
+        state : dict
+              Dictionary with key 'variables' holding a dictionary of the values of the state variables of the cell model
+              (e.g. membrane potential and synaptic conductances), one array per variable with one value per local neuron,
+              and key 'artificial_stimulators' holding the list of states of the artificial stimulators.
+
+        Notes
+        -----
+        The state variables are read directly from the NEST kernel in its native units, and thus this
+        currently only works with the NEST backend.
+        """
+        from pyNN.nest.recording import VARIABLE_MAP
+        local_cells = self.pop.local_cells.tolist()
+        variables = {}
+        for var in self.pop.celltype.default_initial_values.keys():
+            variables[var] = numpy.array(self.sim.nest.GetStatus(local_cells, VARIABLE_MAP.get(var, var)))
+        return {'variables' : variables,
+                'artificial_stimulators' : [ds.get_state() for ds in self.artificial_stimulators]}
+
+    def set_state(self, state, random_state=True):
+        """
+        Brings the neurons in this sheet and its artificial stimulators to the state previously returned by :func:`.get_state`.
+
+        Parameters
+        ----------
+        state : dict
+              The state as returned by :func:`.get_state`, in the same MPI process layout.
+
+        random_state : bool, optional
+                     If False, only the state of the neurons is restored, and the random number generators of the
+                     artificial stimulators continue from their current state.
+        """
+        from pyNN.nest.recording import VARIABLE_MAP
+        local_cells = self.pop.local_cells.tolist()
+        for var, values in state['variables'].items():
+            assert len(values) == len(local_cells), "The snapshot of sheet %s was taken with a different MPI process layout" % self.name
+            self.sim.nest.SetStatus(local_cells, VARIABLE_MAP.get(var, var), values.tolist())
+        if random_state:
+            for ds, s in zip(self.artificial_stimulators, state['artificial_stimulators']):
+                ds.set_state(s)
+
     def prepare_artificial_stimulation(self, duration, offset,additional_stimulators):
         """
         Prepares the background noise and artificial stimulation for the population for the stimulus that is 
@@ -72,6 +72,25 @@ class DirectStimulator(ParametrizedObject):
           """
           raise NotImplemented 
 
+      def get_state(self):
+          """
+          Returns the internal state of the stimulator (typically the state of its random number generators),
+          such that after a subsequent call to :func:`.set_state` the stimulator will generate the same stimulation 
+          as it would have from the moment :func:`.get_state` was called. Stimulators without internal state return None.
+          """
+          return None
+
+      def set_state(self,state):
+          """
+          Restores the internal state of the stimulator returned by :func:`.get_state`.
+          
+          Parameters
+          ----------
+          state : object
+                  The state returned by :func:`.get_state`.
+          """
+          pass
+
 
 
 class BackgroundActivityBombardment(DirectStimulator):
@@ -169,6 +188,15 @@ class BackgroundActivityBombardment(DirectStimulator):
         if not self.sheet.parameters.mpi_safe:
            self.np_exc[0].set_parameters(rate=0)
            self.np_inh[0].set_parameters(rate=0)
+
+    def get_state(self):
+        # in the non mpi_safe case the spikes are generated by NEST whose random number generator state we cannot capture
+        return dict((k,[g.rng.get_state() for g in getattr(self,k)]) for k in ('stgene','stgeni') if hasattr(self,k))
+
+    def set_state(self,state):
+        for k in state.keys():
+            for g,s in zip(getattr(self,k),state[k]):
+                g.rng.set_state(s)
             
 
 class Kick(DirectStimulator):
@@ -250,6 +278,15 @@ class Kick(DirectStimulator):
     def inactivate(self,offset):        
         pass
 
+    def get_state(self):
+        if hasattr(self,'stgene'):
+            return [g.rng.get_state() for g in self.stgene]
+        
+    def set_state(self,state):
+        if state != None:
+            for g,s in zip(self.stgene,state):
+                g.rng.set_state(s)
+
 
 class Depolarization(DirectStimulator):
     """
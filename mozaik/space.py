@@ -148,6 +148,72 @@ class VisualSpace(InputSpace):
         self.content = {}
         self.frame_number = 0
         self.input = None
+        self._render_buffer = None
+        self._rendered = None
+
+    def add_object(self, name, input_object):
+        self._rendered = None
+        InputSpace.add_object(self, name, input_object)
+
+    def reset(self):
+        self._rendered = None
+        InputSpace.reset(self)
+
+    def update(self):
+        self._rendered = None
+        return InputSpace.update(self)
+
+    def render(self, region, pixel_size, padding=0):
+        """
+        Renders the current frame of the scene once, into a buffer that is reused across frames, so that views of 
+        any regions within it can subsequently be obtained with :func:`.rendered_view` as slices of the buffer.
+        
+        Parameters
+        ----------
+        region : VisualRegion
+               The region to render.
+        pixel_size : float (degrees)
+                   The size of a single pixel in degrees of visual field.
+        padding : int
+                The number of pixels by which the rendered area is extended on each side of `region`, so that
+                also views of regions extending past `region` (e.g. receptive fields of cells at its border) are served 
+                from the buffer.
+
+        Returns
+        -------
+                array : nd_array 
+                       The view of `region` (as :func:`.view` would return it). Note that it is a slice of the buffer, 
+                       and is thus overwritten when the next frame is rendered.
+        """
+        padded = VisualRegion(location_x=region.location_x, location_y=region.location_y,
+                              size_x=region.size_x + 2 * padding * pixel_size,
+                              size_y=region.size_y + 2 * padding * pixel_size)
+        size_in_pixels = tuple(numpy.ceil(xy2ij((padded.size_x, padded.size_y)) / float(pixel_size)).astype(int))
+        if self._render_buffer is None or self._render_buffer.shape != size_in_pixels:
+            self._render_buffer = numpy.empty(size_in_pixels)
+        self._compose(padded, pixel_size, self._render_buffer)
+        self._rendered = (padded, pixel_size)
+        return self.rendered_view(region, pixel_size)
+
+    def rendered_view(self, region, pixel_size):
+        """
+        Returns the same as :func:`.view`, but as a slice (without copying) of the buffer of the scene rendered by 
+        :func:`.render` in the current frame, if the region is contained in it. Otherwise the region is rendered 
+        with :func:`.view`.
+        
+        Notes
+        -----
+        The region is aligned to the pixel grid of the rendered scene, so the result can differ from that of :func:`.view`
+        by the effect of shifting the region by less than half a pixel.
+        """
+        if self._rendered != None and self._rendered[1] == pixel_size:
+            rendered_region = self._rendered[0]
+            i = int(round((rendered_region.top - region.top) / pixel_size))
+            j = int(round((region.left - rendered_region.left) / pixel_size))
+            h, w = numpy.ceil(xy2ij((region.size_x, region.size_y)) / float(pixel_size)).astype(int)
+            if i >= 0 and j >= 0 and i + h <= self._render_buffer.shape[0] and j + w <= self._render_buffer.shape[1]:
+                return self._render_buffer[i:i+h, j:j+w]
+        return self.view(region, pixel_size)
 
     def view(self, region, pixel_size):
         """
@@ -173,13 +239,24 @@ class VisualSpace(InputSpace):
            return o.display(region, pixel_size)
 
         size_in_pixels = numpy.ceil(xy2ij((region.size_x, region.size_y)) / float(pixel_size)).astype(int)
-        scene = TRANSPARENT*numpy.ones(size_in_pixels)
+        return self._compose(region, pixel_size, numpy.empty(size_in_pixels))
+
+    def _compose(self, region, pixel_size, scene):
+        """
+        Renders the scene within `region` into the array `scene` (see :func:`.view`), and returns it.
+        """
+        o = self.content.values()[0]
+        if len(self.content.values()) == 1 and not o.transparent and o.is_visible:
+           scene[...] = o.display(region, pixel_size)
+           return scene
+
+        scene.fill(TRANSPARENT)
         for obj in self.content.values():
             if obj.is_visible:
                 if region.overlaps(obj.region):
                     obj_view = obj.display(region, pixel_size)
                     try:
-                        scene = numpy.where(obj_view > scene, obj_view, scene)  # later objects overlay earlier ones with no transparency
+                        numpy.maximum(scene, obj_view, out=scene)  # later objects overlay earlier ones with no transparency
                     except ValueError:
                         logger.error("Array dimensions mismatch. obj_view.shape=%s, scene.shape=%s" % (obj_view.shape, scene.shape))
                         logger.error("  region: %s" % region.describe())
@@ -188,7 +265,8 @@ class VisualSpace(InputSpace):
                 else:
                     #logger.debug("Warning: region %s does not overlap this object (%s)." % (region.describe(), obj.describe()))
                     pass
-        return numpy.where(scene > TRANSPARENT, scene, self.background_luminance)
+        scene[scene <= TRANSPARENT] = self.background_luminance
+        return scene
 
     def get_max_luminance(self):
         """
@@ -8,8 +8,12 @@ import imagen
 import imagen.random
 import imagen.transferfn
 from imagen.image import BoundingBox
+from imagen.patterngenerator import SheetCoordinateSystem
+import os
 import pickle
+import collections
 import numpy
+from scipy import ndimage
 from mozaik.tools.mozaik_parametrized import SNumber, SString
 from mozaik.tools.units import cpd
 from numpy import pi
@@ -21,10 +25,67 @@ class TopographicaBasedVisualStimulus(VisualStimulus):
     As we do not handle transparency in the Topographica stimuli (i.e. all pixels of all stimuli difned here will have 0% transparancy)
     in this abstract class we disable the transparent flag defined by the :class:`mozaik.stimuli.visual_stimulus.VisualStimulus`, to improve efficiency.
     """
+    # the maximum number of pixels (over all frames) generated at once by frame_blocks
+    frame_block_pixels = 2**22
+
     def __init__(self,**params):
         VisualStimulus.__init__(self,**params)
         self.transparent = False # We will not handle transparency anywhere here for now so let's make it fast
 
+    def frame_sequence(self):
+        """
+        If the stimulus implements `frame_blocks`, a generator yielding blocks of frames as (N, H, W) arrays together 
+        with the list of the variables of each frame, the frames are taken from these blocks. Otherwise :func:`.frames` is used.
+        """
+        if not hasattr(self, 'frame_blocks'):
+            return self.frames()
+        return self._frames_from_blocks()
+
+    def _frames_from_blocks(self):
+        for block, variables in self.frame_blocks():
+            for frame, v in zip(block, variables):
+                yield (frame, v)
+
+    def _frame_block_length(self):
+        """
+        The number of frames in each block generated by `frame_blocks`.
+        """
+        h, w = SheetCoordinateSystem(BoundingBox(radius=self.size_x/2), self.density, self.density).shape
+        return max(1, self.frame_block_pixels // (h * w))
+
+    def _pattern_y(self, orientation):
+        """
+        Returns the y coordinates of the pixels of the stimulus in the pattern coordinate system rotated to `orientation`, 
+        as imagen calculates them.
+        """
+        x, y = SheetCoordinateSystem(BoundingBox(radius=self.size_x/2), self.density, self.density).sheetcoordinates_of_matrixidx()
+        return numpy.subtract.outer(numpy.cos(orientation)*y, numpy.sin(orientation)*x)
+
+    def _drifting_phases(self, n):
+        """
+        Returns the phases of the next `n` frames of a drifting grating, advancing `current_phase`.
+        """
+        phases = numpy.zeros(n)
+        for i in xrange(n):
+            phases[i] = self.current_phase
+            self.current_phase += 2*pi * (self.frame_duration/1000.0) * self.temporal_frequency
+        return phases
+
+    def _sine_grating_blocks(self):
+        """
+        Generates the frames of a drifting imagen.SineGrating in blocks, evaluating the grating for all frames of 
+        a block in a single broadcast expression.
+        """
+        self.current_phase = 0
+        n = self._frame_block_length()
+        arg = self.spatial_frequency*2*pi*self._pattern_y(self.orientation)
+        while True:
+            phases = self._drifting_phases(n)
+            block = 0.5 + 0.5*numpy.sin(arg[numpy.newaxis, :, :] + phases[:, numpy.newaxis, numpy.newaxis])
+            block = 2*self.background_luminance*self.contrast/100.0 * block
+            block += self.background_luminance*(100.0 - self.contrast)/100.0
+            yield (block, [[p] for p in phases])
+
 class SparseNoise(TopographicaBasedVisualStimulus):
     """
     Sparse noise 
@@ -127,6 +188,9 @@ class FullfieldDriftingSinusoidalGrating(TopographicaBasedVisualStimulus):
                    [self.current_phase])
             self.current_phase += 2*pi * (self.frame_duration/1000.0) * self.temporal_frequency
 
+    def frame_blocks(self):
+        return self._sine_grating_blocks()
+
 
 class FullfieldDriftingSquareGrating(TopographicaBasedVisualStimulus):
     """
@@ -154,6 +218,17 @@ class FullfieldDriftingSquareGrating(TopographicaBasedVisualStimulus):
                     ydensity = self.density)(),
                 [self.current_phase])
             self.current_phase += 2*pi * (self.frame_duration/1000.0) * self.temporal_frequency
+
+    def frame_blocks(self):
+        self.current_phase = 0
+        n = self._frame_block_length()
+        arg = self.spatial_frequency*2*pi*self._pattern_y(self.orientation)
+        while True:
+            phases = self._drifting_phases(n)
+            block = numpy.around(0.5 + 0.5*numpy.sin(arg[numpy.newaxis, :, :] + phases[:, numpy.newaxis, numpy.newaxis]))
+            block = 2*self.background_luminance*self.contrast/100.0 * block
+            block += self.background_luminance*(100.0 - self.contrast)/100.0
+            yield (block, [[p] for p in phases])
  
 
 class FlashingSquares(TopographicaBasedVisualStimulus):
@@ -181,6 +256,33 @@ class FlashingSquares(TopographicaBasedVisualStimulus):
         # flashing squares with a temporal frequency of 6Hz are happening every 1000/6=167ms
         time = self.duration/self.frame_duration
         stim_period = time/self.temporal_frequency
+        # Squares presence on screen is half of the period.
+        # Since the two patterns will be added together, 
+        # the offset level is half it should be, to sum into the required level, 
+        # and the scale level is twice as much, in order to overcome the presence of the other pattern
+        # The two images do not change in time, so they are generated only once.
+        a = imagen.RawRectangle(
+                x = -halfseparation, 
+                y = 0,
+                orientation = self.orientation,
+                bounds = BoundingBox( radius=self.size_x/2 ),
+                offset = 0.5*self.background_luminance*(100.0 - self.contrast)/100.0, 
+                scale = 2*self.background_luminance*self.contrast/100.0,
+                xdensity = self.density,
+                ydensity = self.density,
+                size = size)()
+        b = imagen.RawRectangle(
+                x = halfseparation, 
+                y = 0,
+                orientation = self.orientation,
+                bounds = BoundingBox( radius=self.size_x/2 ),
+                offset = 0.5*self.background_luminance*(100.0 - self.contrast)/100.0,
+                scale = 2*self.background_luminance*self.contrast/100.0,
+                xdensity = self.density,
+                ydensity = self.density,
+                size = size)()
+        squares = numpy.add(a,b)
+        blank = self.background_luminance*(100.0 - self.contrast)/100.0 * numpy.ones(squares.shape)
         t = 0
         t0 = 0
         # total time of the stimulus
@@ -188,39 +290,10 @@ class FlashingSquares(TopographicaBasedVisualStimulus):
             # frequency tick
             if (t-t0) >= stim_period:
                 t0 = t
-            # Squares presence on screen is half of the period.
-            # Since the two patterns will be added together, 
-            # the offset level is half it should be, to sum into the required level, 
-            # and the scale level is twice as much, in order to overcome the presence of the other pattern
             if t <= t0+(stim_period/2):
-                a = imagen.RawRectangle(
-                        x = -halfseparation, 
-                        y = 0,
-                        orientation = self.orientation,
-                        bounds = BoundingBox( radius=self.size_x/2 ),
-                        offset = 0.5*self.background_luminance*(100.0 - self.contrast)/100.0, 
-                        scale = 2*self.background_luminance*self.contrast/100.0,
-                        xdensity = self.density,
-                        ydensity = self.density,
-                        size = size)()
-                b = imagen.RawRectangle(
-                        x = halfseparation, 
-                        y = 0,
-                        orientation = self.orientation,
-                        bounds = BoundingBox( radius=self.size_x/2 ),
-                        offset = 0.5*self.background_luminance*(100.0 - self.contrast)/100.0,
-                        scale = 2*self.background_luminance*self.contrast/100.0,
-                        xdensity = self.density,
-                        ydensity = self.density,
-                        size = size)()
-                yield (numpy.add(a,b),[t])
+                yield (squares,[t])
             else:
-                yield (imagen.Null(
-                        scale=self.background_luminance*(100.0 - self.contrast)/100.0,
-                        bounds=BoundingBox(radius=self.size_x/2),
-                        xdensity=self.density,
-                        ydensity=self.density)(),
-                    [t])
+                yield (blank,[t])
             # time
             t += 1
 
@@ -238,9 +311,71 @@ class Null(TopographicaBasedVisualStimulus):
                    [self.frame_duration])
 
 
+# Process-wide cache of decoded images, see decoded_image
+_decoded_images = collections.OrderedDict()
+decoded_images_cache_length = 8
+
+
+def decoded_image(filename, size, density, bounds):
+    """
+    Returns the image stored in `filename` as rendered by imagen.image.FileImage (centered, with the longest side 
+    normalized to `size` and the dynamic range normalized to [0,1]) at the given `density` within `bounds`.
+
+    The rendered images are kept in a process-wide cache keyed by the file name, its modification time, and the
+    rendering parameters, so that the image file is read and decoded only once per process, and re-read only when the file
+    changes. Only the `decoded_images_cache_length` most recently used images are kept.
+
+    Parameters
+    ----------
+    filename : str
+             The path of the image file.
+
+    size : float
+         The length of the longer axis of the image in visual degrees.
+
+    density : float
+            The number of pixels per visual degree.
+
+    bounds : tuple
+           The (left, bottom, right, top) bounds of the region to render in visual degrees.
+
+    Returns
+    -------
+    The read-only rendered image.
+    """
+    key = (os.path.abspath(filename), os.path.getmtime(filename), size, density, tuple(bounds))
+    image = _decoded_images.pop(key, None)
+    if image is None:
+        l, b, r, t = bounds
+        image = imagen.image.FileImage(
+                            filename=filename,
+                            x=0,
+                            y=0,
+                            orientation=0,
+                            xdensity=density,
+                            ydensity=density,
+                            size=size,
+                            bounds=BoundingBox(points=((l, b), (r, t))),
+                            pattern_sampler=imagen.image.PatternSampler(
+                                                size_normalization='fit_longest',
+                                                whole_pattern_output_fns=[imagen.transferfn.MaximumDynamicRange()])
+                            )()
+        image.flags.writeable = False
+        while len(_decoded_images) >= decoded_images_cache_length:
+            _decoded_images.popitem(last=False)
+    _decoded_images[key] = image
+    return image
+
+
 class NaturalImageWithEyeMovement(TopographicaBasedVisualStimulus):
     """
     A visual stimulus that simulates an eye movement over a static image.
+
+    Notes
+    -----
+    The image is rendered only once, see :func:`.decoded_image`, onto a canvas padded by the largest excursion of the
+    eye path. Each frame is then cut out of the canvas at the current eye position, which is resolved to sub-pixel precision 
+    by linear interpolation.
     """
     size = SNumber(degrees, doc="The length of the longer axis of the image in visual degrees")
     eye_movement_period = SNumber(ms, doc="The time between two consequitve eye movements recorded in the eye_path file")
@@ -251,26 +386,29 @@ class NaturalImageWithEyeMovement(TopographicaBasedVisualStimulus):
         self.time = 0
         f = open(self.eye_path_location, 'r')
         self.eye_path = pickle.load(f)
-        self.pattern_sampler = imagen.image.PatternSampler(
-                                    size_normalization='fit_longest',
-                                    whole_pattern_output_fns=[imagen.transferfn.MaximumDynamicRange()])
+        f.close()
+
+        rows, cols = SheetCoordinateSystem(BoundingBox(points=((-self.size_x/2, -self.size_y/2),
+                                                               (self.size_x/2, self.size_y/2))),
+                                           self.density, self.density).shape
+        # the canvas is padded so that it covers the frames at all positions along the eye path
+        padding = int(numpy.ceil(numpy.abs(numpy.asarray(self.eye_path, dtype=float)).max() * self.density)) + 1
+        canvas = decoded_image(self.image_location, self.size, self.density,
+                               (-self.size_x/2 - float(padding)/self.density, -self.size_y/2 - float(padding)/self.density,
+                                self.size_x/2 + float(padding)/self.density, self.size_y/2 + float(padding)/self.density))
 
         while True:
             location = self.eye_path[int(numpy.floor(self.frame_duration * self.time / self.eye_movement_period))]
-            image = imagen.image.FileImage(
-                                    filename=self.image_location,
-                                    x=location[0],
-                                    y=location[1],
-                                    orientation=0,
-                                    xdensity=self.density,
-                                    ydensity=self.density,
-                                    size=self.size,
-                                    bounds=BoundingBox(points=((-self.size_x/2, -self.size_y/2),
-                                                               (self.size_x/2, self.size_y/2))),
-                                    scale=2*self.background_luminance,
-                                    pattern_sampler=self.pattern_sampler
-                                    )()
-            yield (image, [self.time])
+            # moving the image to location corresponds to moving the frame by -location over the canvas
+            # (the rows of the canvas run from top to bottom)
+            r = padding + location[1] * self.density
+            c = padding - location[0] * self.density
+            ri, ci = int(numpy.floor(r)), int(numpy.floor(c))
+            if r == ri and c == ci:
+                image = canvas[ri:ri+rows, ci:ci+cols]
+            else:
+                image = ndimage.shift(canvas[ri:ri+rows+1, ci:ci+cols+1], (ri - r, ci - c), order=1)[:rows, :cols]
+            yield (2*self.background_luminance * image, [self.time])
             self.time += 1
 
 
@@ -353,6 +491,17 @@ class DriftingSinusoidalGratingDisk(TopographicaBasedVisualStimulus):
             yield (d,[self.current_phase])
             self.current_phase += 2*pi * (self.frame_duration/1000.0) * self.temporal_frequency
 
+    def frame_blocks(self):
+        c = imagen.Disk(smoothing=0.0,
+                        size=self.radius*2,
+                        scale=1.0,
+                        bounds=BoundingBox(radius=self.size_x/2),
+                        xdensity=self.density,
+                        ydensity=self.density)()
+        d2 = numpy.multiply(self.background_luminance * numpy.ones(c.shape), -(c-1.0))
+        for a, variables in self._sine_grating_blocks():
+            yield (numpy.multiply(a, c) + d2, variables)
+
 
 class FlatDisk(TopographicaBasedVisualStimulus):
     """
@@ -367,14 +516,15 @@ class FlatDisk(TopographicaBasedVisualStimulus):
 
     def frames(self):
         self.current_phase=0
+        # the disk does not change in time, so it is generated only once
+        d = imagen.Disk(smoothing=0.0,
+                        size=self.radius*2,
+                        offset = self.background_luminance,
+                        scale = self.background_luminance*(self.contrast/100.0),
+                        bounds=BoundingBox(radius=self.size_x/2),
+                        xdensity=self.density,
+                        ydensity=self.density)()  
         while True:  
-            d = imagen.Disk(smoothing=0.0,
-                            size=self.radius*2,
-                            offset = self.background_luminance,
-                            scale = self.background_luminance*(self.contrast/100.0),
-                            bounds=BoundingBox(radius=self.size_x/2),
-                            xdensity=self.density,
-                            ydensity=self.density)()  
             yield (d,[self.current_phase])
 
 
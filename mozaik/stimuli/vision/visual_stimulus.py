@@ -36,6 +36,8 @@ class VisualStimulus(BaseStimulus):
     def __init__(self, **params):
         BaseStimulus.__init__(self, **params)
         self._zoom_cache = {}
+        self.zoom_cache_hits = 0
+        self.zoom_cache_misses = 0
         self.region_cache = {}
         self.is_visible = True
         self.transparent = True # And efficiency flag. It should be set to false by the stimulus if there are no transparent points in it. 
@@ -67,7 +69,29 @@ class VisualStimulus(BaseStimulus):
             view = self.background_luminance * numpy.ones(size_in_pixels)
             
         if region.overlaps(self.region):
-            if not self.region_cache.has_key(region):
+            img_pixel_size = xy2ij((self.region.size_x, self.region.size_y)) / self.img.shape  # is self.size a tuple or an array?
+            assert img_pixel_size[0] == img_pixel_size[1]
+            
+            # necessary instead of == comparison due to the floating math rounding errors
+            if abs(pixel_size-img_pixel_size[0])<0.0001:
+                img = self.img
+            else:
+                if self.first_resolution_mismatch_display:
+                    logger.warning("Image pixel size does not match desired size (%g vs. %g) degrees. This is extremely inefficient!!!!!!!!!!!" % (pixel_size,img_pixel_size[0]))
+                    logger.warning("Image pixel size %g,%g" % numpy.shape(self.img))
+                    self.first_resolution_mismatch_display = False
+                # the frame is resampled only once per resolution, and shared by all regions
+                zoom = self._calculate_zoom(img_pixel_size[0], pixel_size)  # img_pixel_size[0]/pixel_size
+                if zoom in self._zoom_cache:
+                    img = self._zoom_cache[zoom]
+                    self.zoom_cache_hits += 1
+                else:
+                    img = interpolation.zoom(self.img, zoom)
+                    self._zoom_cache[zoom] = img
+                    self.zoom_cache_misses += 1
+
+            # the slices depend on the pixel size, not only on the region
+            if not self.region_cache.has_key((region, pixel_size)):
                 intersection = region.intersection(self.region)
                 assert intersection == self.region.intersection(region)  # just a consistency check. Could be removed if necessary for performance.
                 img_relative_left = (intersection.left - self.region.left) / self.region.width
@@ -81,27 +105,6 @@ class VisualStimulus(BaseStimulus):
                 #view_relative_bottom = (intersection.bottom - region.bottom) / region.height
                 view_relative_height = intersection.height / region.height
 
-                img_pixel_size = xy2ij((self.region.size_x, self.region.size_y)) / self.img.shape  # is self.size a tuple or an array?
-                assert img_pixel_size[0] == img_pixel_size[1]
-                
-                # necessary instead of == comparison due to the floating math rounding errors
-                if abs(pixel_size-img_pixel_size[0])<0.0001:
-                    img = self.img
-                else:
-                    if self.first_resolution_mismatch_display:
-                        logger.warning("Image pixel size does not match desired size (%g vs. %g) degrees. This is extremely inefficient!!!!!!!!!!!" % (pixel_size,img_pixel_size[0]))
-                        logger.warning("Image pixel size %g,%g" % numpy.shape(self.img))
-                        self.first_resolution_mismatch_display = False
-                    # note that if the image is much larger than the view region, we might save some
-                    # time by not rescaling the whole image, only the part within the view region.
-                    zoom = self._calculate_zoom(img_pixel_size[0], pixel_size)  # img_pixel_size[0]/pixel_size
-                    #logger.debug("Image pixel size (%g deg) does not match desired size (%g deg). Zooming image by a factor %g" % (img_pixel_size[0], pixel_size, zoom))
-                    if zoom in self._zoom_cache:
-                        img = self._zoom_cache[zoom]
-                    else:
-                        img = interpolation.zoom(self.img, zoom)
-                        self._zoom_cache[zoom] = img
-
                 j_start = numpy.round(img_relative_left * img.shape[1]).astype(int)
                 delta_j = numpy.round(img_relative_width * img.shape[1]).astype(int)
                 i_start = img.shape[0] - numpy.round(img_relative_top * img.shape[0]).astype(int)
@@ -134,7 +137,7 @@ class VisualStimulus(BaseStimulus):
                 ##logger.debug("k_start = %d, k_stop = %d, l_start = %d, l_stop = %d" % (k_start, k_stop, l_start, l_stop))
 
                 try:
-                    self.region_cache[region] = ((k_start,k_start+delta_k,l_start,l_start+delta_l),(i_start,i_start+delta_i, j_start,j_start+delta_j))
+                    self.region_cache[(region, pixel_size)] = ((k_start,k_start+delta_k,l_start,l_start+delta_l),(i_start,i_start+delta_i, j_start,j_start+delta_j))
                     view[k_start:k_start+delta_k, l_start:l_start+delta_l] = img[i_start:i_start+delta_i, j_start:j_start+delta_j]
                 except ValueError:
                     logger.error("i_start = %d, i_stop = %d, j_start = %d, j_stop = %d" % (i_start, i_stop, j_start, j_stop))
@@ -145,38 +148,59 @@ class VisualStimulus(BaseStimulus):
                     raise
             else:
                 try:
-                    ((sx_min,sx_max,sy_min,sy_max),(tx_min,tx_max,ty_min,ty_max)) = self.region_cache[region]
-                    view[sx_min:sx_max,sy_min:sy_max] = self.img[tx_min:tx_max,ty_min:ty_max]
+                    ((sx_min,sx_max,sy_min,sy_max),(tx_min,tx_max,ty_min,ty_max)) = self.region_cache[(region, pixel_size)]
+                    view[sx_min:sx_max,sy_min:sy_max] = img[tx_min:tx_max,ty_min:ty_max]
                 except ValueError:
-                    logger.error("i_start = %d, i_stop = %d, j_start = %d, j_stop = %d" % (i_start, i_stop, j_start, j_stop))
-                    logger.error("k_start = %d, k_stop = %d, l_start = %d, l_stop = %d" % (k_start, k_stop, l_start, l_stop))
+                    logger.error("sx_min = %d, sx_max = %d, sy_min = %d, sy_max = %d" % (sx_min, sx_max, sy_min, sy_max))
+                    logger.error("tx_min = %d, tx_max = %d, ty_min = %d, ty_max = %d" % (tx_min, tx_max, ty_min, ty_max))
                     logger.error("img.shape = %s, view.shape = %s" % (img.shape, view.shape))
-                    logger.error("img[i_start:i_stop, j_start:j_stop].shape = %s" % str(img[i_start:i_stop, j_start:j_stop].shape))
-                    logger.error("view[k_start:k_stop, l_start:l_stop].shape = %s" % str(view[k_start:k_stop, l_start:l_stop].shape))
                     raise
         return view
 
     def update(self):
         """
         Sets the current frame to the next frame in the sequence.
+        
+        The resampled versions of the frame are kept if the new frame is identical to the previous one
+        (e.g. for static stimuli).
         """
+        previous = getattr(self, 'img', None)
         try:
             self.img, self.variables = self._frames.next()
         except StopIteration:
             self.visible = False
+            if self.zoom_cache_misses:
+                logger.debug("Resampled frames cache of %s: %s" % (self.__class__.__name__, self.zoom_cache_statistics()))
         else:
             assert self.img.min() >= 0 or self.img.min() == TRANSPARENT, "frame minimum is less than zero: %g" % self.img.min()
             assert self.img.max() <= 2*self.background_luminance, "frame maximum (%g) is greater than the maximum luminance (%g)" % (self.img.max(), 2*self.background_luminance)
-        self._zoom_cache = {}
+        if self._zoom_cache and not (previous is self.img or (previous is not None and numpy.array_equal(previous, self.img))):
+            self._zoom_cache = {}
+
+    def zoom_cache_statistics(self):
+        """
+        Returns a dictionary with the number of hits and misses of the cache of the resampled frames, and the hit rate.
+        """
+        total = self.zoom_cache_hits + self.zoom_cache_misses
+        return {'hits': self.zoom_cache_hits,
+                'misses': self.zoom_cache_misses,
+                'hit_rate': float(self.zoom_cache_hits) / total if total else 0.0}
 
     def reset(self):
         """
         Reset to the first frame in the sequence.
         """
         self.visible = True
-        self._frames = self.frames()
+        self._frames = self.frame_sequence()
         self.update()
 
+    def frame_sequence(self):
+        """
+        Returns the generator of the frames presented when the stimulus is shown. By default it is :func:`.frames`, 
+        but subclasses can substitute an equivalent, more efficient, generator.
+        """
+        return self.frames()
+
     def next_frame(self):
         """For creating movies"""
         self.update()
@@ -8,10 +8,13 @@ from neo.core.block import Block
 #from neo.io.hdf5io import NeoHdf5IO
 import mozaik
 from mozaik.core import ParametrizedObject
-from neo_neurotools_wrapper import MozaikSegment, PickledDataStoreNeoWrapper
+from neo_neurotools_wrapper import MozaikSegment, PickledDataStoreNeoWrapper, ShardedDataStoreNeoWrapper, load_segment
+from stimulus_storage import EncodedStimulus
 from mozaik.tools.mozaik_parametrized import  MozaikParametrized,filter_query
 import cPickle
 import collections
+import os
+import shutil
 
 logger = mozaik.getMozaikLogger()
 
@@ -175,16 +178,19 @@ class DataStoreView(ParametrizedObject):
     def get_sensory_stimulus(self, stimuli=None):
         """
         Return the raw sensory stimulus that has been presented to the model due to stimuli specified by the stimuli argument.
-        If stimuli==None returns all sensory stimuli.
+        If stimuli==None returns all sensory stimuli. Sensory stimuli stored encoded (see :class:`.StimulusStoragePolicy`) are
+        decoded into lists of frames.
         """
         if stimuli == None:
-            return self.sensory_stimulus.values()
+            data = self.sensory_stimulus.values()
         else:
-            return [self.sensory_stimulus[s] for s in stimuli]
+            data = [self.sensory_stimulus[s] for s in stimuli]
+        return [d.decode() if isinstance(d, EncodedStimulus) else d for d in data]
 
     def sensory_stimulus_copy(self):
         """
         Utility function that makes a shallow copy of the dictionary holding sensory stimuli.
+        Encoded sensory stimuli are kept encoded, they behave as the sequences of their frames (see :class:`.EncodedStimulus`).
         """
         new_dict = collections.OrderedDict()
         for k in self.sensory_stimulus.keys():
@@ -375,6 +381,7 @@ class DataStore(DataStoreView):
 
         # we get recordings as seg
         for s in segments:
+            s = self._load_chunked_segment(s)
             s.annotations['stimulus'] = str(stimulus)
             self.block.segments.append(MozaikSegment(s))
         self.stimulus_dict[str(stimulus)] = True
@@ -385,15 +392,31 @@ class DataStore(DataStoreView):
         """
         # we get recordings as seg
         for s in segments:
+            s = self._load_chunked_segment(s)
             s.null = True
             s.annotations['stimulus'] = str(stimulus)
             self.block.segments.append(MozaikSegment(s,null=True))
 
-    def add_stimulus(self, data, stimulus):
+    def _load_chunked_segment(self, s):
+        """
+        If the segment `s` is only a placeholder for data drained into a file during a chunked recording 
+        (see :func:`mozaik.models.Model.close_recording_chunks`), loads the data and removes the file.
+        """
+        if getattr(s, 'chunk_file', None) == None:
+            return s
+        full = load_segment(s.chunk_file)
+        os.remove(s.chunk_file)
+        full.annotations.update(s.annotations)
+        return full
+
+    def add_stimulus(self, data, stimulus, storage_policy=None):
         """
         The DataStore interface function that adds a stimulus into the datastore.
+        If `storage_policy` (a :class:`.StimulusStoragePolicy`) is given, the raw sensory stimulus `data` is stored encoded according to it.
         """
         if self.parameters.store_stimuli:
+           if storage_policy != None and data is not None:
+              data = storage_policy.encode(data)
            self._add_stimulus(data, stimulus)
 
     def _add_stimulus(self, data, stimulus):
@@ -518,32 +541,65 @@ class PickledDataStore(Hdf5DataStore):
         #cPickle.dump(self.sensory_stimulus, f)
         #f.close()
 
+    def merge_shards(self, shards):
+        """
+        Merges the recordings of this data store with the recordings stored by other MPI processes in their own 
+        data stores (shards) when the model was run with sharded data store. Afterwards each segment of this data store
+        represents the data of all neurons, loaded lazily from all the shards. After :func:`.save` the merged 
+        data store can be loaded as any other PickledDataStore.
+        
+        Parameters
+        ----------
+        shards : list(str)
+               The directories of the other shards, relative to the root directory of this data store.
+        
+        Notes
+        -----
+        All the shards have to hold the same sequence of segments, which is the case as all MPI 
+        processes present the same stimuli in the same order.
+        """
+        blocks = []
+        for d in shards:
+            f = open(os.path.join(self.parameters.root_directory, d, 'datastore.recordings.pickle'), 'rb')
+            blocks.append(cPickle.load(f))
+            f.close()
+            
+        segments = []
+        for i,s in enumerate(self.block.segments):
+            for b in blocks:
+                assert len(b.segments) == len(self.block.segments) and b.segments[i].annotations['sheet_name'] == s.annotations['sheet_name'] and b.segments[i].annotations['stimulus'] == s.annotations['stimulus'], "The shard segments do not match" 
+            segments.append(ShardedDataStoreNeoWrapper(s, s.identifier, self.parameters.root_directory, [''] + list(shards), null=s.null))
+        self.block.segments = segments
+
     def add_recording(self, segments, stimulus):
         # we get recordings as seg
         for s in segments:
-            s.annotations['stimulus'] = str(stimulus)
-            self.block.segments.append(
-                PickledDataStoreNeoWrapper(s,
-                                           'Segment' + str(len(self.block.segments)),
-                                           self.parameters.root_directory))
-            f = open(self.parameters.root_directory + '/' + 'Segment'
-                     + str(len(self.block.segments) - 1) + ".pickle", 'wb')
-            cPickle.dump(s, f)
-
+            self._store_segment(s, stimulus, null=False)
         self.stimulus_dict[str(stimulus)] = True
 
-
     def add_null_recording(self, segments,stimulus):
         """
         Add recordings due to the null stimuli presented between the standard stimuli.
         """
         # we get recordings as seg
         for s in segments:
-            s.annotations['stimulus'] = str(stimulus)
-            self.block.segments.append(
-                PickledDataStoreNeoWrapper(s,
-                                           'Segment' + str(len(self.block.segments)),
-                                           self.parameters.root_directory,null=True))
-            f = open(self.parameters.root_directory + '/' + 'Segment'
-                     + str(len(self.block.segments) - 1) + ".pickle", 'wb')
+            self._store_segment(s, stimulus, null=True)
+
+    def _store_segment(self, s, stimulus, null):
+        """
+        Stores the segment `s` in its own pickle file and adds its lazily loaded wrapper to the block.
+        If the data of the segment have already been drained into a file during a chunked recording
+        (see :func:`mozaik.models.Model.close_recording_chunks`) the file is just moved into the datastore.
+        """
+        s.annotations['stimulus'] = str(stimulus)
+        identifier = 'Segment' + str(len(self.block.segments))
+        filename = self.parameters.root_directory + '/' + identifier + ".pickle"
+        chunk_file = getattr(s, 'chunk_file', None)
+        if chunk_file != None:
+            del s.chunk_file
+            shutil.move(chunk_file, filename)
+        else:
+            f = open(filename, 'wb')
             cPickle.dump(s, f)
+            f.close()
+        self.block.segments.append(PickledDataStoreNeoWrapper(s, identifier, self.parameters.root_directory,null=null))
@@ -7,11 +7,273 @@ When this happens most of this code should become irrelevant and the rest should
 merged into the :mod:`.datastore` module.
 """
 from neo.core.segment import Segment
+from neo.core.spiketrain import SpikeTrain
+from neo.core.analogsignalarray import AnalogSignalArray
 import numpy
 import cPickle
+import collections
+import os
 import quantities as qt
 
 
+class CompactSpikeTrains(object):
+    """
+    Compact representation of the spike trains of a population of neurons recorded over the same period of time.
+    
+    The spikes of all neurons are held in a single float32 array of spike times (in ms), ordered by neuron and 
+    within each neuron by time, accompanied by an int32 array with the index of the neuron that emitted each spike 
+    and per-neuron offsets into these arrays, so that the spikes of the i-th neuron are times[offsets[i]:offsets[i+1]].
+    
+    Parameters
+    ----------
+    ids : ndarray
+        The ids of the neurons in ascending order.
+    
+    times : ndarray
+          The spike times (ms).
+    
+    index : ndarray
+          For each spike the index (into `ids`) of the neuron that emitted it.
+    
+    t_start, t_stop : float (ms)
+                    The start and the end of the recording.
+    
+    annotations : dict
+                Annotations shared by all the spike trains.
+    
+    Notes
+    -----
+    The spikes passed to the constructor do not need to be sorted. 
+    """
+
+    def __init__(self, ids, times, index, t_start, t_stop, annotations={}):
+        self.ids = numpy.asarray(ids).astype(int)
+        order = numpy.lexsort((times, index))
+        self.times = numpy.asarray(times, dtype=numpy.float32)[order]
+        self.index = numpy.asarray(index, dtype=numpy.int32)[order]
+        self.offsets = numpy.searchsorted(self.index, numpy.arange(0, len(self.ids) + 1))
+        self.t_start = float(t_start)
+        self.t_stop = float(t_stop)
+        self.annotations = dict(annotations)
+
+    @staticmethod
+    def from_spiketrains(spiketrains):
+        """
+        Creates the compact representation from a list of neo SpikeTrain objects annotated with *source_id*.
+        """
+        if len(spiketrains) == 0:
+            return CompactSpikeTrains([], [], [], 0, 0)
+        order = numpy.argsort([st.annotations['source_id'] for st in spiketrains])
+        spiketrains = [spiketrains[i] for i in order]
+        annotations = dict([(k, v) for (k, v) in spiketrains[0].annotations.items() if k not in ('source_id', 'source_index')])
+        return CompactSpikeTrains([st.annotations['source_id'] for st in spiketrains],
+                                  numpy.concatenate([st.rescale(qt.ms).magnitude for st in spiketrains]),
+                                  numpy.repeat(numpy.arange(0, len(spiketrains)), [len(st) for st in spiketrains]),
+                                  spiketrains[0].t_start.rescale(qt.ms).magnitude,
+                                  spiketrains[0].t_stop.rescale(qt.ms).magnitude,
+                                  annotations)
+
+    @staticmethod
+    def concatenate(chunks):
+        """
+        Concatenates in time a list of compact spike trains holding consecutive windows of the same recording.
+        """
+        ids = numpy.unique(numpy.concatenate([c.ids for c in chunks]))
+        return CompactSpikeTrains(ids,
+                                  numpy.concatenate([c.times for c in chunks]),
+                                  numpy.concatenate([numpy.searchsorted(ids, c.ids)[c.index] for c in chunks]),
+                                  chunks[0].t_start,
+                                  chunks[-1].t_stop,
+                                  chunks[0].annotations)
+
+    @staticmethod
+    def merge(parts):
+        """
+        Merges a list of compact spike trains of disjoint sets of neurons recorded over the same period of time.
+        """
+        ids = numpy.sort(numpy.concatenate([p.ids for p in parts]))
+        return CompactSpikeTrains(ids,
+                                  numpy.concatenate([p.times for p in parts]),
+                                  numpy.concatenate([numpy.searchsorted(ids, p.ids)[p.index] for p in parts]),
+                                  parts[0].t_start,
+                                  parts[0].t_stop,
+                                  parts[0].annotations)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def shift(self, offset):
+        """
+        Shifts all spike times and the start and the end of the recording by -`offset` ms.
+        """
+        self.times -= offset
+        self.t_start -= offset
+        self.t_stop -= offset
+
+    def select(self, ids):
+        """
+        Returns the compact spike trains restricted to the neurons with the given ids.
+        """
+        mask = numpy.in1d(self.ids, ids)
+        remap = numpy.cumsum(mask) - 1
+        spike_mask = mask[self.index]
+        return CompactSpikeTrains(self.ids[mask], self.times[spike_mask], remap[self.index[spike_mask]], self.t_start, self.t_stop, self.annotations)
+
+    def counts(self):
+        """
+        Returns the number of spikes of each neuron.
+        """
+        return numpy.diff(self.offsets)
+
+    def spiketrain(self, i):
+        """
+        Returns the spikes of the i-th neuron as neo SpikeTrain.
+        """
+        return SpikeTrain(self.times[self.offsets[i]:self.offsets[i + 1]].astype(numpy.float64),
+                          t_start=self.t_start * qt.ms,
+                          t_stop=self.t_stop * qt.ms,
+                          units=qt.ms,
+                          source_id=int(self.ids[i]),
+                          **self.annotations)
+
+    def spiketrains(self):
+        """
+        Returns the list of neo SpikeTrain objects, one per neuron.
+        """
+        return [self.spiketrain(i) for i in xrange(0, len(self.ids))]
+
+
+def load_segment(filename):
+    """
+    Loads a segment from a file. The file can either hold a single pickled segment, or a sequence of pickled 
+    segments each holding the data recorded during one window of a chunked recording 
+    (see :func:`mozaik.sheets.Sheet.write_data_chunk`), in which case these are concatenated into a single segment.
+    
+    Parameters
+    ----------
+    filename : str
+             The file to load.
+    
+    Returns
+    -------
+    segment : Segment
+            The loaded segment.
+    """
+    f = open(filename, 'rb')
+    chunks = []
+    while True:
+        try:
+            chunks.append(cPickle.load(f))
+        except EOFError:
+            break
+    f.close()
+    if len(chunks) == 1:
+        return chunks[0]
+    return concatenate_segments(chunks)
+
+
+def concatenate_segments(chunks):
+    """
+    Concatenates in time a list of segments holding consecutive windows of the same recording.
+    
+    Parameters
+    ----------
+    chunks : list
+           List of segments ordered in time. All are assumed to hold spike trains and analog signal arrays
+           of the same neurons in the same units.
+    
+    Returns
+    -------
+    segment : Segment
+            The first segment in `chunks` into which the spike trains (matched by their *source_id* annotation)
+            and analog signal arrays (matched by name and reduction) of all the segments have been concatenated.
+            Means and variances of reduced recordings (see :class:`mozaik.sheets.Sheet`) are merged rather than concatenated.
+    """
+    trains = collections.OrderedDict()
+    arrays = collections.OrderedDict()
+    for c in chunks:
+        for st in c.spiketrains:
+            trains.setdefault(st.annotations['source_id'], []).append(st)
+        for a in c.analogsignalarrays:
+            arrays.setdefault((a.name,a.annotations.get('reduction',None)), []).append(a)
+
+    s = chunks[0]
+    if getattr(s, 'compact_spiketrains', None) != None:
+        s.compact_spiketrains = CompactSpikeTrains.concatenate([c.compact_spiketrains for c in chunks])
+    s.spiketrains = [SpikeTrain(numpy.concatenate([st.magnitude for st in sts]),
+                                t_start=sts[0].t_start,
+                                t_stop=sts[-1].t_stop,
+                                units=sts[0].units,
+                                **sts[0].annotations) for sts in trains.values()]
+    s.analogsignalarrays = []
+    for asa in arrays.values():
+        annotations = asa[0].annotations.copy()
+        if annotations.get('reduction',None) in ('mean','var'):
+            # merge the means and variances of the chunks weighted by the number of samples they were computed from
+            samples = numpy.array([a.annotations['samples'] for a in asa],dtype=float)[:,numpy.newaxis]
+            if annotations['reduction'] == 'mean':
+                means = numpy.concatenate([a.magnitude for a in asa])
+                signal = numpy.sum(means * samples,axis=0) / numpy.sum(samples)
+            else:
+                means = numpy.concatenate([a.magnitude for a in arrays[(asa[0].name[:-len('_var')] + '_mean','mean')]])
+                mean = numpy.sum(means * samples,axis=0) / numpy.sum(samples)
+                signal = numpy.sum((numpy.concatenate([a.magnitude for a in asa]) + means**2) * samples,axis=0) / numpy.sum(samples) - mean**2
+            signal = signal[numpy.newaxis,:]
+            sampling_period = asa[0].sampling_period / asa[0].annotations['samples'] * numpy.sum(samples)
+            annotations['samples'] = int(numpy.sum(samples))
+        else:
+            signal = numpy.concatenate([a.magnitude for a in asa])
+            sampling_period = asa[0].sampling_period
+        s.analogsignalarrays.append(AnalogSignalArray(signal,
+                                                      units=asa[0].units,
+                                                      t_start=asa[0].t_start,
+                                                      sampling_period=sampling_period,
+                                                      name=asa[0].name,
+                                                      channel_index=asa[0].channel_index,
+                                                      **annotations))
+    return s
+
+
+def merge_segments(parts):
+    """
+    Merges a list of segments holding the recordings of disjoint sets of neurons over the same period of time
+    (e.g. the shards of a recording stored by different MPI processes, see :func:`mozaik.storage.datastore.PickledDataStore.merge_shards`).
+    
+    Parameters
+    ----------
+    parts : list
+          List of segments.
+    
+    Returns
+    -------
+    segment : Segment
+            The first segment in `parts` into which the spikes and analog signal arrays (matched by name and reduction) 
+            of all the segments have been merged, with neurons ordered by their ids.
+    """
+    arrays = collections.OrderedDict()
+    for p in parts:
+        for a in p.analogsignalarrays:
+            arrays.setdefault((a.name,a.annotations.get('reduction',None)), []).append(a)
+
+    s = parts[0]
+    if getattr(s, 'compact_spiketrains', None) != None:
+        s.compact_spiketrains = CompactSpikeTrains.merge([p.compact_spiketrains for p in parts if p.compact_spiketrains != None])
+    s.spiketrains = sorted(sum([list(p.spiketrains) for p in parts],[]),key=lambda st : st.annotations['source_id'])
+    s.analogsignalarrays = []
+    for asa in arrays.values():
+        annotations = asa[0].annotations.copy()
+        ids = numpy.concatenate([a.annotations['source_ids'] for a in asa])
+        order = numpy.argsort(ids)
+        annotations['source_ids'] = ids[order]
+        s.analogsignalarrays.append(AnalogSignalArray(numpy.hstack([a.magnitude for a in asa])[:,order],
+                                                      units=asa[0].units,
+                                                      t_start=asa[0].t_start,
+                                                      sampling_period=asa[0].sampling_period,
+                                                      name=asa[0].name,
+                                                      **annotations))
+    return s
+
+
 class MozaikSegment(Segment):
         """
         This class extends Neo segment with several convenience functions.
@@ -42,11 +304,24 @@ class MozaikSegment(Segment):
         def get_spiketrains(self):
             """
             Returns the list of SpikeTrain objects stored in this segment.
+            If the spikes are stored in the compact form, the SpikeTrain objects are created on the first call.
             """
             if not self.full:
                 self.load_full()
+            if self._spiketrains == None:
+                self._spiketrains = self._compact_spiketrains.spiketrains()
             return self._spiketrains
 
+        def get_compact_spiketrains(self):
+            """
+            Returns the spikes stored in this segment as :class:`.CompactSpikeTrains`.
+            """
+            if not self.full:
+                self.load_full()
+            if self._compact_spiketrains == None:
+                self._compact_spiketrains = CompactSpikeTrains.from_spiketrains(self._spiketrains)
+            return self._compact_spiketrains
+
         def set_spiketrains(self, s):
             if self.init:
                 self.init = False
@@ -68,13 +343,29 @@ class MozaikSegment(Segment):
             Returns
             -------
             A SpikeTrain object if neuron_id is int, or list of SpikeTrain objects if neuron_id is list, the order corresponds to the order in neuron_id argument.
+
+            Raises
+            ------
+            KeyError
+                   If no spike train is stored for (one of) the neuron(s).
             """
             
-            ids = [s.annotations['source_id'] for s in self.spiketrains]
+            if not self.full:
+                self.load_full()
+            if self._spiketrains != None:
+                ids = dict([(s.annotations['source_id'],i) for i,s in enumerate(self._spiketrains)])
+                get = lambda i : self._spiketrains[ids[i]]
+            else:
+                c = self._compact_spiketrains
+                def get(i):
+                    j = numpy.searchsorted(c.ids, i)
+                    if j >= len(c.ids) or c.ids[j] != i:
+                        raise KeyError(i)
+                    return c.spiketrain(j)
             if isinstance(neuron_id,list) or isinstance(neuron_id,numpy.ndarray):
-              return [self.spiketrains[ids.index(i)] for i in neuron_id]
+              return [get(i) for i in neuron_id]
             else:
-              return self.spiketrains[ids.index(neuron_id)]
+              return get(neuron_id)
 
         def get_vm(self, neuron_id):
             """
@@ -89,14 +380,17 @@ class MozaikSegment(Segment):
             Returns
             -------
             A AnalogSignal object if neuron_id is int, or list of AnalogSignal objects if neuron_id is list, the order corresponds to the order in neuron_id argument.
+
+            Raises
+            ------
+            ValueError
+                     If only reduced data (see :class:`mozaik.sheets.Sheet`) are stored for the neuron.
             """
 
             if not self.full:
                 self.load_full()
 
-            for a in self.analogsignalarrays:
-                if a.name == 'v':
-                    return a[:, a.annotations['source_ids'].tolist().index(neuron_id)]
+            return self._get_full_analog_signal('v', neuron_id)
 
         def get_esyn(self,neuron_id):
             """
@@ -111,12 +405,15 @@ class MozaikSegment(Segment):
             Returns
             -------
             A AnalogSignal object if neuron_id is int, or list of AnalogSignal objects if neuron_id is list, the order corresponds to the order in neuron_id argument.
+
+            Raises
+            ------
+            ValueError
+                     If only reduced data (see :class:`mozaik.sheets.Sheet`) are stored for the neuron.
             """
             if not self.full:
                 self.load_full()
-            for a in self.analogsignalarrays:
-                if a.name == 'gsyn_exc':
-                    return a[:, a.annotations['source_ids'].tolist().index(neuron_id)]
+            return self._get_full_analog_signal('gsyn_exc', neuron_id)
 
         def get_isyn(self,neuron_id):
             """
@@ -131,14 +428,135 @@ class MozaikSegment(Segment):
             Returns
             -------
             A AnalogSignal object if neuron_id is int, or list of AnalogSignal objects if neuron_id is list, the order corresponds to the order in neuron_id argument.
+
+            Raises
+            ------
+            ValueError
+                     If only reduced data (see :class:`mozaik.sheets.Sheet`) are stored for the neuron.
             """
 
             if not self.full:
                 self.load_full()
+            return self._get_full_analog_signal('gsyn_inh', neuron_id)
+
+        def _get_analog_signal(self, name, neuron_id):
+            """
+            Returns the signal of neuron `neuron_id` from the first analog signal array named `name` that holds it.
+            """
             for a in self.analogsignalarrays:
-                if a.name == 'gsyn_inh':
+                if a.name == name and neuron_id in a.annotations['source_ids']:
                     return a[:, a.annotations['source_ids'].tolist().index(neuron_id)]
 
+        def _get_full_analog_signal(self, name, neuron_id):
+            """
+            Returns the full (not reduced) recording of analog variable `name` of neuron `neuron_id`, raising ValueError
+            if only reduced data are stored for the neuron.
+            """
+            signal = self._get_analog_signal(name, neuron_id)
+            if signal is None:
+                for suffix, reduction in (('_mean', 'mean_var'), ('_downsampled', 'downsample')):
+                    if self._get_analog_signal(name + suffix, neuron_id) is not None:
+                        raise ValueError("Only the %s reduction of %s is stored for neuron %s" % (reduction, name, neuron_id))
+            return signal
+
+        def _get_stored_ids(self, name):
+            """
+            Returns ids of neurons for which an analog signal array named `name` is stored in this segment, or None if there is none.
+            """
+            ids = [a.annotations['source_ids'] for a in self.analogsignalarrays if a.name == name]
+            if len(ids) == 0:
+                return None
+            if len(ids) == 1:
+                return ids[0]
+            ids = numpy.concatenate(ids)
+            return ids[numpy.sort(numpy.unique(ids, return_index=True)[1])]
+
+        def get_spike_counts(self, neuron_id):
+            """
+            Returns the binned spike counts stored by a recording configuration with *spike_counts* reduction (see :class:`mozaik.sheets.Sheet`)
+            corresponding to neurons with id(s) listed in the `neuron_id` argument.
+            
+            Parameters
+            ----------
+            
+            neuron_id : int or list(int)
+                      An int or a list of ints containing the ids for which to return the spike counts.
+                      
+            Returns
+            -------
+            A AnalogSignal object if neuron_id is int, or list of AnalogSignal objects if neuron_id is list, the order corresponds to the order in neuron_id argument.
+            """
+            if not self.full:
+                self.load_full()
+            if isinstance(neuron_id,list) or isinstance(neuron_id,numpy.ndarray):
+              return [self._get_analog_signal('spike_counts', i) for i in neuron_id]
+            else:
+              return self._get_analog_signal('spike_counts', neuron_id)
+
+        def get_mean(self, variable, neuron_id):
+            """
+            Returns the mean of analog `variable` ('v', 'gsyn_exc' or 'gsyn_inh') stored by a recording configuration with *mean_var* reduction 
+            (see :class:`mozaik.sheets.Sheet`) for neuron with id `neuron_id`, as AnalogSignal with a single sample spanning the recording.
+            """
+            if not self.full:
+                self.load_full()
+            return self._get_analog_signal(variable + '_mean', neuron_id)
+
+        def get_variance(self, variable, neuron_id):
+            """
+            Returns the variance of analog `variable` ('v', 'gsyn_exc' or 'gsyn_inh') stored by a recording configuration with *mean_var* reduction 
+            (see :class:`mozaik.sheets.Sheet`) for neuron with id `neuron_id`, as AnalogSignal with a single sample spanning the recording.
+            """
+            if not self.full:
+                self.load_full()
+            return self._get_analog_signal(variable + '_var', neuron_id)
+
+        def get_downsampled(self, variable, neuron_id):
+            """
+            Returns the down-sampled analog `variable` ('v', 'gsyn_exc' or 'gsyn_inh') stored by a recording configuration with *downsample* 
+            reduction (see :class:`mozaik.sheets.Sheet`) for neuron with id `neuron_id`.
+            """
+            if not self.full:
+                self.load_full()
+            return self._get_analog_signal(variable + '_downsampled', neuron_id)
+
+        def get_stored_mean_ids(self, variable):
+            """
+            Returns ids of neurons for which the mean and variance of analog `variable` are stored in this segment, or None if there are none.
+            """
+            if not self.full:
+                self.load_full()
+            return self._get_stored_ids(variable + '_mean')
+
+        def get_stored_downsampled_ids(self, variable):
+            """
+            Returns ids of neurons for which down-sampled analog `variable` is stored in this segment, or None if there are none.
+            """
+            if not self.full:
+                self.load_full()
+            return self._get_stored_ids(variable + '_downsampled')
+
+        def get_stored_spike_count_ids(self):
+            """
+            Returns ids of neurons for which binned spike counts are stored in this segment.
+            """
+            if not self.full:
+                self.load_full()
+            return self._get_stored_ids('spike_counts')
+
+        def stores_only_spike_counts(self):
+            """
+            Returns whether only binned spike counts but no spike trains are stored in this segment.
+            The spike trains are counted without creating the SpikeTrain objects.
+            """
+            if not self.full:
+                self.load_full()
+            if self._compact_spiketrains != None:
+                n = len(self._compact_spiketrains.ids)
+            else:
+                n = len(self._spiketrains)
+            return n == 0 and self.get_stored_spike_count_ids() is not None
+
         def load_full(self):
             pass
 
@@ -146,7 +564,7 @@ class MozaikSegment(Segment):
             """
             Return number of stored neurons in this Segment.
             """
-            return len(self.spiketrains)
+            return len(self.get_stored_spike_train_ids())
         
         def get_stored_isyn_ids(self):
             """
@@ -154,9 +572,7 @@ class MozaikSegment(Segment):
             """
             if not self.full:
                 self.load_full()
-            for a in self.analogsignalarrays:
-                if a.name == 'gsyn_inh':
-                   return a.annotations['source_ids']
+            return self._get_stored_ids('gsyn_inh')
         
         def get_stored_esyn_ids(self):
             """
@@ -164,9 +580,7 @@ class MozaikSegment(Segment):
             """
             if not self.full:
                 self.load_full()
-            for a in self.analogsignalarrays:
-                if a.name == 'gsyn_exc':
-                   return a.annotations['source_ids']
+            return self._get_stored_ids('gsyn_exc')
 
         def get_stored_vm_ids(self):
             """
@@ -174,30 +588,34 @@ class MozaikSegment(Segment):
             """
             if not self.full:
                 self.load_full()
-            for a in self.analogsignalarrays:
-                if a.name == 'v':
-                   return a.annotations['source_ids']
+            return self._get_stored_ids('v')
 
         def get_stored_spike_train_ids(self):
             """
-            Returns ids of neurons for which spikes are stored in this segment.
+            Returns ids of neurons for which spikes are stored in this segment. If no spike trains but only 
+            binned spike counts are stored, the ids of neurons for which the spike counts are stored are returned.
             """
             
-            if not self.full:
-                self.load_full()
-            return [s.annotations['source_id'] for s in self.spiketrains]
+            ids = self.get_compact_spiketrains().ids
+            if len(ids) == 0 and self.get_stored_spike_count_ids() is not None:
+                return list(self.get_stored_spike_count_ids())
+            return ids.tolist()
 
         def mean_rates(self):
             """
-            Returns the mean rates of the spiketrains in spikes/s.
+            Returns the mean rates of the spiketrains (or binned spike counts if no spike trains are stored) in spikes/s.
             """
-            return [len(s)/(s.t_stop.rescale(qt.s).magnitude-s.t_start.rescale(qt.s).magnitude) for s in self.spiketrains]
+            c = self.get_compact_spiketrains()
+            if len(c) == 0 and self.get_stored_spike_count_ids() is not None:
+                return [numpy.sum(sc.magnitude)/(sc.t_stop.rescale(qt.s).magnitude-sc.t_start.rescale(qt.s).magnitude) for sc in self.get_spike_counts(self.get_stored_spike_count_ids())]
+            return (c.counts() / ((c.t_stop - c.t_start) / 1000.0)).tolist()
 
         def isi(self):
             """
             Returns an array containing arrays (one per each neurons) with the inter-spike intervals of the SpikeTrain objects.
             """
-            return [numpy.diff(s) for s in self.spiketrains]
+            c = self.get_compact_spiketrains()
+            return [numpy.diff(c.times[c.offsets[i]:c.offsets[i+1]].astype(numpy.float64)) * qt.ms for i in xrange(0, len(c))]
 
         def cv_isi(self):
             """
@@ -234,10 +652,11 @@ class PickledDataStoreNeoWrapper(MozaikSegment):
             self.datastore_path = datastore_path
 
         def load_full(self):
-            f = open(self.datastore_path + '/' + self.identifier + ".pickle", 'rb')
-            s = cPickle.load(f)
-            f.close()
-            self._spiketrains = s.spiketrains
+            self._set_data(load_segment(self.datastore_path + '/' + self.identifier + ".pickle"))
+
+        def _set_data(self, s):
+            self._compact_spiketrains = getattr(s, 'compact_spiketrains', None)
+            self._spiketrains = s.spiketrains if self._compact_spiketrains == None else None
             self.analogsignalarrays = s.analogsignalarrays
             self.full = True
 
@@ -245,10 +664,27 @@ class PickledDataStoreNeoWrapper(MozaikSegment):
             result = self.__dict__.copy()
             if self.full:
                 del result['_spiketrains']
+                del result['_compact_spiketrains']
                 del result['analogsignalarrays']
             return result
         
         def release(self):
             self.full = False
             del self._spiketrains
+            del self._compact_spiketrains
             del self.analogsignalarrays
+
+
+class ShardedDataStoreNeoWrapper(PickledDataStoreNeoWrapper):
+        """
+        This is a Mozaik wrapper of neo segment whose data are split into several shards (one per each MPI process 
+        that ran the simulation), each stored in a different sub-directory of the data store. The shards are merged when loaded.
+        """    
+
+        def __init__(self, segment, identifier, datastore_path, shards, null=False):
+            PickledDataStoreNeoWrapper.__init__(self, segment, identifier, datastore_path, null)
+            # the sub-directories of the data store holding the shards
+            self.shards = shards
+
+        def load_full(self):
+            self._set_data(merge_segments([load_segment(os.path.join(self.datastore_path, d, self.identifier + ".pickle")) for d in self.shards]))
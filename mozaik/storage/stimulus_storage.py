@@ -0,0 +1,163 @@
+"""
+This module implements the compact storage of the raw sensory stimuli (e.g. the retinal input movies) in the datastore.
+"""
+
+import numpy
+from parameters import ParameterSet
+import mozaik
+from mozaik.core import ParametrizedObject
+
+logger = mozaik.getMozaikLogger()
+
+
+class StimulusStoragePolicy(ParametrizedObject):
+    """
+    Specifies how the raw sensory stimulus (a sequence of 2D frames) presented during an experiment is stored in the datastore.
+    An experiment stores its sensory stimuli according to its `stimulus_storage` policy (see :class:`mozaik.experiments.Experiment`).
+
+    Other parameters
+    ----------------
+    encoding : str
+             The encoding of the frame values. One of:
+
+             'float64' - stored as they are
+             'float16' - stored as half precision floats
+             'uint8' - linearly quantized to 256 levels spanning the range of the values in the stimulus
+
+    temporal_subsampling : int
+                         Only every `temporal_subsampling`-th frame is stored.
+
+    spatial_downsampling : int
+                         Each block of `spatial_downsampling` x `spatial_downsampling` pixels is stored as its mean.
+
+    Notes
+    -----
+    The stored stimulus is decoded back to frames of the original number and size, holding each stored frame
+    for `temporal_subsampling` frames and each stored pixel over its block.
+    """
+
+    required_parameters = ParameterSet({
+        'encoding': str,
+        'temporal_subsampling': int,
+        'spatial_downsampling': int,
+    })
+
+    encodings = ('float64', 'float16', 'uint8')
+
+    def __init__(self, parameters):
+        ParametrizedObject.__init__(self, parameters)
+        assert self.parameters.encoding in self.encodings, "Unknown stimulus encoding %s, supported are %s" % (self.parameters.encoding, self.encodings)
+        assert self.parameters.temporal_subsampling >= 1, "temporal_subsampling has to be at least 1"
+        assert self.parameters.spatial_downsampling >= 1, "spatial_downsampling has to be at least 1"
+
+    def encode(self, frames):
+        """
+        Encodes the sequence of frames `frames` according to the policy.
+
+        Parameters
+        ----------
+        frames : list(ndarray)
+               The 2D frames of the sensory stimulus.
+
+        Returns
+        -------
+        The :class:`.EncodedStimulus` holding the frames.
+        """
+        frames = list(frames)
+        if len(frames) == 0:
+            return EncodedStimulus(numpy.zeros((0, 0, 0)), 0, (0, 0), 1.0, 0.0, 1, 1)
+        shape = numpy.shape(frames[0])
+        ts = int(self.parameters.temporal_subsampling)
+        k = int(self.parameters.spatial_downsampling)
+
+        data = numpy.array(frames[::ts], dtype=float)
+        if k > 1:
+            n, rows, cols = data.shape
+            r, c = -(-rows // k), -(-cols // k)
+            data = numpy.pad(data, ((0, 0), (0, r*k - rows), (0, c*k - cols)), mode='edge')
+            data = data.reshape(n, r, k, c, k).mean(axis=4).mean(axis=2)
+
+        scale, offset = 1.0, 0.0
+        if self.parameters.encoding == 'float16':
+            data = data.astype(numpy.float16)
+        elif self.parameters.encoding == 'uint8':
+            offset = float(data.min())
+            if data.max() > offset:
+                scale = (float(data.max()) - offset) / 255.0
+            data = numpy.around((data - offset) / scale).astype(numpy.uint8)
+
+        return EncodedStimulus(data, len(frames), shape, scale, offset, ts, k)
+
+
+class EncodedStimulus(object):
+    """
+    A sensory stimulus stored according to a :class:`.StimulusStoragePolicy`.
+
+    It behaves as the (read-only) sequence of the decoded frames, so it can be used in place of the list of frames.
+    Frames are decoded on access; use :func:`.decode` to obtain all of them at once.
+
+    Parameters
+    ----------
+    data : ndarray
+         The (stored frame, row, column) array of the encoded frames.
+
+    length : int
+           The number of frames of the original stimulus.
+
+    shape : tuple
+          The shape of the frames of the original stimulus.
+
+    scale, offset : float
+                  The decoded values are data * scale + offset.
+
+    temporal_subsampling : int
+                         The number of original frames per stored frame.
+
+    spatial_downsampling : int
+                         The size of the block of original pixels per stored pixel.
+    """
+
+    def __init__(self, data, length, shape, scale, offset, temporal_subsampling, spatial_downsampling):
+        self.data = data
+        self.length = length
+        self.shape = tuple(shape)
+        self.scale = scale
+        self.offset = offset
+        self.temporal_subsampling = temporal_subsampling
+        self.spatial_downsampling = spatial_downsampling
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in xrange(*i.indices(self.length))]
+        if i < 0:
+            i += self.length
+        if not 0 <= i < self.length:
+            raise IndexError("frame index out of range")
+        frame = self.data[i // self.temporal_subsampling].astype(float)
+        if self.scale != 1.0:
+            frame *= self.scale
+        if self.offset != 0.0:
+            frame += self.offset
+        k = self.spatial_downsampling
+        if k > 1:
+            frame = numpy.repeat(numpy.repeat(frame, k, axis=0), k, axis=1)[:self.shape[0], :self.shape[1]]
+        return frame
+
+    def __iter__(self):
+        for i in xrange(self.length):
+            yield self[i]
+
+    def decode(self):
+        """
+        Returns the list of the decoded frames.
+        """
+        return list(self)
+
+    def nbytes(self):
+        """
+        Returns the number of bytes occupied by the encoded frames.
+        """
+        return self.data.nbytes
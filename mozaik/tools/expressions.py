@@ -0,0 +1,156 @@
+"""
+This module contains a compiler of the arithmetic expressions given as strings in parameter files
+(e.g. the weight and delay expressions of :class:`mozaik.connectors.modular.ModularConnector`).
+"""
+import ast
+import numpy
+import mozaik
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+logger = mozaik.getMozaikLogger()
+
+# The numpy functions that can be called in the expressions, either by their name or as numpy.name (np.name).
+functions = ('exp', 'log', 'log10', 'sqrt', 'sin', 'cos', 'tan', 'arcsin', 'arccos', 'arctan', 'arctan2',
+             'sinh', 'cosh', 'tanh', 'abs', 'absolute', 'power', 'minimum', 'maximum', 'where', 'sign', 'floor', 'ceil')
+
+# The constants that can be used in the expressions.
+constants = {'pi': numpy.pi, 'e': numpy.e}
+
+# The subset of the functions that numexpr supports under the same name.
+numexpr_functions = ('exp', 'log', 'log10', 'sqrt', 'sin', 'cos', 'tan', 'arcsin', 'arccos', 'arctan', 'arctan2',
+                     'sinh', 'cosh', 'tanh', 'abs', 'where')
+
+_operators = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.Mod, ast.USub, ast.UAdd,
+              ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE)
+
+
+class Expression(object):
+    """
+    An arithmetic expression over named variables, parsed and checked once and compiled into a reusable callable.
+
+    The expression can only contain numbers, variables, the constants in `constants`, arithmetic operators,
+    comparisons and calls of the numpy functions listed in `functions` (called either by their name or as numpy.name),
+    so that expressions given in parameter files cannot execute arbitrary code. As the functions are numpy ufuncs,
+    the expression is evaluated element-wise over arrays.
+
+    Parameters
+    ----------
+    expression : str
+               The expression.
+
+    numexpr_threshold : int, optional
+                      If numexpr is installed and supports the expression, it is used to evaluate it whenever one
+                      of the variables has at least this many elements.
+
+    Raises
+    ------
+    ValueError
+             If the expression contains a construct that is not allowed.
+
+    Examples
+    --------
+    >>> e = Expression('f1*exp(-f2/2)')
+    >>> e.names
+    ['f1', 'f2']
+    >>> e(f1=numpy.ones(3), f2=numpy.zeros(3))
+    array([1., 1., 1.])
+    """
+
+    def __init__(self, expression, numexpr_threshold=2**16):
+        self.expression = expression
+        self.numexpr_threshold = numexpr_threshold
+        try:
+            tree = ast.parse(expression.strip(), mode='eval')
+        except SyntaxError as e:
+            raise ValueError("Invalid expression '%s': %s" % (expression, e))
+        self.names = []
+        self._numexpr_compatible = True
+        self._check(tree.body)
+        self._code = compile(tree, '<expression>', 'eval', 0, True)
+        self._namespace = dict(constants)
+        self._namespace['__builtins__'] = {}
+        for f in functions:
+            self._namespace[f] = getattr(numpy, f)
+        self._namespace['numpy'] = self._namespace['np'] = _NumpyFunctions()
+
+    def _invalid(self, node, what):
+        raise ValueError("Invalid expression '%s': %s is not allowed" % (self.expression, what))
+
+    def _check(self, node):
+        """
+        Checks that `node` contains only the allowed constructs, and collects the names of the variables.
+        """
+        if isinstance(node, ast.Num):
+            return
+        if isinstance(node, ast.Name):
+            if node.id in functions or node.id in ('numpy', 'np'):
+                self._invalid(node, "use of the function '%s' other than calling it" % node.id)
+            if node.id not in constants and node.id not in self.names:
+                self.names.append(node.id)
+            return
+        if isinstance(node, ast.BinOp):
+            if not isinstance(node.op, _operators):
+                self._invalid(node, "the operator %s" % node.op.__class__.__name__)
+            if isinstance(node.op, ast.Mod):
+                # numexpr's modulo of negative numbers differs from numpy's
+                self._numexpr_compatible = False
+            self._check(node.left)
+            self._check(node.right)
+            return
+        if isinstance(node, ast.UnaryOp):
+            if not isinstance(node.op, _operators):
+                self._invalid(node, "the operator %s" % node.op.__class__.__name__)
+            self._check(node.operand)
+            return
+        if isinstance(node, ast.Compare):
+            for op in node.ops:
+                if not isinstance(op, _operators):
+                    self._invalid(node, "the comparison %s" % op.__class__.__name__)
+            if len(node.ops) > 1:
+                # chained comparisons are not element-wise
+                self._invalid(node, "chained comparison")
+            self._check(node.left)
+            for c in node.comparators:
+                self._check(c)
+            return
+        if isinstance(node, ast.Call):
+            f = node.func
+            if isinstance(f, ast.Name) and f.id in functions:
+                name = f.id
+            elif isinstance(f, ast.Attribute) and isinstance(f.value, ast.Name) and f.value.id in ('numpy', 'np') and f.attr in functions:
+                name = f.attr
+                # numexpr does not understand the numpy prefix
+                self._numexpr_compatible = False
+            else:
+                self._invalid(node, "calling anything else than %s" % ', '.join(functions))
+            if node.keywords or getattr(node, 'starargs', None) or getattr(node, 'kwargs', None):
+                self._invalid(node, "passing keyword or variable arguments")
+            if name not in numexpr_functions:
+                self._numexpr_compatible = False
+            for a in node.args:
+                self._check(a)
+            return
+        self._invalid(node, node.__class__.__name__)
+
+    def __call__(self, **variables):
+        """
+        Evaluates the expression with the given values of the variables.
+        """
+        if numexpr != None and self._numexpr_compatible and max([numpy.size(v) for v in variables.values()] + [0]) >= self.numexpr_threshold:
+            local_dict = dict(constants)
+            local_dict.update(variables)
+            return numexpr.evaluate(self.expression.strip(), local_dict=local_dict, global_dict={})
+        return eval(self._code, self._namespace, variables)
+
+
+class _NumpyFunctions(object):
+    """
+    Stands for the numpy module in the expressions, exposing only the allowed functions.
+    """
+    def __init__(self):
+        for f in functions:
+            setattr(self, f, getattr(numpy, f))
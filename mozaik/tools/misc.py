@@ -19,6 +19,15 @@ def sample_from_bin_distribution(bins, number_of_samples):
       
     number_of_samples : int
                       Number of samples to generate.
+    
+    Returns
+    -------
+    The ndarray of the indexes of the sampled bins.
+    
+    Notes
+    -----
+    The samples are drawn by inverting the cumulative distribution of the bins at `number_of_samples` 
+    uniform random numbers drawn with numpy.random.rand.
     """
     if len(bins) == 0:
         return []
@@ -28,11 +37,59 @@ def sample_from_bin_distribution(bins, number_of_samples):
     # create the cumulative sum
     cs = numpy.cumsum(bins)
     samples = numpy.random.rand(number_of_samples)
-    si = []
-    for s in samples:
-        si.append(numpy.nonzero(s < cs)[0][0])
+    return _invert_cumulative_distribution(bins, cs, samples)
+
+
+def sample_from_bin_distributions(bins, number_of_samples):
+    """
+    The batched version of :func:`.sample_from_bin_distribution`, sampling from the distributions 
+    defined by each of the rows of the matrix `bins`. 
+    
+    Parameters
+    ----------
+    
+    bins : ndarray
+         The 2D array whose rows define the bin distributions.
+      
+    number_of_samples : int
+                      Number of samples to generate from each distribution.
+    
+    Returns
+    -------
+    The (rows, number_of_samples) ndarray of the indexes of the sampled bins, or an empty (rows, 0) ndarray if `bins` has no columns.
+    
+    Notes
+    -----
+    The random numbers are drawn with a single call numpy.random.rand(rows, number_of_samples), so the samples 
+    are the same as those obtained by calling :func:`.sample_from_bin_distribution` on each of the rows in turn.
+    """
+    bins = numpy.asarray(bins, dtype=float)
+    rows, columns = bins.shape
+    if columns == 0:
+        return numpy.zeros((rows, 0), dtype=int)
 
-    return si
+    bins = bins / numpy.sum(bins, axis=1)[:, numpy.newaxis]
+    
+    # create the row-wise cumulative sums
+    cs = numpy.cumsum(bins, axis=1)
+    samples = numpy.random.rand(rows, number_of_samples)
+    # shifting each row (and its samples) by twice its index keeps the flattened cumulative sums sorted even when 
+    # rounding takes the total of a row slightly above 1, so all the rows are inverted with a single searchsorted
+    offsets = 2.0 * numpy.arange(rows)[:, numpy.newaxis]
+    si = numpy.searchsorted((cs + offsets).ravel(), (samples + offsets).ravel(), side='right').reshape(rows, number_of_samples)
+    si -= numpy.arange(rows)[:, numpy.newaxis] * columns
+    # due to rounding the total cumulative probability can be slightly below 1
+    last = columns - 1 - numpy.argmax(bins[:, ::-1] != 0, axis=1)
+    return numpy.minimum(si, last[:, numpy.newaxis])
+
+
+def _invert_cumulative_distribution(bins, cs, samples):
+    """
+    Returns the indexes of the first bins whose cumulative probability `cs` exceeds `samples`.
+    """
+    si = numpy.searchsorted(cs, samples, side='right')
+    # due to rounding the total cumulative probability can be slightly below 1
+    return numpy.minimum(si, numpy.flatnonzero(bins)[-1])
 
 _normal_function_sqertofpi = sqrt(2*pi)
 def normal_function(x, mean=0, sigma=1.0):
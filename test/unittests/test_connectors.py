@@ -1,8 +1,16 @@
 import unittest
-from mozaik.connectors import vision
+from mozaik.connectors import vision, ConnectionList
+from mozaik.connectors import modular_connector_functions
+from mozaik.connectors.modular import ModularConnector, ModularSamplingProbabilisticConnector, ModularSingleWeightProbabilisticConnector
+from mozaik.tools.expressions import Expression
+from parameters import ParameterSet
 import numpy
 import numpy.linalg
 import logging
+import os
+import pickle
+import shutil
+import tempfile
 
 class TestV1CorrelationBasedConnectivity(unittest.TestCase):
     def setUp(self):
@@ -102,6 +110,29 @@ class TestV1CorrelationBasedConnectivity(unittest.TestCase):
 class TestConnector(unittest.TestCase):
     pass
 
+class TestConnectionList(unittest.TestCase):
+    def test_array(self):
+        cl = ConnectionList()
+        cl.append(numpy.arange(3)[numpy.newaxis,:], numpy.array([4,7])[:,numpy.newaxis], numpy.ones((2,3)), 0.5)
+        cl.append([], [], [], [])
+        cl.append(2, 1, 0.25, 1.5)
+        self.assertEqual(len(cl), 7)
+        a = cl.array()
+        self.assertEqual(a.shape, (7,4))
+        numpy.testing.assert_array_equal(a[:,0], [0,1,2,0,1,2,2])
+        numpy.testing.assert_array_equal(a[:,1], [4,4,4,7,7,7,1])
+        numpy.testing.assert_array_equal(a[-1,2:], [0.25,1.5])
+        self.assertEqual(a.dtype, numpy.float32)
+        self.assertEqual(len(cl), 0)
+
+    def test_array_large_indexes(self):
+        # indexes that float32 cannot represent exactly are returned in float64
+        cl = ConnectionList()
+        cl.append(2**24+1, [0,1], 0.5, 1.0)
+        a = cl.array()
+        self.assertEqual(a.dtype, numpy.float64)
+        numpy.testing.assert_array_equal(a[:,0], [2**24+1]*2)
+
 class TestMozaikConnector(unittest.TestCase):
     pass
 
@@ -133,52 +164,300 @@ class TestModularConnectorFunction(unittest.TestCase):
     pass
 
 
-class TestConstantModularConnectorFunction(unittest.TestCase):
-    pass
+class _Population(object):
 
+    def __init__(self, size, rng):
+        self.size = size
+        self.positions = rng.uniform(-1.0, 1.0, (3, size))
+        self._mask_local = numpy.ones(size, dtype=bool)
 
-class TestPyNNDistributionConnectorFunction(unittest.TestCase):
-    pass
+    def __len__(self):
+        return self.size
 
 
-class TestDistanceDependentModularConnectorFunction(unittest.TestCase):
-    pass
+class _Sheet(object):
+    """
+    Stands for a sheet with randomly placed neurons annotated with random afferent gabor parameters.
+    """
 
+    def __init__(self, size, rng):
+        self.pop = _Population(size, rng)
+        self.annotations = [{'LGNAfferentOrientation': rng.uniform(0, numpy.pi),
+                             'LGNAfferentPhase': rng.uniform(0, 2*numpy.pi),
+                             'LGNAfferentAspectRatio': rng.uniform(0.2, 1.0),
+                             'LGNAfferentFrequency': rng.uniform(0.5, 1.0),
+                             'LGNAfferentSize': rng.uniform(0.1, 0.5),
+                             'LGNAfferentX': rng.uniform(-1.0, 1.0),
+                             'LGNAfferentY': rng.uniform(-1.0, 1.0)} for i in xrange(size)]
 
-class TestGaussianDecayModularConnectorFunction(unittest.TestCase):
-    pass
+    def get_neuron_annotation(self, index, key):
+        return self.annotations[index][key]
 
+    def add_neuron_annotation(self, index, key, value, protected):
+        self.annotations[index][key] = value
 
-class TestExponentialDecayModularConnectorFunction(unittest.TestCase):
-    pass
+    def dvf_2_dcs(self, distance):
+        return distance * 1000.0
 
+    def size_in_degrees(self):
+        return (2.0, 2.0)
 
-class TestLinearModularConnectorFunction(unittest.TestCase):
-    pass
 
+def distances(source, target):
+    """
+    The (target, source) matrix of the distances between the neurons in the native coordinates of the target sheet.
+    """
+    return target.dvf_2_dcs(numpy.sqrt((source.pop.positions[0][numpy.newaxis, :] - target.pop.positions[0][:, numpy.newaxis])**2 +
+                                       (source.pop.positions[1][numpy.newaxis, :] - target.pop.positions[1][:, numpy.newaxis])**2))
 
-class TestHyperbolicModularConnectorFunction(unittest.TestCase):
-    pass
 
+class ModularConnectorFunctionTestCase(unittest.TestCase):
+    """
+    Base of the tests of the modular connector functions, with a source and a target sheet.
+    """
+    indices = [3, 5, 0, 19, 7]
+
+    def setUp(self):
+        rng = numpy.random.RandomState(0)
+        self.source = _Sheet(50, rng)
+        self.target = _Sheet(20, rng)
+
+    def assertBlockMatchesEvaluate(self, function):
+        """
+        Checks that evaluate_block gives the same weights as evaluating the target neurons one by one, and as evaluate_pairs.
+        """
+        block = function.evaluate_block(self.indices)
+        self.assertEqual(block.shape, (len(self.indices), self.source.pop.size))
+        numpy.testing.assert_allclose(block, [function.evaluate(i) for i in self.indices], rtol=1e-12, atol=1e-15)
+        # and for any pairs of neurons
+        rows, sources = numpy.nonzero(numpy.ones(block.shape))
+        numpy.testing.assert_allclose(function.evaluate_pairs(self.indices, rows, sources), block.ravel(), rtol=1e-12, atol=1e-15)
 
-class TestMapDependentModularConnectorFunction(unittest.TestCase):
+
+class TestConstantModularConnectorFunction(ModularConnectorFunctionTestCase):
+
+    def test_evaluate_block(self):
+        self.assertBlockMatchesEvaluate(modular_connector_functions.ConstantModularConnectorFunction(self.source, self.target, ParameterSet({})))
+
+
+class TestPyNNDistributionConnectorFunction(unittest.TestCase):
     pass
 
 
-class TestV1PushPullArborization(unittest.TestCase):
+class TestDistanceDependentModularConnectorFunction(ModularConnectorFunctionTestCase):
+
+    functions = {'GaussianDecayModularConnectorFunction': {'arborization_constant': 300.0, 'arborization_scaler': 1.0},
+                 'ExponentialDecayModularConnectorFunction': {'arborization_constant': 300.0, 'arborization_scaler': 2.0},
+                 'LinearModularConnectorFunction': {'constant_scaler': 1.0, 'linear_scaler': -0.0005},
+                 'HyperbolicModularConnectorFunction': {'alpha': 0.01, 'theta': 100.0}}
+
+    def function(self, name, **parameters):
+        parameters.update(self.functions[name])
+        return getattr(modular_connector_functions, name)(self.source, self.target, ParameterSet(parameters))
+
+    def test_evaluate_block(self):
+        for name in self.functions:
+            self.assertBlockMatchesEvaluate(self.function(name))
+            self.assertBlockMatchesEvaluate(self.function(name, cutoff_distance=600.0))
+
+    def test_cutoff(self):
+        inside = distances(self.source, self.target) <= 600.0
+        self.assertTrue(0 < inside.sum() < inside.size / 2)
+        for name in self.functions:
+            dense = self.function(name).evaluate_block(range(20))
+            self.assertEqual(self.function(name).evaluate_sparse_block(range(20)), None)
+            function = self.function(name, cutoff_distance=600.0)
+            # the weights are the same within the cutoff and zero beyond it
+            block = function.evaluate_block(range(20))
+            numpy.testing.assert_allclose(block[inside], dense[inside], rtol=1e-12)
+            numpy.testing.assert_equal(block[~inside], 0)
+            # only the pairs within the cutoff are stored
+            sparse = function.evaluate_sparse_block(self.indices)
+            self.assertEqual(sparse.shape, (len(self.indices), 50))
+            self.assertEqual(sparse.nnz, inside[self.indices].sum())
+            numpy.testing.assert_equal(sparse.toarray() != 0, inside[self.indices] & (dense[self.indices] != 0))
+            numpy.testing.assert_allclose(sparse.toarray(), block[self.indices], rtol=1e-12)
+
+
+class TestGaussianDecayModularConnectorFunction(unittest.TestCase):
     pass
 
 
-class TestModularConnector(unittest.TestCase):
+class TestExponentialDecayModularConnectorFunction(unittest.TestCase):
     pass
 
 
-class TestModularSamplingProbabilisticConnector(unittest.TestCase):
+class TestLinearModularConnectorFunction(unittest.TestCase):
     pass
 
 
-class TestModularSingleWeightProbabilisticConnector(unittest.TestCase):
+class TestHyperbolicModularConnectorFunction(unittest.TestCase):
     pass
 
+
+class TestMapDependentModularConnectorFunction(ModularConnectorFunctionTestCase):
+
+    def setUp(self):
+        ModularConnectorFunctionTestCase.setUp(self)
+        self.directory = tempfile.mkdtemp()
+        self.map_location = os.path.join(self.directory, 'map.pickle')
+        with open(self.map_location, 'w') as f:
+            pickle.dump(numpy.random.RandomState(1).rand(10, 10), f)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_evaluate_block(self):
+        for periodic in (True, False):
+            function = vision.MapDependentModularConnectorFunction(self.source, self.target, ParameterSet({'map_location': self.map_location, 'sigma': 0.2, 'periodic': periodic}))
+            self.assertBlockMatchesEvaluate(function)
+            # both annotate the target neurons with the map values
+            orientations = [self.target.get_neuron_annotation(i, 'LGNAfferentOrientation') for i in self.indices]
+            function.evaluate_block(self.indices)
+            self.assertEqual([self.target.get_neuron_annotation(i, 'LGNAfferentOrientation') for i in self.indices], orientations)
+
+
+class TestV1PushPullArborization(ModularConnectorFunctionTestCase):
+
+    def test_evaluate_block(self):
+        for target_synapses in ('excitatory', 'inhibitory'):
+            self.assertBlockMatchesEvaluate(vision.V1PushPullArborization(self.source, self.target, ParameterSet({'or_sigma': 0.5, 'phase_sigma': 0.5, 'target_synapses': target_synapses, 'push_pull_ratio': 0.5})))
+
+
+class TestGaborArborization(ModularConnectorFunctionTestCase):
+
+    def test_evaluate_block(self):
+        for on in (True, False):
+            self.assertBlockMatchesEvaluate(vision.GaborArborization(self.source, self.target, ParameterSet({'ON': on})))
+
+
+class _Simulator(object):
+
+    def FromListConnector(self, connection_list):
+        self.connection_list = connection_list
+
+    def Projection(self, *args, **kwargs):
+        pass
+
+
+class _RandomModularConnectorFunction(modular_connector_functions.ModularConnectorFunction):
+    """
+    A random function without its own evaluate_block.
+    """
+
+    def evaluate(self, index):
+        return numpy.random.rand(len(self.source.pop))
+
+
+class ModularConnectorTestCase(ModularConnectorFunctionTestCase):
+    """
+    Base of the tests of the modular connectors, connecting the source and target sheets with gaussian and push-pull weights.
+    """
+
+    def connector(self, connector_type, cutoff_distance=None, parameters={}):
+        gaussian = {'arborization_constant': 300.0, 'arborization_scaler': 1.0}
+        if cutoff_distance != None:
+            gaussian['cutoff_distance'] = cutoff_distance
+        connector = connector_type.__new__(connector_type)
+        connector.source, connector.target = self.source, self.target
+        connector.name = 'connector'
+        connector.parameters = ParameterSet(dict(parameters, target_synapses='excitatory'))
+        connector.sim = _Simulator()
+        connector.init_synaptic_mechanisms = lambda: None
+        connector.weight_scaler = 2.0
+        connector.simulator_time_step = 0.1
+        connector.weight_expression = Expression('f1*f2+0.1')
+        connector.weight_function_names = connector.weight_expression.names
+        connector.delay_expression = Expression('f3/100.0+0.5')
+        connector.delay_function_names = connector.delay_expression.names
+        connector.weight_functions = {'f1': modular_connector_functions.GaussianDecayModularConnectorFunction(self.source, self.target, ParameterSet(gaussian)),
+                                      'f2': vision.V1PushPullArborization(self.source, self.target, ParameterSet({'or_sigma': 0.5, 'phase_sigma': 0.5, 'target_synapses': 'inhibitory', 'push_pull_ratio': 0.5}))}
+        connector.delay_functions = {'f3': modular_connector_functions.HyperbolicModularConnectorFunction(self.source, self.target, ParameterSet({'alpha': 0.01, 'theta': 100.0}))}
+        connector.block_size = 120
+        return connector
+
+    def connections(self, connector):
+        """
+        Connects and returns the (target, source) matrices of the connected pairs, and of their weights and delays.
+        """
+        connector._connect()
+        cl = numpy.array(connector.sim.connection_list)
+        connected = numpy.zeros((20, 50), dtype=bool)
+        weights, delays = numpy.zeros((20, 50)), numpy.zeros((20, 50))
+        sources, targets = cl[:, 0].astype(int), cl[:, 1].astype(int)
+        connected[targets, sources] = True
+        weights[targets, sources] = cl[:, 2]
+        delays[targets, sources] = cl[:, 3]
+        self.assertEqual(connected.sum(), len(cl))
+        return connected, weights, delays
+
+    def inside(self, cutoff_distance):
+        return distances(self.source, self.target) <= cutoff_distance
+
+
+class TestModularConnector(ModularConnectorTestCase):
+
+    def test_block_weights_and_delays(self):
+        connector = self.connector(ModularConnector)
+        self.assertEqual([len(b) for b in connector._target_blocks()], [2] * 10)
+        self.assertEqual(connector._obtain_sparse_block(numpy.arange(20)), None)
+        weights, delays = connector._obtain_block(range(20))
+        numpy.testing.assert_allclose(weights, [connector._obtain_weights(i) for i in xrange(20)], rtol=1e-12)
+        numpy.testing.assert_allclose(delays, [connector._obtain_delays(i) for i in xrange(20)], rtol=1e-12)
+
+    def test_random_functions_interleaved(self):
+        # the random functions draw the same numbers for the weights and the delays as when evaluated target by target
+        connector = self.connector(ModularConnector)
+        connector.weight_functions['f2'] = _RandomModularConnectorFunction(self.source, self.target, ParameterSet({}))
+        connector.delay_functions['f3'] = _RandomModularConnectorFunction(self.source, self.target, ParameterSet({}))
+        numpy.random.seed(1)
+        expected = [(connector._obtain_weights(i), connector._obtain_delays(i)) for i in xrange(20)]
+        numpy.random.seed(1)
+        weights, delays = connector._obtain_block(range(20))
+        numpy.testing.assert_allclose(weights, [w for w, d in expected], rtol=1e-12)
+        numpy.testing.assert_allclose(delays, [d for w, d in expected], rtol=1e-12)
+        # as does the sparse evaluation for the pairs within the cutoff
+        connector = self.connector(ModularConnector, cutoff_distance=600.0)
+        connector.weight_functions['f2'] = _RandomModularConnectorFunction(self.source, self.target, ParameterSet({}))
+        connector.delay_functions['f3'] = _RandomModularConnectorFunction(self.source, self.target, ParameterSet({}))
+        numpy.random.seed(1)
+        rows, sources, weights, delays = connector._obtain_sparse_block(numpy.arange(20))
+        numpy.testing.assert_allclose(weights, numpy.array([w for w, d in expected])[rows, sources], rtol=1e-12)
+        numpy.testing.assert_allclose(delays, numpy.array([d for w, d in expected])[rows, sources], rtol=1e-12)
+
+    def test_cutoff(self):
+        inside = self.inside(600.0)
+        connected, weights, delays = self.connections(self.connector(ModularConnector))
+        self.assertTrue(connected.all())
+        # with the cutoff only the pairs within it are connected, with the same weights and delays
+        connected_cutoff, weights_cutoff, delays_cutoff = self.connections(self.connector(ModularConnector, cutoff_distance=600.0))
+        numpy.testing.assert_equal(connected_cutoff, inside)
+        numpy.testing.assert_allclose(weights_cutoff[inside], weights[inside], rtol=1e-6)
+        numpy.testing.assert_allclose(delays_cutoff[inside], delays[inside], rtol=1e-6)
+
+
+class TestModularSamplingProbabilisticConnector(ModularConnectorTestCase):
+
+    def test_cutoff(self):
+        inside = self.inside(600.0)
+        numpy.random.seed(0)
+        connected, weights, delays = self.connections(self.connector(ModularSamplingProbabilisticConnector, cutoff_distance=600.0, parameters={'num_samples': 30, 'base_weight': 0.5}))
+        # the samples are drawn only from the pairs within the cutoff
+        self.assertTrue((connected <= inside).all())
+        numpy.testing.assert_allclose(weights.sum(axis=1), 2.0 * 0.5 * 30 * (inside.sum(axis=1) > 0))
+        all_delays = self.connections(self.connector(ModularConnector))[2]
+        numpy.testing.assert_allclose(delays[connected], all_delays[connected], rtol=1e-6)
+
+
+class TestModularSingleWeightProbabilisticConnector(ModularConnectorTestCase):
+
+    def test_cutoff(self):
+        inside = self.inside(600.0)
+        numpy.random.seed(0)
+        connected, weights, delays = self.connections(self.connector(ModularSingleWeightProbabilisticConnector, cutoff_distance=600.0, parameters={'connection_probability': 0.1, 'base_weight': 0.5}))
+        self.assertTrue(connected.any())
+        self.assertTrue((connected <= inside).all())
+        numpy.testing.assert_equal(weights[connected], 1.0)
+
 if __name__ == '__main__':
     unittest.main()
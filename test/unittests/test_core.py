@@ -1,7 +1,44 @@
 import unittest
+from parameters import ParameterSet
+from mozaik.core import ParametrizedObject
+
+
+class _Parametrized(ParametrizedObject):
+    required_parameters = ParameterSet({
+        'a': float,
+        'b': ParameterSet({'c': int}),
+    })
+
+    optional_parameters = ParameterSet({
+        'd': float,
+        'b': ParameterSet({'e': str}),
+    })
+
 
 class TestMozaikParametrizeObject(unittest.TestCase):
-    pass
+
+    def test_optional_parameters_can_be_omitted(self):
+        o = _Parametrized(ParameterSet({'a': 1.0, 'b': {'c': 1}}))
+        self.assertEqual(o.parameters.get('d', 2.0), 2.0)
+        self.assertEqual(o.parameters.b.get('e', 'x'), 'x')
+
+    def test_optional_parameters_can_be_supplied(self):
+        o = _Parametrized(ParameterSet({'a': 1.0, 'd': 3.0, 'b': {'c': 1, 'e': 'y'}}))
+        self.assertEqual(o.parameters.get('d', 2.0), 3.0)
+        self.assertEqual(o.parameters.b.get('e', 'x'), 'y')
+
+    def test_optional_parameters_are_type_checked(self):
+        self.assertRaises(Exception, _Parametrized, ParameterSet({'a': 1.0, 'd': 'z', 'b': {'c': 1}}))
+        self.assertRaises(Exception, _Parametrized, ParameterSet({'a': 1.0, 'b': {'c': 1, 'e': 1.0}}))
+
+    def test_required_parameters_cannot_be_omitted(self):
+        self.assertRaises(KeyError, _Parametrized, ParameterSet({'b': {'c': 1}}))
+        self.assertRaises(KeyError, _Parametrized, ParameterSet({'a': 1.0, 'b': {}}))
+
+    def test_unknown_parameters_are_rejected(self):
+        self.assertRaises(KeyError, _Parametrized, ParameterSet({'a': 1.0, 'f': 1.0, 'b': {'c': 1}}))
+        self.assertRaises(KeyError, _Parametrized, ParameterSet({'a': 1.0, 'b': {'c': 1, 'f': 1}}))
+
 
 class TestMozaikComponent(unittest.TestCase):
     pass
@@ -1,4 +1,10 @@
 import unittest
+import numpy
+from parameters import ParameterSet
+from neo import Segment, SpikeTrain
+import quantities as pq
+from mozaik.storage.stimulus_storage import StimulusStoragePolicy
+from mozaik.storage.neo_neurotools_wrapper import CompactSpikeTrains, PickledDataStoreNeoWrapper
 
 
 class TestDataStoreView(unittest.TestCase):
@@ -17,5 +23,63 @@ class TestPickledDataStore(unittest.TestCase):
     pass
 
 
+class TestMozaikSegment(unittest.TestCase):
+
+    def setUp(self):
+        self.spiketrains = [SpikeTrain([1.0, 5.0], t_start=0 * pq.ms, t_stop=10 * pq.ms, units=pq.ms, source_id=3),
+                            SpikeTrain([2.0], t_start=0 * pq.ms, t_stop=10 * pq.ms, units=pq.ms, source_id=7)]
+
+    def segment(self, compact):
+        s = Segment()
+        s.spiketrains = self.spiketrains
+        s.analogsignalarrays = []
+        if compact:
+            s.compact_spiketrains = CompactSpikeTrains.from_spiketrains(self.spiketrains)
+        wrapper = PickledDataStoreNeoWrapper(Segment(), 'id', None)
+        wrapper._set_data(s)
+        return wrapper
+
+    def test_get_spiketrain(self):
+        for compact in (False, True):
+            seg = self.segment(compact)
+            self.assertEqual(seg.get_spiketrain(7).annotations['source_id'], 7)
+            numpy.testing.assert_equal(seg.get_spiketrain(7).magnitude, [2.0])
+            self.assertEqual([st.annotations['source_id'] for st in seg.get_spiketrain([7, 3])], [7, 3])
+
+    def test_get_spiketrain_of_missing_neuron(self):
+        for compact in (False, True):
+            seg = self.segment(compact)
+            for i in (1, 5, 9):
+                self.assertRaises(KeyError, seg.get_spiketrain, i)
+            self.assertRaises(KeyError, seg.get_spiketrain, [3, 5])
+
+
+class TestStimulusStoragePolicy(unittest.TestCase):
+
+    def setUp(self):
+        self.frames = [numpy.random.uniform(0, 100, (7, 9)) for i in xrange(5)]
+
+    def policy(self, encoding, temporal_subsampling=1, spatial_downsampling=1):
+        return StimulusStoragePolicy(ParameterSet({'encoding': encoding,
+                                                   'temporal_subsampling': temporal_subsampling,
+                                                   'spatial_downsampling': spatial_downsampling}))
+
+    def test_encodings(self):
+        for encoding, tolerance in (('float64', 0), ('float16', 0.1), ('uint8', 100.0/255)):
+            decoded = self.policy(encoding).encode(self.frames).decode()
+            self.assertEqual(len(decoded), len(self.frames))
+            for a, b in zip(self.frames, decoded):
+                self.assertEqual(a.shape, b.shape)
+                self.assertTrue(numpy.abs(a - b).max() <= tolerance)
+
+    def test_subsampling(self):
+        encoded = self.policy('float64', 2, 2).encode(self.frames)
+        self.assertEqual(encoded.data.shape, (3, 4, 5))
+        self.assertEqual(len(encoded), 5)
+        numpy.testing.assert_array_equal(encoded[3], encoded[2])
+        self.assertEqual(encoded[4].shape, (7, 9))
+        self.assertAlmostEqual(encoded[2][0, 0], self.frames[2][:2, :2].mean())
+
+
 if __name__ == '__main__':
     unittest.main()
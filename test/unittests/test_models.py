@@ -1,4 +1,19 @@
 import unittest
+import collections
+import numpy
+import os
+import shutil
+import tempfile
+from parameters import ParameterSet
+from pyNN.parameters import Sequence
+from mozaik.space import VisualSpace, VisualRegion
+from mozaik.stimuli.vision.topographica_based import FullfieldDriftingSinusoidalGrating
+from mozaik.models.vision import cai97
+from mozaik.models import Model
+from mozaik.models.vision.spatiotemporalfilter import SpatioTemporalReceptiveField, CellWithReceptiveField, SpatioTemporalFilterRetinaLGN
+from mozaik.models.vision.spatiotemporalfilter import BatchedCellsWithReceptiveField, FFTCellsWithReceptiveField
+from mozaik.models.vision.spatiotemporalfilter import counter_based_normal, _splitmix64
+from mozaik.models.vision.retina_cache import RetinaCache
 
 """
 1. test the values supplied as parameters
@@ -18,5 +33,540 @@ class TestModel(unittest.TestCase):
     pass
 
 
+class _Simulator(object):
+
+    def reset(self):
+        pass
+
+
+class _Sheet(object):
+    """
+    Stands for a sheet whose neurons have a single state variable and which has one noise generating artificial stimulator.
+    """
+
+    def __init__(self):
+        self.v = numpy.zeros(5)
+        self.rng = numpy.random.RandomState(1)
+
+    def get_state(self):
+        return {'variables': {'v': self.v.copy()}, 'artificial_stimulators': [self.rng.get_state()]}
+
+    def set_state(self, state, random_state=True):
+        self.v = state['variables']['v'].copy()
+        if random_state:
+            self.rng.set_state(state['artificial_stimulators'][0])
+
+
+class TestModelReset(unittest.TestCase):
+
+    def setUp(self):
+        self.lgn = SpatioTemporalFilterRetinaLGN.__new__(SpatioTemporalFilterRetinaLGN)
+        self.lgn.parameters = ParameterSet({'mpi_reproducible_noise': True,
+                                            'noise': {'mean': 0.0, 'stdev': 1.0, 'dt': 1.0}})
+        self.lgn.rf_types = ('X_ON',)
+        self.lgn.ncs = {'X_ON': []}
+        self.lgn.noise_keys = {'X_ON': numpy.arange(10, dtype=numpy.uint64)}
+        self.lgn._noise_counter = 0
+        self.lgn._noise_times = {}
+        self.lgn_noise = []
+        self.lgn._set_step_currents = lambda sources, times, amplitudes: self.lgn_noise.append(amplitudes)
+
+        self.model = Model.__new__(Model)
+        self.model.parameters = ParameterSet({'reset': True, 'null_stimulus_period': 0.0})
+        self.model.sim = _Simulator()
+        self.model.sheets = {'V1': _Sheet()}
+        self.model.input_space = VisualSpace(ParameterSet({'update_interval': 7.0, 'background_luminance': 50.0}))
+        self.model.input_layer = self.lgn
+        self.model.simulator_time = 0
+        self.model.warmup_snapshot = self.model.snapshot()
+
+    def trial(self):
+        self.model.reset()
+        sheet = self.model.sheets['V1']
+        numpy.testing.assert_equal(sheet.v, numpy.zeros(5))
+        sheet.v += 1
+        self.lgn._set_noise('X_ON', 50.0, 0.0)
+        return sheet.rng.rand(10), self.lgn_noise[-1]
+
+    def test_reset_trials_receive_different_noise(self):
+        noise1, lgn_noise1 = self.trial()
+        noise2, lgn_noise2 = self.trial()
+        self.assertFalse(numpy.allclose(noise1, noise2))
+        self.assertFalse(numpy.allclose(lgn_noise1, lgn_noise2))
+
+    def test_restore_random_state(self):
+        noise1, lgn_noise1 = self.trial()
+        self.model.restore(self.model.warmup_snapshot)
+        noise2, lgn_noise2 = self.trial()
+        numpy.testing.assert_equal(noise1, noise2)
+        numpy.testing.assert_equal(lgn_noise1, lgn_noise2)
+
+
+class TestSpatioTemporalReceptiveField(unittest.TestCase):
+
+    def params(self, subtract_mean):
+        return ParameterSet({'K1': 1.05, 'K2': 0.7, 'c1': 0.14, 'c2': 0.12, 'n1': 7.0, 'n2': 8.0,
+                             't1': -6.0, 't2': -6.0, 'td': 6.0, 'sigma_c': 0.4, 'sigma_s': 1.0,
+                             'Ac': 1.0, 'As': 0.15, 'subtract_mean': subtract_mean})
+
+    def test_separable_kernel(self):
+        for subtract_mean in (False, True):
+            params = self.params(subtract_mean)
+            # a function without the separable attribute is evaluated over the full 3D grid
+            dense = SpatioTemporalReceptiveField(lambda x, y, t, p: -cai97.stRF_2d(x, y, t, p), params, 4.0, 4.0, 100.0, None)
+            dense.quantize(0.2, 0.2, 2.0)
+            separable = SpatioTemporalReceptiveField(cai97.stRF_2d, params, 4.0, 4.0, 100.0, None, sign=-1.0)
+            separable.quantize(0.2, 0.2, 2.0)
+            self.assertEqual(separable.kernel.shape, dense.kernel.shape)
+            numpy.testing.assert_allclose(separable.kernel, dense.kernel, rtol=0, atol=1e-12 * numpy.abs(dense.kernel).max())
+
+    def test_kernel_cache(self):
+        directory = tempfile.mkdtemp()
+        try:
+            rf = SpatioTemporalReceptiveField(cai97.stRF_2d, self.params(False), 4.0, 4.0, 100.0, None)
+            rf.quantize(0.2, 0.2, 2.0, directory)
+            self.assertEqual(os.listdir(directory), ['kernel_' + rf.kernel_key(0.2, 0.2, 2.0) + '.npy'])
+            cached = SpatioTemporalReceptiveField(cai97.stRF_2d, self.params(False), 4.0, 4.0, 100.0, None)
+            cached.quantize(0.2, 0.2, 2.0, directory)
+            numpy.testing.assert_equal(cached.kernel, rf.kernel)
+            # the kernel of the opposite polarity is stored separately
+            off = SpatioTemporalReceptiveField(cai97.stRF_2d, self.params(False), 4.0, 4.0, 100.0, None, sign=-1.0)
+            off.quantize(0.2, 0.2, 2.0, directory)
+            numpy.testing.assert_equal(off.kernel, -rf.kernel)
+            self.assertEqual(len(os.listdir(directory)), 2)
+        finally:
+            shutil.rmtree(directory)
+
+
+class TestCellWithReceptiveField(unittest.TestCase):
+
+    def setUp(self):
+        params = ParameterSet({'K1': 1.05, 'K2': 0.7, 'c1': 0.14, 'c2': 0.12, 'n1': 7.0, 'n2': 8.0,
+                               't1': -6.0, 't2': -6.0, 'td': 6.0, 'sigma_c': 0.4, 'sigma_s': 1.0,
+                               'Ac': 1.0, 'As': 0.15, 'subtract_mean': False})
+        self.rf = SpatioTemporalReceptiveField(cai97.stRF_2d, params, 4.0, 4.0, 200.0, None)
+        self.rf.quantize(0.2, 0.2, 7.0)
+        self.visual_space = VisualSpace(ParameterSet({'update_interval': 7.0, 'background_luminance': 50.0}))
+
+    def test_initialize_background_response(self):
+        L = self.rf.kernel_duration
+        expected = numpy.zeros((int(numpy.ceil(350.0 / 7.0)) + L,))
+        for i in range(L):
+            expected[i] += 50.0 * self.rf.kernel[:, :, i+1:L].sum()
+        for x in (0.0, 1.0):
+            cell = CellWithReceptiveField(x, 0.0, self.rf, 1.0, self.visual_space)
+            cell.initialize(50.0, 350.0)
+            self.assertEqual(cell.response.shape, expected.shape)
+            numpy.testing.assert_allclose(cell.response, expected, rtol=1e-12, atol=1e-15)
+
+    def test_background_response_on_blank_stimulus(self):
+        # the response to a blank stimulus preceded by a blank screen of the same luminance is constant
+        blank = FullfieldDriftingSinusoidalGrating(frame_duration=7, size_x=6.0, size_y=6.0, location_x=0.0, location_y=0.0,
+                                                   background_luminance=50.0, contrast=0, duration=350.0, density=5.0,
+                                                   trial=0, orientation=0.0, spatial_frequency=0.8, temporal_frequency=2.0)
+        self.visual_space.add_object(str(blank), blank)
+        self.visual_space.set_duration(350.0)
+        cell = CellWithReceptiveField(0.0, 0.0, self.rf, 1.0, self.visual_space)
+        cell.initialize(50.0, 350.0)
+        t = 0
+        while t < 350.0:
+            t = self.visual_space.update()
+            cell.view()
+        response = cell.response_current()['amplitudes']
+        self.assertEqual(len(response), 50)
+        numpy.testing.assert_allclose(response, 50.0 * self.rf.kernel.sum() * numpy.ones(50), rtol=1e-12)
+
+        # which equals the full computation including the frames of the blank screen prior to the stimulus onset
+        L = self.rf.kernel_duration
+        time_course = 50.0 * self.rf.kernel.sum(axis=0).sum(axis=0)
+        full = numpy.zeros(L + 50 + L)
+        for i in range(L + 50):
+            full[i:i + L] += time_course
+        numpy.testing.assert_allclose(response, full[L:L + 50], rtol=1e-12)
+
+
+class _Nest(object):
+    """
+    Stands for the NEST module, holding the status of the devices.
+    """
+
+    def __init__(self):
+        self.status = collections.defaultdict(dict)
+        self.calls = 0
+
+    def SetStatus(self, nodes, params):
+        self.calls += 1
+        if isinstance(params, dict):
+            params = [params] * len(nodes)
+        for node, p in zip(nodes, params):
+            self.status[node].update(p)
+
+    def GetStatus(self, nodes):
+        return [dict(self.status[node]) for node in nodes]
+
+
+class _NestSimulator(object):
+
+    def __init__(self):
+        self.nest = _Nest()
+
+    def get_min_delay(self):
+        return 0.1
+
+    def get_time_step(self):
+        return 0.1
+
+
+class _NestStepCurrentSource(object):
+    """
+    Follows the StepCurrentSource of the nest backend of pyNN, whose parameters are held by the NEST device 
+    (in pA, and with the times corrected by the minimum delay).
+    """
+
+    def __init__(self, sim, gid):
+        self.sim = sim
+        self._device = [gid]
+
+    def set_parameters(self, times, amplitudes):
+        times = numpy.array(times) - self.sim.get_min_delay()
+        if amplitudes[0] != 0:
+            times[0] = max(times[0], self.sim.get_time_step())
+        self.sim.nest.SetStatus(self._device, {'amplitude_times': times, 'amplitude_values': 1000.0 * numpy.array(amplitudes)})
+
+    def get_parameters(self):
+        status = self.sim.nest.GetStatus(self._device)[0]
+        return {'times': status['amplitude_times'] + self.sim.get_min_delay(), 'amplitudes': status['amplitude_values'] / 1000.0}
+
+
+class _CachingNestStepCurrentSource(_NestStepCurrentSource):
+    """
+    A StepCurrentSource that in addition keeps a copy of its parameters.
+    """
+
+    def __init__(self, sim, gid):
+        _NestStepCurrentSource.__init__(self, sim, gid)
+        self.parameter_space = {}
+
+    def set_parameters(self, times, amplitudes):
+        _NestStepCurrentSource.set_parameters(self, times, amplitudes)
+        self.parameter_space.update(times=Sequence(times), amplitudes=Sequence(amplitudes))
+
+    def get_parameters(self):
+        return dict((k, v.value) for k, v in self.parameter_space.items())
+
+
+class TestSpatioTemporalFilterRetinaLGN(unittest.TestCase):
+
+    def test_set_step_currents(self):
+        class Source(object):
+            def set_parameters(self, **parameters):
+                self.parameters = parameters
+        class Component(object):
+            pass
+        sources = [Source(), Source()]
+        times = numpy.array([0.0, 7.0])
+        lgn = SpatioTemporalFilterRetinaLGN.__new__(SpatioTemporalFilterRetinaLGN)
+        lgn.model = Component()
+        lgn.model.sim = Component()
+        lgn._set_step_currents(sources, times, numpy.array([[1.0, 2.0], [3.0, 4.0]]))
+        numpy.testing.assert_equal(sources[1].parameters['amplitudes'], [3.0, 4.0])
+        numpy.testing.assert_equal(sources[1].parameters['times'], times)
+        lgn._set_step_currents(sources, times, numpy.zeros(2))
+        numpy.testing.assert_equal(sources[0].parameters['amplitudes'], [0.0, 0.0])
+        self.assertRaises(AssertionError, lgn._set_step_currents, sources, times, numpy.zeros((3, 2)))
+
+    def test_bulk_set_step_currents(self):
+        class Component(object):
+            pass
+        lgn = SpatioTemporalFilterRetinaLGN.__new__(SpatioTemporalFilterRetinaLGN)
+        lgn.model = Component()
+        lgn.model.sim = sim = _NestSimulator()
+        # the sources set one by one through the pyNN API
+        reference_sim = _NestSimulator()
+        sources = [_NestStepCurrentSource(sim, i) for i in xrange(3)] + [_CachingNestStepCurrentSource(sim, 3)]
+        reference = [_NestStepCurrentSource(reference_sim, i) for i in xrange(3)] + [_CachingNestStepCurrentSource(reference_sim, 3)]
+        times = numpy.array([0.0, 7.0, 14.0])
+        for amplitudes in (numpy.random.RandomState(0).rand(4, 3), numpy.zeros(3), numpy.array([1.0, 0.0, 2.0])):
+            calls = sim.nest.calls
+            lgn._set_step_currents(sources, times, amplitudes)
+            # all the devices are set at once
+            self.assertEqual(sim.nest.calls, calls + 1)
+            for i, (scs, ref) in enumerate(zip(sources, reference)):
+                a = amplitudes[i] if amplitudes.ndim == 2 else amplitudes
+                ref.set_parameters(times=times, amplitudes=a)
+                # the status of the devices is the same as when they are set one by one
+                numpy.testing.assert_equal(sim.nest.status[i], reference_sim.nest.status[i])
+                # and so are the parameters pyNN holds for them
+                parameters = scs.get_parameters()
+                numpy.testing.assert_allclose(parameters['amplitudes'], a)
+                numpy.testing.assert_allclose(parameters['amplitudes'], ref.get_parameters()['amplitudes'])
+                numpy.testing.assert_allclose(parameters['times'], ref.get_parameters()['times'])
+            numpy.testing.assert_equal(sources[3].get_parameters()['times'], times)
+        self.assertRaises(AssertionError, lgn._set_step_currents, sources, times, numpy.zeros((3, 3)))
+
+    def memory_cached_lgn(self, memory_cache_size=None):
+        lgn = SpatioTemporalFilterRetinaLGN.__new__(SpatioTemporalFilterRetinaLGN)
+        lgn.parameters = ParameterSet({'linear_scaler': 2.0, 'mpi_reproducible_noise': False})
+        if memory_cache_size != None:
+            lgn.parameters['memory_cache_size'] = memory_cache_size
+        lgn.rf_types = ('X_ON',)
+        lgn.scs = {'X_ON': []}
+        lgn.cache = None
+        lgn._memory_cache = collections.OrderedDict()
+        lgn.calculated = []
+        lgn.set_currents = []
+
+        def calculate_input_currents(visual_space, duration):
+            lgn.calculated.append(visual_space.content.values()[0].orientation)
+            amplitudes = numpy.random.rand(3)
+            return {'X_ON': [{'times': numpy.arange(3.0), 'amplitudes': amplitudes}]}, [amplitudes]
+        lgn._calculate_input_currents = calculate_input_currents
+        lgn._set_step_currents = lambda sources, times, amplitudes: lgn.set_currents.append(amplitudes)
+        return lgn
+
+    def present(self, lgn, orientation, trial):
+        stimulus = FullfieldDriftingSinusoidalGrating(frame_duration=7, size_x=5.0, size_y=5.0, location_x=0.0, location_y=0.0,
+                                                      background_luminance=50.0, contrast=100, duration=21.0, density=10.0,
+                                                      trial=trial, orientation=orientation, spatial_frequency=0.8, temporal_frequency=2.0)
+        visual_space = VisualSpace(ParameterSet({'update_interval': 7.0, 'background_luminance': 50.0}))
+        visual_space.add_object(str(stimulus), stimulus)
+        return lgn.process_input(visual_space, stimulus, 21.0)
+
+    def test_memory_cache(self):
+        lgn = self.memory_cached_lgn(2)
+        retinal_input = self.present(lgn, 0.5, 0)
+        # the other trials of the stimulus are served from the memory cache
+        self.assertTrue(self.present(lgn, 0.5, 1) is retinal_input)
+        self.assertTrue(self.present(lgn, 0.5, 2) is retinal_input)
+        self.assertEqual(len(lgn.calculated), 1)
+        self.assertEqual(len(lgn._memory_cache), 1)
+        # the memorized currents are scaled again on each presentation
+        for amplitudes in lgn.set_currents:
+            numpy.testing.assert_equal(amplitudes, 2.0 * numpy.array(retinal_input))
+
+    def test_memory_cache_eviction(self):
+        lgn = self.memory_cached_lgn(2)
+        self.present(lgn, 0.5, 0)
+        self.present(lgn, 1.0, 0)
+        self.present(lgn, 0.5, 1)  # hit, 0.5 becomes the most recently used
+        self.present(lgn, 1.5, 0)  # evicts 1.0
+        self.assertEqual(len(lgn._memory_cache), 2)
+        self.present(lgn, 0.5, 2)  # hit
+        self.present(lgn, 1.0, 1)  # recalculated
+        self.assertEqual(len(lgn.calculated), 4)
+        self.assertEqual(lgn.calculated, [0.5, 1.0, 1.5, 1.0])
+        self.assertEqual(len(lgn._memory_cache), 2)
+
+    def test_memory_cache_disabled_by_default(self):
+        lgn = self.memory_cached_lgn()
+        self.present(lgn, 0.5, 0)
+        self.present(lgn, 0.5, 1)
+        self.assertEqual(len(lgn.calculated), 2)
+        self.assertEqual(len(lgn._memory_cache), 0)
+
+
+class TestCounterBasedNormal(unittest.TestCase):
+
+    def test_splitmix64(self):
+        # the first two outputs of the reference SplitMix64 generator seeded with 0
+        golden = 0x9E3779B97F4A7C15
+        with numpy.errstate(over='ignore'):
+            z = _splitmix64(numpy.array([golden, (2 * golden) % 2**64], dtype=numpy.uint64))
+        self.assertEqual([int(a) for a in z], [0xE220A8397B1DCDAF, 0x6E789E6AA1B965F4])
+
+    def test_reproducibility(self):
+        keys = numpy.array([3, 2**63 + 5, 17, 2**40], dtype=numpy.uint64)
+        samples = counter_based_normal(keys, 7, 11)
+        self.assertEqual(samples.shape, (4, 11))
+        numpy.testing.assert_equal(counter_based_normal(keys, 7, 11), samples)
+        # each row depends only on its key, e.g. not on which other cells are local to the MPI process
+        numpy.testing.assert_equal(counter_based_normal(keys[[2, 0]], 7, 11), samples[[2, 0]])
+        self.assertFalse(numpy.any(counter_based_normal(keys, 8, 11) == samples))
+        self.assertEqual(len(numpy.unique(samples)), samples.size)
+
+    def test_distribution(self):
+        samples = counter_based_normal(numpy.arange(100, dtype=numpy.uint64), 0, 10000)
+        # the standard errors of the mean and the variance are 1e-3 and about 1.4e-3
+        self.assertTrue(abs(samples.mean()) < 5e-3)
+        self.assertTrue(abs(samples.var() - 1.0) < 7e-3)
+        # the rows are uncorrelated
+        self.assertTrue(numpy.abs(numpy.corrcoef(samples[:10])[numpy.triu_indices(10, 1)]).max() < 0.05)
+
+
+class TestReceptiveFieldEngines(unittest.TestCase):
+    """
+    Compares the responses of the engines evaluating the RFs of a whole population with those of separately evaluated cells.
+    """
+
+    duration = 140.0
+
+    def setUp(self):
+        params = ParameterSet({'K1': 1.05, 'K2': 0.7, 'c1': 0.14, 'c2': 0.12, 'n1': 7.0, 'n2': 8.0,
+                               't1': -6.0, 't2': -6.0, 'td': 6.0, 'sigma_c': 0.4, 'sigma_s': 1.0,
+                               'Ac': 1.0, 'As': 0.15, 'subtract_mean': False})
+        self.rf = SpatioTemporalReceptiveField(cai97.stRF_2d, params, 4.0, 4.0, 100.0, None)
+        self.rf.quantize(0.2, 0.2, 7.0)
+        rng = numpy.random.RandomState(1)
+        self.x, self.y = rng.uniform(-1.0, 1.0, 20), rng.uniform(-1.0, 1.0, 20)
+
+    def visual_space(self):
+        visual_space = VisualSpace(ParameterSet({'update_interval': 7.0, 'background_luminance': 50.0}))
+        stimulus = FullfieldDriftingSinusoidalGrating(frame_duration=7, size_x=8.0, size_y=8.0, location_x=0.0, location_y=0.0,
+                                                      background_luminance=50.0, contrast=100, duration=self.duration, density=5.0,
+                                                      trial=0, orientation=0.5, spatial_frequency=0.8, temporal_frequency=2.0)
+        visual_space.add_object(str(stimulus), stimulus)
+        visual_space.set_duration(self.duration)
+        return visual_space
+
+    def per_cell_responses(self):
+        visual_space = self.visual_space()
+        cells = [CellWithReceptiveField(x, y, self.rf, 1.0, visual_space) for x, y in zip(self.x, self.y)]
+        for cell in cells:
+            cell.initialize(50.0, self.duration)
+        t = 0
+        while t < self.duration:
+            t = visual_space.update()
+            for cell in cells:
+                cell.view()
+        return numpy.array([cell.response_current()['amplitudes'] for cell in cells])
+
+    def population_responses(self, engine):
+        visual_space = self.visual_space()
+        scene_region = BatchedCellsWithReceptiveField.scene_region(self.x, self.y, self.rf, VisualRegion(0, 0, 8.0, 8.0))
+        cells = engine(self.x, self.y, self.rf, 1.0, visual_space, scene_region)
+        cells.initialize(50.0, self.duration)
+        t = 0
+        while t < self.duration:
+            t = visual_space.update()
+            cells.view(visual_space.view(scene_region, pixel_size=self.rf.spatial_resolution))
+        return numpy.array([c['amplitudes'] for c in cells.response_currents()])
+
+    def test_batched_engine(self):
+        expected = self.per_cell_responses()
+        responses = self.population_responses(BatchedCellsWithReceptiveField)
+        self.assertEqual(responses.shape, expected.shape)
+        numpy.testing.assert_allclose(responses, expected, rtol=0, atol=1e-10 * numpy.abs(expected).max())
+
+    def lgn(self, engine, processes):
+        """
+        Returns a SpatioTemporalFilterRetinaLGN holding just the state needed to calculate the input currents.
+        """
+        class Population(object):
+            pass
+        class Component(object):
+            pass
+        lgn = SpatioTemporalFilterRetinaLGN.__new__(SpatioTemporalFilterRetinaLGN)
+        lgn.parameters = ParameterSet({'engine': engine, 'processes': processes, 'gain': 1.0})
+        lgn.rf_types = ('X_ON', 'X_OFF')
+        lgn.rf = {'X_ON': self.rf, 'X_OFF': self.rf}
+        lgn.model = Component()
+        lgn.model.visual_field = VisualRegion(0, 0, 8.0, 8.0)
+        lgn.sheets = {}
+        for i, rf_type in enumerate(lgn.rf_types):
+            lgn.sheets[rf_type] = Component()
+            lgn.sheets[rf_type].pop = Population()
+            lgn.sheets[rf_type].pop.positions = numpy.array([numpy.roll(self.x, i), numpy.roll(self.y, i), 0 * self.x])
+            lgn.sheets[rf_type].pop._mask_local = numpy.ones(len(self.x), dtype=bool)
+        lgn._pool = None
+        return lgn
+
+    def lgn_responses(self, lgn):
+        input_currents, retinal_input = lgn._calculate_input_currents(self.visual_space(), self.duration)
+        return dict((rf_type, numpy.array([c['amplitudes'] for c in currents])) for rf_type, currents in input_currents.items()), retinal_input
+
+    def test_parallel_calculation(self):
+        for engine in ('batched', 'fft'):
+            expected, expected_input = self.lgn_responses(self.lgn(engine, 1))
+            lgn = self.lgn(engine, 3)
+            try:
+                for i in xrange(2):
+                    responses, retinal_input = self.lgn_responses(lgn)
+                    if i == 0:
+                        pool = lgn._pool
+                    # the pool of workers is reused for all stimuli
+                    self.assertTrue(lgn._pool is pool)
+                    for rf_type in lgn.rf_types:
+                        numpy.testing.assert_allclose(responses[rf_type], expected[rf_type], rtol=0, atol=1e-12)
+                    numpy.testing.assert_equal(retinal_input, expected_input)
+                workers = list(pool._pool)
+                self.assertEqual(len(workers), 3)
+                lgn.close()
+                self.assertEqual(lgn._pool, None)
+                self.assertFalse(any(w.is_alive() for w in workers))
+                # a new pool is created for further stimuli
+                responses, retinal_input = self.lgn_responses(lgn)
+                self.assertFalse(lgn._pool is pool)
+                numpy.testing.assert_allclose(responses['X_ON'], expected['X_ON'], rtol=0, atol=1e-12)
+            finally:
+                lgn.close()
+
+    def test_fft_engine(self):
+        expected = self.per_cell_responses()
+        responses = self.population_responses(FFTCellsWithReceptiveField)
+        self.assertEqual(responses.shape, expected.shape)
+        numpy.testing.assert_allclose(responses, expected, rtol=0, atol=1e-7 * numpy.abs(expected).max())
+
+
+
+class TestRetinaCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cache')
+        self.currents = numpy.random.RandomState(0).rand(10, 100)
+        self.frames = [numpy.full((3, 4), float(i)) for i in xrange(5)]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_store_and_lookup(self):
+        cache = RetinaCache(self.path, 'A')
+        self.assertEqual(cache.lookup('a'), None)
+        cache.store('a', 10, numpy.arange(10), self.currents, 7.0, self.frames)
+        cache.store('b', 10, numpy.arange(10), self.currents, 7.0)
+
+        # a new instance (e.g. of another simulation) sees the stored entries
+        cache = RetinaCache(self.path, 'A')
+        entry = cache.lookup('a')
+        self.assertEqual(entry['temporal_resolution'], 7.0)
+        currents = cache.read_currents(entry, numpy.array([7, 3]))
+        self.assertEqual(currents.dtype, numpy.float32)
+        numpy.testing.assert_allclose(currents, self.currents[[7, 3]], rtol=1e-6)
+        frames = cache.read_frames(entry)
+        self.assertEqual(len(frames), len(self.frames))
+        for a, b in zip(frames, self.frames):
+            numpy.testing.assert_equal(a, b)
+        self.assertEqual(cache.read_frames(cache.lookup('b')), None)
+
+    def test_fingerprint_invalidation(self):
+        cache = RetinaCache(self.path, 'A')
+        cache.store('a', 10, numpy.arange(10), self.currents, 7.0, self.frames)
+        files = set(os.listdir(self.path))
+
+        other = RetinaCache(self.path, 'B')
+        self.assertEqual(other.lookup('a'), None)
+        # the entry of the other retinal model has been evicted together with its files
+        self.assertEqual(cache.lookup('a'), None)
+        self.assertEqual(len(files - set(os.listdir(self.path))), 2)
+
+        other.store('a', 10, numpy.arange(10), 2 * self.currents, 7.0)
+        numpy.testing.assert_allclose(other.read_currents(other.lookup('a'), numpy.arange(10)), 2 * self.currents, rtol=1e-6)
+        self.assertEqual(cache.lookup('a'), None)
+
+    def test_lru_eviction(self):
+        # room for two entries
+        cache = RetinaCache(self.path, 'A', max_size=int(2.5 * self.currents.astype(numpy.float32).nbytes))
+        cache.store('a', 10, numpy.arange(10), self.currents, 7.0)
+        cache.store('b', 10, numpy.arange(10), self.currents, 7.0)
+        self.assertNotEqual(cache.lookup('a'), None)
+        cache.store('c', 10, numpy.arange(10), self.currents, 7.0)
+        # 'b' is the least recently used entry
+        self.assertEqual(sorted(cache.index.keys()), ['a', 'c'])
+        self.assertEqual(cache.lookup('b'), None)
+        self.assertEqual(len([f for f in os.listdir(self.path) if f.endswith('.npy')]), 2)
+        cache.store('d', 10, numpy.arange(10), self.currents, 7.0)
+        self.assertEqual(sorted(cache.index.keys()), ['c', 'd'])
+
+
 if __name__ == '__main__':
     unittest.main()
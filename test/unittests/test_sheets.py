@@ -1,7 +1,60 @@
 import unittest
+import numpy
+import quantities as pq
+from neo import Segment, AnalogSignalArray
+from parameters import ParameterSet
+from mozaik.sheets import Sheet
+from mozaik.storage.neo_neurotools_wrapper import CompactSpikeTrains, PickledDataStoreNeoWrapper
+from mozaik.analysis.helper_functions import psth_from_spike_counts
+
 
 class TestSheet(unittest.TestCase):
-    pass
+
+    def setUp(self):
+        self.v = numpy.random.RandomState(0).uniform(-70, -50, (100, 4))
+        self.segment = Segment()
+        self.segment.compact_spiketrains = CompactSpikeTrains([], [], [], 0, 100.0)
+        self.segment.analogsignalarrays = [AnalogSignalArray(self.v, units=pq.mV, t_start=0 * pq.ms, sampling_period=1.0 * pq.ms,
+                                                             name='v', source_ids=numpy.array([1, 2, 3, 4]))]
+        self.sheet = Sheet.__new__(Sheet)
+        self.sheet.reductions = [('v', ParameterSet({'type': 'mean_var'}), [1, 2]),
+                                 ('v', ParameterSet({'type': 'downsample', 'factor': 10}), [3])]
+        self.sheet.reduced_only = {'v': set([1, 2, 3])}
+        self.sheet.reduce_data(self.segment)
+        self.wrapper = PickledDataStoreNeoWrapper(Segment(), 'id', None)
+        self.wrapper._set_data(self.segment)
+
+    def test_reduced_data_are_not_stored_as_full_recordings(self):
+        self.assertEqual(list(self.wrapper.get_stored_vm_ids()), [4])
+        numpy.testing.assert_allclose(self.wrapper.get_vm(4).magnitude, self.v[:, 3])
+        for i in (1, 2, 3):
+            self.assertRaises(ValueError, self.wrapper.get_vm, i)
+
+    def test_reduced_data_accessors(self):
+        self.assertEqual(list(self.wrapper.get_stored_mean_ids('v')), [1, 2])
+        self.assertEqual(list(self.wrapper.get_stored_downsampled_ids('v')), [3])
+        for i in (1, 2):
+            numpy.testing.assert_allclose(self.wrapper.get_mean('v', i).magnitude, [numpy.mean(self.v[:, i-1])])
+            numpy.testing.assert_allclose(self.wrapper.get_variance('v', i).magnitude, [numpy.var(self.v[:, i-1])])
+        numpy.testing.assert_allclose(self.wrapper.get_downsampled('v', 3).magnitude, self.v[:, 2].reshape(10, 10).mean(axis=1))
+        self.assertEqual(self.wrapper.get_mean('v', 3), None)
+
+    def test_spike_counts_only(self):
+        self.assertFalse(self.wrapper.stores_only_spike_counts())
+        self.assertEqual(psth_from_spike_counts([], 10.0), [])
+
+        segment = Segment()
+        segment.compact_spiketrains = CompactSpikeTrains([5, 6], [1.0, 15.0, 17.0, 3.0], [0, 0, 0, 1], 0, 20.0)
+        segment.analogsignalarrays = []
+        self.sheet.reductions = [('spikes', ParameterSet({'type': 'spike_counts', 'bin_length': 10.0}), [5, 6])]
+        self.sheet.reduced_only = {'spikes': set([5, 6])}
+        self.sheet.reduce_data(segment)
+        wrapper = PickledDataStoreNeoWrapper(Segment(), 'id', None)
+        wrapper._set_data(segment)
+        self.assertTrue(wrapper.stores_only_spike_counts())
+        numpy.testing.assert_equal(wrapper.get_spike_counts(5).magnitude, [1, 2])
+        numpy.testing.assert_equal(psth_from_spike_counts(wrapper.get_spike_counts([5, 6]), 20.0, normalize=False)[1].magnitude, [1])
+
 
 class TestRetinalUniformSheet(unittest.TestCase):
     pass
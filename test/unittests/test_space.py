@@ -1,4 +1,8 @@
 import unittest
+import numpy
+from parameters import ParameterSet
+from mozaik.space import VisualSpace, VisualRegion, TRANSPARENT
+from mozaik.stimuli.vision.topographica_based import FullfieldDriftingSinusoidalGrating
 
 
 class TestInputSpace(unittest.TestCase):
@@ -6,7 +10,50 @@ class TestInputSpace(unittest.TestCase):
     
 
 class TestVisualSpace(unittest.TestCase):
-    pass
+
+    def setUp(self):
+        self.visual_space = VisualSpace(ParameterSet({'update_interval': 7.0, 'background_luminance': 50.0}))
+        self.objects = [FullfieldDriftingSinusoidalGrating(frame_duration=7, size_x=5.0, size_y=5.0, location_x=0.0, location_y=0.0,
+                                                           background_luminance=50.0, contrast=100, duration=70.0, density=10.0,
+                                                           trial=0, orientation=0.5, spatial_frequency=0.8, temporal_frequency=2.0),
+                        FullfieldDriftingSinusoidalGrating(frame_duration=7, size_x=3.0, size_y=3.0, location_x=2.0, location_y=1.0,
+                                                           background_luminance=50.0, contrast=50, duration=70.0, density=10.0,
+                                                           trial=0, orientation=1.5, spatial_frequency=0.5, temporal_frequency=2.0)]
+        self.objects[1].transparent = True
+        for i, o in enumerate(self.objects):
+            self.visual_space.add_object(str(i), o)
+        self.visual_space.update()
+        self.region = VisualRegion(0.0, 0.0, 8.0, 8.0)
+
+    def per_object_view(self, region):
+        scene = TRANSPARENT * numpy.ones(numpy.ceil(numpy.array([region.size_y, region.size_x]) / 0.1).astype(int))
+        for o in self.objects:
+            if region.overlaps(o.region):
+                scene = numpy.maximum(scene, o.display(region, 0.1))
+        scene[scene <= TRANSPARENT] = 50.0
+        return scene
+
+    def test_view(self):
+        numpy.testing.assert_equal(self.visual_space.view(self.region, 0.1), self.per_object_view(self.region))
+
+    def test_render(self):
+        expected = self.per_object_view(self.region)
+        for padding in (0, 10):
+            numpy.testing.assert_equal(self.visual_space.render(self.region, 0.1, padding=padding), expected)
+
+    def test_rendered_view(self):
+        self.visual_space.render(self.region, 0.1, padding=10)
+        for region in (VisualRegion(-1.0, 0.5, 2.0, 2.0), VisualRegion(3.9, -3.9, 1.6, 1.6), VisualRegion(-3.0, 3.5, 4.0, 2.0)):
+            view = self.visual_space.rendered_view(region, 0.1)
+            # served from the rendered buffer
+            self.assertTrue(view.base is not None)
+            numpy.testing.assert_allclose(view, self.per_object_view(region), rtol=1e-10)
+        # regions outside of the rendered area, or at another resolution, are rendered separately
+        for region, pixel_size in ((VisualRegion(5.5, 0.0, 2.0, 2.0), 0.1), (VisualRegion(0.0, 0.0, 2.0, 2.0), 0.2)):
+            numpy.testing.assert_equal(self.visual_space.rendered_view(region, pixel_size), self.visual_space.view(region, pixel_size))
+        # the rendered frame is discarded on update
+        self.visual_space.update()
+        numpy.testing.assert_allclose(self.visual_space.rendered_view(self.region, 0.1), self.per_object_view(self.region), rtol=1e-10)
     
 
 class TestVisualRegion(unittest.TestCase):
@@ -15,4 +62,3 @@ class TestVisualRegion(unittest.TestCase):
 
 if __name__ == '__main__':
     unittest.main()
-
@@ -1,4 +1,19 @@
 import unittest
+import itertools
+import os
+import pickle
+import shutil
+import tempfile
+import numpy
+import imagen
+import imagen.image
+import imagen.transferfn
+from imagen.image import BoundingBox
+from PIL import Image
+from mozaik.space import VisualRegion
+from mozaik.stimuli.vision import topographica_based
+from mozaik.stimuli.vision.topographica_based import FullfieldDriftingSinusoidalGrating, FullfieldDriftingSquareGrating, DriftingSinusoidalGratingDisk, \
+                                                    NaturalImageWithEyeMovement, decoded_image
 
 class TestBaseStimulus(unittest.TestCase):
     pass
@@ -9,23 +24,189 @@ class TestInternalStimulus(unittest.TestCase):
 
 
 class TestVisualStimulus(unittest.TestCase):
-    pass
+
+    def stimulus(self, temporal_frequency=2.0):
+        # 0.1 degree pixels
+        s = FullfieldDriftingSinusoidalGrating(frame_duration=7, size_x=5.0, size_y=5.0, location_x=0.0, location_y=0.0,
+                                               background_luminance=50.0, contrast=100, duration=70.0, density=10.0,
+                                               trial=0, orientation=0.5, spatial_frequency=0.8, temporal_frequency=temporal_frequency)
+        s.reset()
+        return s
+
+    def test_zoom_cache(self):
+        region = VisualRegion(0.5, 0.5, 2.0, 2.0)
+        s = self.stimulus()
+        first = s.display(region, 0.2)
+        self.assertEqual(s.zoom_cache_statistics(), {'hits': 0, 'misses': 1, 'hit_rate': 0.0})
+        numpy.testing.assert_equal(s.display(region, 0.2), first)
+        numpy.testing.assert_equal(s.display(VisualRegion(-1.0, 0.0, 1.0, 1.0), 0.2), self.stimulus().display(VisualRegion(-1.0, 0.0, 1.0, 1.0), 0.2))
+        self.assertEqual(s.zoom_cache_statistics(), {'hits': 2, 'misses': 1, 'hit_rate': 2.0 / 3})
+        # displaying at the native resolution does not resample
+        s.display(region, 0.1)
+        self.assertEqual(s.zoom_cache_statistics()['misses'], 1)
+
+        # the resampled frame is discarded when the frame changes
+        s.update()
+        reference = self.stimulus()
+        reference.update()
+        numpy.testing.assert_equal(s.display(region, 0.2), reference.display(region, 0.2))
+        self.assertEqual(s.zoom_cache_statistics()['misses'], 2)
+        self.assertFalse(numpy.array_equal(s.display(region, 0.2), first))
+
+    def test_zoom_cache_of_static_stimulus(self):
+        region = VisualRegion(0.5, 0.5, 2.0, 2.0)
+        s = self.stimulus(temporal_frequency=0.0)
+        first = s.display(region, 0.2)
+        s.update()
+        # the frame did not change, so the resampled frame is reused
+        numpy.testing.assert_equal(s.display(region, 0.2), first)
+        self.assertEqual(s.zoom_cache_statistics(), {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+    def test_region_cache(self):
+        region = VisualRegion(0.5, 0.5, 2.0, 2.0)
+        s = self.stimulus()
+        native = s.display(region, 0.1)
+        resampled = s.display(region, 0.2)
+        # the slices are kept per region and pixel size
+        self.assertEqual(sorted(s.region_cache.keys()), [(region, 0.1), (region, 0.2)])
+        self.assertNotEqual(s.region_cache[(region, 0.1)], s.region_cache[(region, 0.2)])
+        self.assertEqual(native.shape, (20, 20))
+        self.assertEqual(resampled.shape, (10, 10))
+        # cached slices give the same views as freshly computed ones, in either order
+        numpy.testing.assert_equal(s.display(region, 0.1), native)
+        numpy.testing.assert_equal(s.display(region, 0.2), resampled)
+        reference = self.stimulus()
+        numpy.testing.assert_equal(reference.display(region, 0.2), resampled)
+        numpy.testing.assert_equal(reference.display(region, 0.1), native)
 
 
 class TestTopographicaBasedVisualStimulus(unittest.TestCase):
     pass
 
 
+def assert_frame_blocks_match_frames(test, stimulus, n=30):
+    """
+    Checks that the first `n` frames (and their variables) taken from the blocks of `stimulus` are identical
+    to the ones generated frame by frame. The blocks are made short so that several of them are crossed.
+    """
+    stimulus.frame_block_pixels = 7 * numpy.prod(stimulus.frames().next()[0].shape)
+    test.assertEqual(stimulus._frame_block_length(), 7)
+    expected = list(itertools.islice(stimulus.frames(), n))
+    actual = list(itertools.islice(stimulus.frame_sequence(), n))
+    test.assertEqual(len(actual), n)
+    for (a, va), (e, ve) in zip(actual, expected):
+        numpy.testing.assert_array_equal(a, e)
+        test.assertEqual(va, ve)
+
+
+grating_parameters = dict(frame_duration=7, size_x=5.0, size_y=5.0, location_x=0.0, location_y=0.0, background_luminance=50.0,
+                          contrast=80, duration=210.0, density=10.0, trial=0, orientation=0.5, spatial_frequency=0.8,
+                          temporal_frequency=2.0)
+
+
 class TestFullfieldDriftingSinusoidalGrating(unittest.TestCase):
-    pass
+
+    def test_frame_blocks(self):
+        assert_frame_blocks_match_frames(self, FullfieldDriftingSinusoidalGrating(**grating_parameters))
+
+
+class TestFullfieldDriftingSquareGrating(unittest.TestCase):
+
+    def test_frame_blocks(self):
+        assert_frame_blocks_match_frames(self, FullfieldDriftingSquareGrating(**grating_parameters))
 
 
 class TestNull(unittest.TestCase):
     pass
 
 
+@unittest.skipUnless(hasattr(imagen.transferfn, 'MaximumDynamicRange'), "the image rendering requires imagen.transferfn.MaximumDynamicRange")
 class TestNaturalImageWithEyeMovement(unittest.TestCase):
-    pass
+
+    # eye positions in degrees; at the density of 10 pixels per degree the first four are whole pixel shifts
+    eye_path = [(0.0, 0.0), (0.2, -0.3), (-0.5, 0.4), (0.7, 0.1), (0.13, 0.27), (-0.61, -0.05)]
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.image_location = os.path.join(self.directory, 'image.png')
+        Image.fromarray((numpy.random.RandomState(0).rand(60, 90) * 255).astype(numpy.uint8)).save(self.image_location)
+        self.eye_path_location = os.path.join(self.directory, 'eye_path.pickle')
+        with open(self.eye_path_location, 'w') as f:
+            pickle.dump(self.eye_path, f)
+        topographica_based._decoded_images.clear()
+
+    def tearDown(self):
+        topographica_based._decoded_images.clear()
+        shutil.rmtree(self.directory)
+
+    def stimulus(self):
+        return NaturalImageWithEyeMovement(frame_duration=7, size_x=6.0, size_y=6.0, location_x=0.0, location_y=0.0,
+                                           background_luminance=50.0, duration=42.0, density=10.0, trial=0, size=8.0,
+                                           eye_movement_period=7.0, image_location=self.image_location,
+                                           eye_path_location=self.eye_path_location)
+
+    def reference_frame(self, stimulus, location):
+        """
+        Renders the image moved to `location` directly with imagen.
+        """
+        return imagen.image.FileImage(filename=stimulus.image_location,
+                                      x=location[0],
+                                      y=location[1],
+                                      orientation=0,
+                                      xdensity=stimulus.density,
+                                      ydensity=stimulus.density,
+                                      size=stimulus.size,
+                                      bounds=BoundingBox(points=((-stimulus.size_x/2, -stimulus.size_y/2),
+                                                                 (stimulus.size_x/2, stimulus.size_y/2))),
+                                      scale=2*stimulus.background_luminance,
+                                      pattern_sampler=imagen.image.PatternSampler(
+                                                          size_normalization='fit_longest',
+                                                          whole_pattern_output_fns=[imagen.transferfn.MaximumDynamicRange()]))()
+
+    def test_frames(self):
+        s = self.stimulus()
+        frames = list(itertools.islice(s.frames(), len(self.eye_path)))
+        for i, ((frame, variables), location) in enumerate(zip(frames, self.eye_path)):
+            self.assertEqual(variables, [i])
+            self.assertEqual(frame.shape, (60, 60))
+            if i < 4:
+                # whole pixel shifts are exact
+                numpy.testing.assert_array_equal(frame, self.reference_frame(s, location))
+            else:
+                # sub-pixel shifts interpolate between the frames at the surrounding whole pixel positions
+                neighbours = [self.reference_frame(s, (x / 10.0, y / 10.0))
+                              for x in (numpy.floor(location[0] * 10), numpy.ceil(location[0] * 10))
+                              for y in (numpy.floor(location[1] * 10), numpy.ceil(location[1] * 10))]
+                self.assertTrue((frame >= numpy.min(neighbours, axis=0) - 1e-10).all())
+                self.assertTrue((frame <= numpy.max(neighbours, axis=0) + 1e-10).all())
+
+    def test_decoded_image_cache(self):
+        bounds = (-3.0, -3.0, 3.0, 3.0)
+        image = decoded_image(self.image_location, 8.0, 10.0, bounds)
+        self.assertFalse(image.flags.writeable)
+        # the image is decoded only once
+        self.assertTrue(decoded_image(self.image_location, 8.0, 10.0, bounds) is image)
+        self.assertEqual(len(topographica_based._decoded_images), 1)
+        # the frames of further stimuli come from the cached canvas
+        list(itertools.islice(self.stimulus().frames(), 2))
+        list(itertools.islice(self.stimulus().frames(), 2))
+        self.assertEqual(len(topographica_based._decoded_images), 2)
+        # other rendering parameters are cached separately
+        other = decoded_image(self.image_location, 8.0, 5.0, bounds)
+        self.assertEqual(other.shape, (30, 30))
+        self.assertEqual(len(topographica_based._decoded_images), 3)
+        # a changed file is decoded again
+        Image.fromarray((numpy.random.RandomState(1).rand(60, 90) * 255).astype(numpy.uint8)).save(self.image_location)
+        os.utime(self.image_location, (0, os.path.getmtime(self.image_location) + 10))
+        changed = decoded_image(self.image_location, 8.0, 10.0, bounds)
+        self.assertFalse(numpy.array_equal(changed, image))
+
+    def test_decoded_image_cache_length(self):
+        for i in xrange(topographica_based.decoded_images_cache_length + 2):
+            decoded_image(self.image_location, 8.0, 10.0, (-3.0, -3.0, 3.0 + i * 0.1, 3.0))
+        self.assertEqual(len(topographica_based._decoded_images), topographica_based.decoded_images_cache_length)
+        # the least recently used images were dropped
+        self.assertEqual(topographica_based._decoded_images.keys()[0][4], (-3.0, -3.0, 3.2, 3.0))
 
 
 class TestDriftingGratingWithEyeMovement(unittest.TestCase):
@@ -33,7 +214,10 @@ class TestDriftingGratingWithEyeMovement(unittest.TestCase):
 
 
 class TestDriftingSinusoidalGratingDisk(unittest.TestCase):
-    pass
+
+    @unittest.skipUnless(hasattr(imagen, 'Null'), "the frame by frame generation requires imagen.Null")
+    def test_frame_blocks(self):
+        assert_frame_blocks_match_frames(self, DriftingSinusoidalGratingDisk(radius=2.0, **grating_parameters))
 
 
 class TestDriftingSinusoidalGratingCenterSurroundStimulus(unittest.TestCase):
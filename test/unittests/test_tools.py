@@ -0,0 +1,69 @@
+import unittest
+import numpy
+from mozaik.tools.expressions import Expression
+from mozaik.tools.misc import sample_from_bin_distribution, sample_from_bin_distributions
+
+
+class TestExpression(unittest.TestCase):
+
+    def test_evaluation(self):
+        f1 = numpy.random.rand(5)
+        f2 = numpy.random.rand(5)
+        e = Expression('f1*exp(-f2/2) + numpy.maximum(f1, f2)**2 - pi*(f1 > 0.5)')
+        self.assertEqual(e.names, ['f1', 'f2'])
+        numpy.testing.assert_array_equal(e(f1=f1, f2=f2), f1*numpy.exp(-f2/2) + numpy.maximum(f1, f2)**2 - numpy.pi*(f1 > 0.5))
+
+    def test_constant(self):
+        e = Expression('3.5')
+        self.assertEqual(e.names, [])
+        self.assertEqual(e(), 3.5)
+
+    def test_unsafe_expressions(self):
+        for s in ("__import__('os').system('ls')", "f1.__class__", "open('f')", "numpy.load('f')", "lambda: 1",
+                  "[f1 for f1 in f2]", "f1 if f2 else f3", "exp", "f1 and f2", "0 < f1 < 1", "exp(f1, out=f2)"):
+            self.assertRaises(ValueError, Expression, s)
+
+
+class TestSampleFromBinDistribution(unittest.TestCase):
+
+    def setUp(self):
+        self.bins = numpy.random.rand(6, 40)
+        self.bins[:, 3] = 0
+
+    def test_inverse_cdf(self):
+        numpy.random.seed(7)
+        samples = sample_from_bin_distribution(self.bins[0], 1000)
+        numpy.random.seed(7)
+        u = numpy.random.rand(1000)
+        cs = numpy.cumsum(self.bins[0] / numpy.sum(self.bins[0]))
+        numpy.testing.assert_array_equal(samples, [numpy.nonzero(s < cs)[0][0] for s in u])
+        self.assertFalse(numpy.any(samples == 3))
+
+    def test_batched(self):
+        numpy.random.seed(7)
+        samples = sample_from_bin_distributions(self.bins, 100)
+        numpy.random.seed(7)
+        for row, s in zip(self.bins, samples):
+            numpy.testing.assert_array_equal(s, sample_from_bin_distribution(row, 100))
+
+    def test_batched_last_bins_empty(self):
+        # the samples never fall into the empty bins at the end of the rows
+        bins = numpy.random.rand(200, 40)
+        bins[:, 30:] = 0
+        bins[::2, 20:] = 0
+        numpy.random.seed(7)
+        samples = sample_from_bin_distributions(bins, 100)
+        self.assertEqual(samples.shape, (200, 100))
+        self.assertTrue(numpy.all(samples[::2] < 20))
+        self.assertTrue(numpy.all(samples < 30))
+        numpy.random.seed(7)
+        for row, s in zip(bins, samples):
+            numpy.testing.assert_array_equal(s, sample_from_bin_distribution(row, 100))
+
+    def test_batched_empty(self):
+        self.assertEqual(sample_from_bin_distributions(numpy.zeros((0, 40)), 100).shape, (0, 100))
+        self.assertEqual(sample_from_bin_distributions(numpy.zeros((6, 0)), 100).shape, (6, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()